@@ -0,0 +1,54 @@
+"""
+Microbenchmark for saving to and reading from deep dotted names, comparing the
+per-call `save_to_name_list` / `get_via_name_list` walk with the precomputed
+setters and getters the parser builds.
+
+    python bench/dotted_names.py
+"""
+from __future__ import print_function
+import timeit
+
+from take import TakeTemplate
+from take.utils import get_via_name_list, save_to_name_list, make_getter, make_setter
+
+
+NAMES = [('a',), ('a', 'b'), ('a', 'b', 'c', 'd', 'e')]
+
+TMPL = """
+$ li
+    save each                               : items
+        | text ;                                : item.text.value
+        | text ;                                : item.text.copy
+        $ a | 0 [href] ;                        : item.link.href.value
+        $ a | 0 text ;                          : item.link.text.value
+        +                                   : meta.info
+            | [class] ;                             : a.b.c
+            | [class] ;                             : a.b.d
+"""
+
+DOC = '<ul>%s</ul>' % ''.join('<li class="c%d"><a href="/%d">item %d</a></li>' % (i, i, i)
+                              for i in range(2000))
+
+
+def bench_names(number=200000):
+    for name_parts in NAMES:
+        setter = make_setter(name_parts)
+        getter = make_getter(name_parts)
+        dest = {}
+        walk_set = timeit.timeit(lambda: save_to_name_list(dest, name_parts, 1), number=number)
+        fast_set = timeit.timeit(lambda: setter(dest, 1), number=number)
+        walk_get = timeit.timeit(lambda: get_via_name_list(dest, name_parts), number=number)
+        fast_get = timeit.timeit(lambda: getter(dest), number=number)
+        print('%d part name:  set %.3fs -> %.3fs    get %.3fs -> %.3fs' %
+              (len(name_parts), walk_set, fast_set, walk_get, fast_get))
+
+
+def bench_template(number=5):
+    tt = TakeTemplate(TMPL)
+    secs = timeit.timeit(lambda: tt(DOC), number=number) / number
+    print('template with deep names: %.1fms per document' % (secs * 1000))
+
+
+if __name__ == '__main__':
+    bench_names()
+    bench_template()
@@ -0,0 +1,49 @@
+"""
+Compares parsing all of a large page with stopping once the parts the
+template uses are parsed, ``take(..., early=True)``, for a template using
+the ``<head>`` and one using the first match of a selector.
+
+    python bench/early_stop.py [num_paragraphs]
+"""
+from __future__ import print_function
+import sys
+import timeit
+
+from take import TakeTemplate
+
+
+HEAD_TMPL = """
+$ head title | 0 text ;                 : title
+$ head link[rel=canonical] | 0 [href] ; : canonical
+$ head meta
+    save each                           : meta
+        | [name] ;                          : name
+        | [content] ;                       : content
+"""
+
+FIRST_TMPL = """
+$ h1 | 0 text ;                         : heading
+$ .byline | 0
+    $ a | 0 text ;                          : author
+    $ a | 0 [href] ;                        : author_url
+"""
+
+
+def make_page(num_paragraphs):
+    return (u'<html><head><title>Page</title>'
+            u'<link rel="canonical" href="http://example.com/page">'
+            u'<meta name="description" content="a page"></head><body>'
+            u'<h1>Heading</h1><p class="byline">by <a href="/me">me</a></p>%s'
+            u'</body></html>') % (u'<p>some <b>text</b> in a paragraph</p>' * num_paragraphs)
+
+
+if __name__ == '__main__':
+    page = make_page(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+    print('%.1f MB page' % (len(page) / 1e6))
+    for name, src in (('head', HEAD_TMPL), ('first match', FIRST_TMPL)):
+        tt = TakeTemplate(src)
+        assert tt(page, early=True) == tt(page)
+        whole = min(timeit.repeat(lambda: tt(page), number=3, repeat=3)) / 3
+        early = min(timeit.repeat(lambda: tt(page, early=True), number=3, repeat=3)) / 3
+        print('%-12s whole page: %7.1fms  early=True: %6.2fms (%.0fx)' % (
+            name, whole * 1000, early * 1000, whole / early))
@@ -0,0 +1,49 @@
+"""
+Benchmark for a template issuing dozens of ``#id``, ``.class`` and tag
+selectors against a large document, with and without an `ElementIndex`.
+
+    python bench/element_index.py
+"""
+from __future__ import print_function
+import timeit
+
+from take import TakeTemplate
+from take.memo import ElementIndex
+from take.take_template import make_doc
+
+
+SECTIONS = 30
+
+TMPL = '\n'.join(
+    ['$ #s%d | 0 [title] ;     : s%d' % (i, i) for i in range(SECTIONS)] +
+    ['$ .c%d | -1 text ;       : c%d' % (i, i) for i in range(SECTIONS)] +
+    ['$ h2 | 0 text ;          : first_heading',
+     '$ section.even           ',
+     '    save each            : even',
+     '        | [id] ;             : id'])
+
+DOC = '<html><body>%s</body></html>' % ''.join(
+    '<section id="s%d" title="t%d" class="%s"><h2>h%d</h2><ul>%s</ul></section>' % (
+        i, i, 'even' if i % 2 == 0 else 'odd', i,
+        ''.join('<li class="c%d"><a href="/%d/%d">%d</a></li>' % (i, i, j, j) for j in range(100)))
+    for i in range(SECTIONS))
+
+
+def bench(number=10):
+    tt = TakeTemplate(TMPL)
+    doc = make_doc((DOC,), {})
+    index = ElementIndex()
+    assert tt(doc, memo=index) == tt(doc)
+    memo_time = min(timeit.repeat(lambda: tt(doc, memo=True), number=number, repeat=3))
+    index_time = min(timeit.repeat(lambda: tt(doc, index=True), number=number, repeat=3))
+    print('%d selectors on %d elements' % (index.misses + index.walks + index.index_hits,
+                                           len(doc[0].xpath('//*'))))
+    print('memo: %.1fms, index: %.1fms (%.2fx)' % (memo_time * 1000 / number,
+                                                   index_time * 1000 / number,
+                                                   memo_time / index_time))
+    print('index built in %.2fms, saved an estimated %.2fms, paid off: %s' % (
+        index.build_seconds * 1000, index.saved_seconds * 1000, index.paid_off))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,37 @@
+"""
+Benchmark for ``$ <selector> | <index>`` queries on a page with thousands of
+matches, comparing the positional XPath the parser compiles them to with
+collecting all the matches and then indexing them.
+
+    python bench/first_match.py
+"""
+from __future__ import print_function
+import timeit
+
+from take.parser import make_css_query, make_css_index_query, make_index_query
+from take.take_template import make_doc
+
+
+DOC = '<html><body><h1>title</h1><ul>%s</ul></body></html>' % ''.join(
+    '<li><a href="/%d">item %d</a></li>' % (i, i) for i in range(5000))
+
+INDEXES = ('0', '1', '-1', '-2')
+
+
+def bench(selector='li a', number=50):
+    doc = make_doc((DOC,), {})
+    css_query = make_css_query(selector)
+    for index in INDEXES:
+        index_query = make_index_query(index)
+        fused = make_css_index_query(selector, index)
+        assert list(fused(doc)) == list(index_query(css_query(doc)))
+        all_time = min(timeit.repeat(lambda: index_query(css_query(doc)), number=number, repeat=3))
+        fused_time = min(timeit.repeat(lambda: fused(doc), number=number, repeat=3))
+        print('$ %s | %-3s  all matches: %7.3fms  positional XPath: %7.3fms  (%.1fx)' % (
+            selector, index, all_time * 1000 / number, fused_time * 1000 / number,
+            all_time / fused_time))
+
+
+if __name__ == '__main__':
+    bench()
+    bench('h1, li a')
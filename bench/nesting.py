@@ -0,0 +1,63 @@
+"""
+Benchmark for deeply nested templates: parse time by nesting depth, and the
+recursive `ContextNode.do` compared with the explicit stack `execute`.
+
+    python bench/nesting.py
+"""
+from __future__ import print_function
+import sys
+import timeit
+
+from take import TakeTemplate
+from take.parser import parse
+
+
+DOC = '<ul>%s</ul>' % ''.join('<li class="c%d"><a href="/%d">item %d</a></li>' % (i, i, i)
+                              for i in range(500))
+
+# a typical shallow template, to compare the per-frame cost
+FLAT_TMPL = """
+$ li
+    save each                               : items
+        $ a
+            | 0 text ;                          : text
+            | 0 [href] ;                        : url
+        +                                   : meta
+            | [class] ;                         : cls
+"""
+
+
+def nested_tmpl(depth):
+    """Nested namespaces each saving a value, ``depth`` levels deep."""
+    lines = []
+    for i in range(depth):
+        indent = '    ' * i
+        lines.append('%s$ ul | [class] ;  : v' % indent)
+        lines.append('%s+                 : n' % indent)
+    return '\n'.join(lines) + '\n' + '    ' * depth + '$ li | 0 text ;  : last\n'
+
+
+def bench_parse(number=3):
+    for depth in (10, 100, 1000, 5000):
+        src = nested_tmpl(depth)
+        secs = timeit.timeit(lambda: parse(src), number=number) / number
+        print('parse %4d levels: %7.1fms' % (depth, secs * 1000))
+
+
+def bench_execute(number=20):
+    for name, src in (('flat', FLAT_TMPL), ('50 levels', nested_tmpl(50))):
+        recursive = TakeTemplate(src, iterative=False)
+        iterative = TakeTemplate(src, iterative=True)
+        assert recursive(DOC) == iterative(DOC)
+        rec = timeit.timeit(lambda: recursive(DOC), number=number) / number
+        it = timeit.timeit(lambda: iterative(DOC), number=number) / number
+        print('%-10s recursive %.1fms, explicit stack %.1fms' % (name, rec * 1000, it * 1000))
+    depth = sys.getrecursionlimit() * 2
+    tt = TakeTemplate(nested_tmpl(depth))
+    secs = timeit.timeit(lambda: tt(DOC), number=1)
+    print('%d levels (past the recursion limit): %.1fms' % (depth, secs * 1000))
+
+
+if __name__ == '__main__':
+    bench_parse()
+    bench_execute()
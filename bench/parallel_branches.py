@@ -0,0 +1,66 @@
+"""
+Runs a template with independent top-level branches on one large document,
+serially and with ``take(..., parallel=True)``. On builds with the GIL,
+``take()`` runs serially anyway, so the branches are also run in threads
+directly with `take.parallel.run_branches` to show what they would cost.
+
+    python bench/parallel_branches.py [num_items] [threads]
+"""
+from __future__ import print_function
+import sys
+import time
+
+from take import TakeTemplate
+from take.parallel import gil_enabled, split_branches, run_branches
+
+
+TMPL = """
+$ .thing
+    save each                   : titles
+        $ .title | 0 text ;         : title
+        $ .title | 0 [href] ;       : url
+$ .thing
+    save each                   : authors
+        $ .author | 0 text ;        : name
+        $ .author | 0 [href] ;      : url
+namespace: counts
+    $ .comments
+        save each               : comments
+            | text ; shrink ;       : text
+$ .thing .rank
+    save each                   : ranks
+        | text ;                    : rank
+"""
+
+ITEM = ('<div class="thing"><span class="rank">{0}</span>'
+        '<a class="title" href="/item/{0}">title {0}</a>'
+        '<a class="author" href="/user/{0}">user{0}</a>'
+        '<a class="comments">{0} comments</a></div>')
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        rv = fn()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return rv, best
+
+
+if __name__ == '__main__':
+    num_items = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    tt = TakeTemplate(TMPL)
+    html = '<html><body>%s</body></html>' % ''.join(ITEM.format(i) for i in range(num_items))
+    _doc = tt._make_doc((html,), {})
+    branches = split_branches(tt.node)
+    expected, serial = timed(lambda: tt._run(tt.node, _doc))
+    rv, parallel = timed(lambda: tt.take(_doc, parallel=threads))
+    assert rv == expected
+    rv, forced = timed(lambda: run_branches(branches, dict, _doc, lambda: None, threads))
+    assert rv == expected
+    print('GIL enabled: %s, %d branches, %d items' % (gil_enabled(), len(branches), num_items))
+    print('serial:                %.3fs' % serial)
+    print('parallel=%d:            %.3fs (%.2fx)' % (threads, parallel, serial / parallel))
+    print('branches in threads:   %.3fs (%.2fx)' % (forced, serial / forced))
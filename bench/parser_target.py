@@ -0,0 +1,80 @@
+"""
+Compares building the tree of a large page with only receiving lxml's
+parser target callbacks, the least running a template on the parser's
+events costs, and running templates on the tree (``events=False``) and on
+the events (``events=True``, see `take.events`).
+
+    python bench/parser_target.py [num_posts]
+"""
+from __future__ import print_function
+import sys
+import timeit
+
+from lxml import etree
+
+from take import TakeTemplate
+
+
+EACH_TMPL = """
+$ .post
+    save each                           : posts
+        $ a | 0 text ;                      : title
+        $ a | 0 [href] ;                    : url
+        $ p.byline | 0 text ;               : byline
+"""
+
+FIRST_TMPL = """
+$ h1 | 0 text ;                         : heading
+"""
+
+
+class StartEndTarget(object):
+
+    def start(self, tag, attrib):
+        pass
+
+    def end(self, tag):
+        pass
+
+    def close(self):
+        return None
+
+
+class TextTarget(StartEndTarget):
+
+    def data(self, data):
+        pass
+
+
+def make_page(num_posts):
+    return (u'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Posts</title></head>'
+            u'<body><h1>Posts</h1>%s</body></html>') % (
+                u'<div class="post"><h2><a href="/p">A post</a></h2>'
+                u'<p class="byline">by <b>me</b></p><p>some <i>text</i> of the post</p>'
+                u'</div>' * num_posts)
+
+
+def best(func):
+    return min(timeit.repeat(func, number=3, repeat=3)) / 3
+
+
+if __name__ == '__main__':
+    page = make_page(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+    print('%.1f MB page' % (len(page) / 1e6))
+    tree = best(lambda: etree.fromstring(page, etree.HTMLParser()))
+    print('%-28s %7.1fms' % ('tree', tree * 1000))
+    for name, target_type in (('target start/end', StartEndTarget),
+                              ('target start/end/data', TextTarget)):
+        seconds = best(lambda: etree.fromstring(page, etree.HTMLParser(target=target_type())))
+        print('%-28s %7.1fms (%.2fx the tree)' % (name, seconds * 1000, seconds / tree))
+    for name, src in (('save each', EACH_TMPL), ('first match', FIRST_TMPL)):
+        tt = TakeTemplate(src)
+        for events in (False, True):
+            seconds = best(lambda: tt(page, events=events))
+            print('%-28s %7.1fms (%.2fx the tree)' % (
+                'take, %s, %s' % (name, 'events' if events else 'tree'), seconds * 1000,
+                seconds / tree))
+    tt = TakeTemplate(FIRST_TMPL)
+    seconds = best(lambda: tt(page, early=True))
+    print('%-28s %7.1fms (%.2fx the tree)' % ('take, first match, early', seconds * 1000,
+                                            seconds / tree))
@@ -0,0 +1,45 @@
+"""
+Benchmark for the peephole optimizations, comparing a template using the
+common ``| text ; shrink``, ``$ a | [href]`` and ``save each`` sequences with
+and without them.
+
+    python bench/peephole.py
+"""
+from __future__ import print_function
+import timeit
+
+from take import TakeTemplate
+from take.take_template import make_doc
+
+
+TMPL = """
+    $ title | 0 text ; shrink ;         : title
+    $ link | [href] ;                   : canonical
+    $ li
+        save each                       : items
+            | text ; shrink ;               : title
+            $ a | [href] ;                  : url
+    $ li a
+        save each                       : names
+            | text
+                : name
+"""
+
+DOC = ('<html><head><title> the \n title </title><link href="/c"></head><body><ul>%s</ul>'
+       '</body></html>' % ''.join('<li>\n  <a href="/%d">item\n  %d</a>\n</li>' % (i, i)
+                                  for i in range(2000)))
+
+
+def bench(number=10):
+    doc = make_doc((DOC,), {})
+    plain = TakeTemplate(TMPL, peephole=False)
+    fused = TakeTemplate(TMPL)
+    assert plain(doc) == fused(doc)
+    plain_time = min(timeit.repeat(lambda: plain(doc), number=number, repeat=3))
+    fused_time = min(timeit.repeat(lambda: fused(doc), number=number, repeat=3))
+    print('without peephole: %.1fms, with: %.1fms (%.2fx)' % (
+        plain_time * 1000 / number, fused_time * 1000 / number, plain_time / fused_time))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,50 @@
+"""
+Benchmark for pickling compiled templates, ex: to send them to
+`multiprocessing` workers, comparing the pickle's size and round trip time
+with parsing the template's source again.
+
+    python bench/pickle_template.py
+"""
+from __future__ import print_function
+import pickle
+import timeit
+
+from take import TakeTemplate
+
+
+def make_template(sections=100):
+    lines = ['def: link',
+             '    | text ; shrink ;       : text',
+             '    | [href] ;              : url']
+    for i in range(sections):
+        lines += ['$ #s%d | 0 [title] ;         : s%d.title' % (i, i),
+                  '$ #s%d li a' % i,
+                  '    save each               : s%d.links' % i,
+                  '        link',
+                  '            merge               : *',
+                  'namespace: n%d' % i,
+                  '    $ .c%d | -1 text ;          : last' % i,
+                  '    $ .c%d' % i,
+                  '        | 0 own_text ;          : own',
+                  '        `(\\d+)`',
+                  '            rx match',
+                  '                | 1 ;               : number']
+    return '\n'.join(lines)
+
+
+def bench(number=20):
+    src = make_template()
+    tt = TakeTemplate(src)
+    data = pickle.dumps(tt, pickle.HIGHEST_PROTOCOL)
+    assert pickle.loads(data).schema() == tt.schema()
+    parse_time = min(timeit.repeat(lambda: TakeTemplate(src), number=number, repeat=3))
+    pickle_time = min(timeit.repeat(lambda: pickle.loads(pickle.dumps(tt, pickle.HIGHEST_PROTOCOL)),
+                                    number=number, repeat=3))
+    print('%d template lines, %d bytes of source, %d bytes pickled' % (
+        src.count('\n') + 1, len(src), len(data)))
+    print('parse: %.1fms, pickle round trip: %.1fms (%.1fx)' % (
+        parse_time * 1000 / number, pickle_time * 1000 / number, parse_time / pickle_time))
+
+
+if __name__ == '__main__':
+    bench()
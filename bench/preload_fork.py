@@ -0,0 +1,103 @@
+"""
+Measures the memory of forked workers sharing preloaded templates, with and
+without `gc.freeze`. The workers run a full garbage collection, after running
+the templates on a document or not, then report their resident, shared and
+private dirty memory from ``/proc/self/smaps_rollup`` (Linux). Running the
+templates still writes to the pages of the nodes it touches, ex: their
+reference counts, which freezing doesn't prevent.
+
+    python bench/preload_fork.py [num_templates] [num_workers]
+"""
+from __future__ import print_function
+import gc
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from take import preload
+
+
+def make_template(sections=100):
+    lines = ['def: link',
+             '    | text ; shrink ;       : text',
+             '    | [href] ;              : url']
+    for i in range(sections):
+        lines += ['$ #s%d | 0 [title] ;         : s%d.title' % (i, i),
+                  '$ #s%d li a' % i,
+                  '    save each               : s%d.links' % i,
+                  '        link',
+                  '            merge               : *',
+                  'namespace: n%d' % i,
+                  '    $ .c%d | -1 text ;          : last' % i]
+    return '\n'.join(lines)
+
+
+DOC = ('<html><body><ul id="s1" title="one"><li><a href="/a">a</a></li></ul>'
+       '<p class="c1">last</p></body></html>')
+
+
+def memory_kb():
+    """The ``(rss, shared, private dirty)`` of this process, in kB."""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return (fields['Rss'], fields['Shared_Clean'] + fields['Shared_Dirty'],
+            fields['Private_Dirty'])
+
+
+def run_workers(templates, num_workers, run):
+    results = []
+    for _ in range(num_workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            if run:
+                for tmpl in templates.values():
+                    tmpl(DOC)
+            gc.collect()
+            os.write(write_fd, ('%d %d %d' % memory_kb()).encode('ascii'))
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as f:
+            results.append(tuple(int(n) for n in f.read().split()))
+        os.waitpid(pid, 0)
+    return [sum(col) / float(len(col)) for col in zip(*results)]
+
+
+def measure(freeze_gc, num_templates, num_workers):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        src = make_template()
+        paths = []
+        for i in range(num_templates):
+            path = os.path.join(tmp_dir, 't%d.take' % i)
+            with open(path, 'w') as f:
+                f.write(src)
+            paths.append(path)
+        templates = preload(paths, freeze_gc=freeze_gc)
+        for run in (False, True):
+            rss, shared, private = run_workers(templates, num_workers, run)
+            print('%-9s %-13s rss: %7.0f kB  shared: %7.0f kB  private dirty: %7.0f kB' % (
+                'freeze' if freeze_gc else 'no freeze', 'run + collect' if run else 'collect',
+                rss, shared, private))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3:
+        # a fresh process for each mode, so the first doesn't affect the second
+        measure(sys.argv[3] == 'freeze', int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        if not hasattr(gc, 'freeze'):
+            sys.exit('gc.freeze needs Python 3.7 or later')
+        num_templates = sys.argv[1] if len(sys.argv) > 1 else '40'
+        num_workers = sys.argv[2] if len(sys.argv) > 2 else '4'
+        for mode in ('plain', 'freeze'):
+            subprocess.check_call([sys.executable, __file__, num_templates, num_workers, mode])
@@ -0,0 +1,55 @@
+"""
+Compares the memory held by the results of a ``save each`` heavy template when
+saving to plain dicts vs. generated ``__slots__`` records.
+
+    python bench/records_memory.py [num_items]
+"""
+from __future__ import print_function
+import sys
+import tracemalloc
+
+from take import TakeTemplate
+
+
+TMPL = """
+$ .thing
+    save each                   : entries
+        $ .rank | 0 text ;          : rank
+        $ .title | 0 text ;         : title
+        $ .title | 0 [href] ;       : url
+        $ .author | 0 text ;        : author.login
+        $ .author | 0 [href] ;      : author.url
+        $ .comments | 0 text ;      : num_comments
+"""
+
+ITEM = ('<div class="thing"><span class="rank">{0}</span>'
+        '<a class="title" href="/item/{0}">title {0}</a>'
+        '<a class="author" href="/user/{0}">user{0}</a>'
+        '<a class="comments">{0} comments</a></div>')
+
+
+def make_doc(num_items):
+    return '<html><body>%s</body></html>' % ''.join(ITEM.format(i) for i in range(num_items))
+
+
+def measure(tt, doc):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    data = tt(doc)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # only count what is still referenced by the results
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return data, size
+
+
+if __name__ == '__main__':
+    num_items = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    doc = make_doc(num_items)
+    data, dict_size = measure(TakeTemplate(TMPL), doc)
+    records, records_size = measure(TakeTemplate(TMPL, records=True), doc)
+    assert records.to_dict() == data
+    print('items:         %d' % num_items)
+    print('dict results:  %.2f MiB' % (dict_size / 1024.0 / 1024))
+    print('records:       %.2f MiB (%.0f%%)' % (records_size / 1024.0 / 1024,
+                                             100.0 * records_size / dict_size))
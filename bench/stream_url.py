@@ -0,0 +1,83 @@
+"""
+Compares downloading a whole response before parsing it, as
+``take(url=...)`` does, with `take.stream.parse_url`, which parses the
+chunks as they arrive, against a local server sending a large document in
+throttled chunks. Both use urllib, the time is until the tree is parsed.
+
+    python bench/stream_url.py [num_items] [ms_per_chunk]
+"""
+from __future__ import print_function
+import multiprocessing
+import sys
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import lxml.html
+
+from take.stream import parse_url, urlopen
+
+
+ITEM = ('<div class="thing"><a class="title" href="/item/{0}">title {0}</a>'
+        '<p>some text to parse some text to parse some text to parse</p></div>')
+
+CHUNK = 1 << 14
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    body = b''
+    delay = 0.0
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for start in range(0, len(self.body), CHUNK):
+            part = self.body[start:start + CHUNK]
+            self.wfile.write(('%x\r\n' % len(part)).encode('ascii') + part + b'\r\n')
+            self.wfile.flush()
+            time.sleep(self.delay)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(httpd, body, delay):
+    Handler.body = body
+    Handler.delay = delay
+    httpd.serve_forever()
+
+
+def timed(fn):
+    start = time.time()
+    rv = fn()
+    return rv, time.time() - start
+
+
+if __name__ == '__main__':
+    num_items = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 2.0) / 1000
+    body = ('<html><body>%s</body></html>' % ''.join(
+        ITEM.format(i) for i in range(num_items))).encode('utf-8')
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    # in another process, so the server doesn't compete for the GIL
+    server = multiprocessing.Process(target=serve, args=(httpd, body, delay))
+    server.daemon = True
+    server.start()
+    url = 'http://127.0.0.1:%d/' % httpd.server_address[1]
+    try:
+        whole_tree, whole = timed(lambda: lxml.html.fromstring(urlopen(url).read()))
+        roots, streamed = timed(lambda: parse_url(url))
+        assert len(roots[0].findall('.//a')) == len(whole_tree.findall('.//a')) == num_items
+    finally:
+        server.terminate()
+    print('%d bytes in %d chunks, %.1fms between chunks' % (
+        len(body), -(-len(body) // CHUNK), delay * 1000))
+    print('download, then parse:  %.3fs' % whole)
+    print('parse while streaming: %.3fs (%.2fx)' % (streamed, whole / streamed))
@@ -0,0 +1,78 @@
+"""
+Compares running a template on a batch of documents sequentially, with
+`TakeTemplate.take_many` in threads, and in processes, for 1 to the number
+of cores. Threads overlap parsing, which lxml does without the GIL, with
+running the template; processes pay for pickling documents and results.
+
+    python bench/take_many.py [num_docs]
+"""
+from __future__ import print_function
+import multiprocessing
+import sys
+import time
+
+from take import TakeTemplate
+
+
+# a few fields from large pages, where parsing is most of the time
+TMPL = """
+$ h1 | 0 text ;                 : title
+$ .thing | 0
+    $ .title | 0 text ;             : first.title
+    $ .title | 0 [href] ;           : first.url
+$ .author | -1 [href] ;         : last_author
+"""
+
+ITEM = ('<div class="thing"><a class="title" href="/item/{0}">title {0}</a>'
+        '<p>{1}</p><a class="author" href="/user/{0}">user{0}</a></div>')
+
+
+def make_doc(num_items=300):
+    text = 'some text to parse ' * 20
+    return '<html><body><h1>items</h1>%s</body></html>' % ''.join(ITEM.format(i, text)
+                                                    for i in range(num_items))
+
+
+_template = None
+
+
+def _init(tmpl):
+    global _template
+    _template = tmpl
+
+
+def _take(doc):
+    return _template(doc)
+
+
+def timed(fn):
+    start = time.time()
+    fn()
+    return time.time() - start
+
+
+def bench(num_docs):
+    tt = TakeTemplate(TMPL)
+    docs = [make_doc()] * num_docs
+    expected = [tt(doc) for doc in docs]
+    assert tt.take_many(docs, threads=2) == expected
+    seq = timed(lambda: [tt(doc) for doc in docs])
+    print('%d documents' % num_docs)
+    print('sequential:     %7.1f docs/s' % (num_docs / seq))
+    cores = multiprocessing.cpu_count()
+    counts = sorted(set([1, 2, 4, 8, cores]))
+    for n in [n for n in counts if n <= max(cores, 2)]:
+        thread_time = timed(lambda: tt.take_many(docs, threads=n))
+        pool = multiprocessing.Pool(n, _init, (tt,))
+        try:
+            process_time = timed(lambda: pool.map(_take, docs, chunksize=4))
+        finally:
+            pool.close()
+            pool.join()
+        print('%2d threads:     %7.1f docs/s (%.2fx)   %2d processes: %7.1f docs/s (%.2fx)' % (
+            n, num_docs / thread_time, seq / thread_time,
+            n, num_docs / process_time, seq / process_time))
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,49 @@
+"""
+Benchmark for running several templates against the same document, comparing
+one `take()` call per template with a `TemplateSet`.
+
+    python bench/template_set.py
+"""
+from __future__ import print_function
+import timeit
+
+from take import TakeTemplate, TemplateSet
+
+
+TEMPLATES = {
+    'listing': """
+        $ li
+            save each                   : items
+                $ a | 0 text ;              : title
+                $ a | 0 [href] ;            : url
+    """,
+    'links': """
+        $ li a
+            save each                   : links
+                | [href] ;                  : url
+    """,
+    'meta': """
+        $ title | 0 text ;              : title
+        $ li | 0
+            $ a | 0 text ;              : first
+    """,
+}
+
+DOC = '<html><head><title>t</title></head><body><ul>%s</ul></body></html>' % ''.join(
+    '<li class="c%d"><a href="/%d">item %d</a></li>' % (i, i, i) for i in range(2000))
+
+
+def bench(number=5):
+    templates = dict((name, TakeTemplate(src)) for name, src in TEMPLATES.items())
+    tset = TemplateSet(templates, base_url='http://example.com')
+    assert tset(DOC) == dict((name, tt(DOC, base_url='http://example.com'))
+                             for name, tt in templates.items())
+    each = timeit.timeit(lambda: [tt(DOC, base_url='http://example.com')
+                                  for tt in templates.values()], number=number) / number
+    shared = timeit.timeit(lambda: tset(DOC), number=number) / number
+    print('%d templates: %.1fms separately, %.1fms as a TemplateSet' %
+          (len(templates), each * 1000, shared * 1000))
+
+
+if __name__ == '__main__':
+    bench()
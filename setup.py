@@ -68,5 +68,10 @@ setup(
         "lxml==3.4.2",
         "pyquery==1.2.9"
     ],
-    include_package_data=True
+    include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'take = take.cli:main',
+        ],
+    }
 )
@@ -2,3 +2,5 @@
 __version__ = '0.2.0'
 # main entry point
 from .take_template import TakeTemplate
+from .template_set import TemplateSet
+from .preload import preload
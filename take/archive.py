@@ -0,0 +1,98 @@
+"""
+Reading documents from large files of concatenated documents. The file is
+memory-mapped and each document's bytes are handed to lxml's parser as a
+slice of the mapping, without reading the file into Python strings.
+
+A splitter is a callable which takes the mapped file and yields the
+``(start, end)`` offsets of each document.
+"""
+import mmap
+import os
+import re
+
+from lxml import etree
+
+from .early import iter_slices, parse_region
+
+
+# for versions of lxml which only parse bytes, documents are fed in chunks this big
+_CHUNK_SIZE = 1 << 16
+
+_HTML_END_RX = re.compile(br'</html\s*>', re.IGNORECASE)
+_NON_WS_RX = re.compile(br'\S')
+
+
+def split_html(buf):
+    """Splits after each ``</html>`` end tag."""
+    start = 0
+    for m in _HTML_END_RX.finditer(buf):
+        yield start, m.end()
+        start = m.end()
+    if _NON_WS_RX.search(buf, start):
+        yield start, len(buf)
+
+
+def split_on(separator):
+    """Makes a splitter for documents separated by the ``separator`` bytes."""
+    def splitter(buf):
+        start = 0
+        while True:
+            end = buf.find(separator, start)
+            if end < 0:
+                break
+            yield start, end
+            start = end + len(separator)
+        if start < len(buf):
+            yield start, len(buf)
+    return splitter
+
+
+def _release(view):
+    # memoryviews can't be released in python 2, nor do they need to be to close the mmap
+    release = getattr(view, 'release', None)
+    if release:
+        release()
+
+
+def _parse(view, parser):
+    try:
+        return etree.fromstring(view, parser)
+    except TypeError:
+        # this lxml can't parse from buffers
+        for offset in range(0, len(view), _CHUNK_SIZE):
+            parser.feed(view[offset:offset + _CHUNK_SIZE].tobytes())
+        return parser.close()
+
+
+def iter_documents(path, splitter=split_html, region=None):
+    """
+    Yields the parsed root element of each document in the file at ``path``,
+    skipping empty documents. With a ``region`` (see `take.early`), each
+    document is only parsed until the region is.
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            # empty files can't be mapped
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        view = memoryview(buf)
+        try:
+            for start, end in splitter(buf):
+                if not _NON_WS_RX.search(buf, start, end):
+                    continue
+                doc_view = view[start:end]
+                try:
+                    if region is not None:
+                        roots = parse_region(iter_slices(doc_view), region)[0]
+                        root = roots[0] if roots else None
+                    else:
+                        root = _parse(doc_view, etree.HTMLParser())
+                finally:
+                    _release(doc_view)
+                if root is not None:
+                    yield root
+        finally:
+            _release(view)
+    finally:
+        buf.close()
@@ -0,0 +1,260 @@
+"""
+The ``take`` command line tool.
+
+    take extract TEMPLATE [FILE, URL or - for a WARC stream on stdin]...
+
+Writes the results for each document to stdout as JSON Lines.
+
+    take regress TEMPLATE DOCS_DIR [--previous OLD.json] [--output NEW.json]
+
+Runs the template on every document in ``DOCS_DIR`` and reports the
+documents whose results differ from a previous run, with timings.
+
+Also available as ``python -m take``.
+"""
+from __future__ import print_function
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from .corpus import DocCache, iter_documents, iter_warc, to_jsonable
+from .take_template import TakeTemplate
+
+
+# set in each worker process by `_init_worker`
+_worker = {}
+
+
+def _init_worker(template, cache_dir, base_url):
+    # the template is parsed once and pickled to the workers
+    _worker['template'] = template
+    _worker['cache'] = DocCache(cache_dir) if cache_dir else None
+    _worker['base_url'] = base_url
+
+
+def _run_doc(path):
+    """Returns ``(path, result, seconds, error)`` for one document."""
+    start = time.time()
+    try:
+        cache = _worker['cache']
+        if cache is not None:
+            doc = cache.load(path)
+        else:
+            with open(path, 'rb') as f:
+                doc = f.read()
+        result = _worker['template'].take(doc, base_url=_worker['base_url'])
+        return path, to_jsonable(result), time.time() - start, None
+    except Exception as e:
+        return path, None, time.time() - start, '%s: %s' % (type(e).__name__, e)
+
+
+def _extract(item):
+    """Returns the JSON Lines object for an ``(name, kind, value)`` input."""
+    name, kind, value = item
+    try:
+        tmpl = _worker['template']
+        base_url = _worker['base_url']
+        if kind == 'url':
+            result = tmpl.take(url=value, base_url=base_url)
+        elif kind == 'path':
+            with open(value, 'rb') as f:
+                result = tmpl.take(f.read(), base_url=base_url)
+        else:
+            result = tmpl.take(value, base_url=base_url or name)
+        return {'source': name, 'result': to_jsonable(result)}
+    except Exception as e:
+        return {'source': name, 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _inputs(sources, stdin):
+    for source in sources:
+        if source == '-':
+            for uri, body in iter_warc(stdin):
+                yield uri, 'html', body
+        elif source.startswith(('http://', 'https://')):
+            yield source, 'url', source
+        else:
+            yield source, 'path', source
+
+
+def extract(args, out=None, stdin=None, err=None):
+    out = out or sys.stdout
+    err = err or sys.stderr
+    if stdin is None:
+        stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    init_args = (TakeTemplate.from_file(args.template), None, args.base_url)
+    jobs = args.jobs or multiprocessing.cpu_count()
+    pool = None
+    if jobs == 1:
+        _init_worker(*init_args)
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, init_args)
+    count = errors = 0
+    start = last_report = time.time()
+    try:
+        # inputs are read a batch at a time so memory doesn't grow with the input
+        for batch in _batches(_inputs(args.inputs, stdin), jobs * args.batch_size):
+            rows = pool.imap(_extract, batch) if pool else (_extract(item) for item in batch)
+            for row in rows:
+                out.write(json.dumps(row, sort_keys=True) + '\n')
+                count += 1
+                errors += 'error' in row
+            out.flush()
+            now = time.time()
+            if not args.quiet and now - last_report >= args.progress_interval:
+                last_report = now
+                print('%d documents, %.1f/s' % (count, count / (now - start)), file=err)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    elapsed = time.time() - start
+    if not args.quiet:
+        print('%d documents in %.2fs, %.1f/s, %d errors' %
+              (count, elapsed, count / elapsed if elapsed else 0, errors), file=err)
+    return 1 if errors else 0
+
+
+def map_documents(paths, template_path, jobs=None, cache_dir=None, base_url=None):
+    """
+    Yields ``(path, result, seconds, error)`` for each document, in the order
+    they finish, using ``jobs`` processes (all the cores by default).
+    """
+    init_args = (TakeTemplate.from_file(template_path), cache_dir, base_url)
+    if jobs == 1:
+        _init_worker(*init_args)
+        for path in paths:
+            yield _run_doc(path)
+        return
+    pool = multiprocessing.Pool(jobs, _init_worker, init_args)
+    try:
+        for item in pool.imap_unordered(_run_doc, paths, chunksize=8):
+            yield item
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def diff_results(previous, current):
+    """Returns the ``(key, previous, current)`` of the top-level keys which differ."""
+    keys = sorted(set(previous) | set(current))
+    return [(key, previous.get(key), current.get(key)) for key in keys
+            if previous.get(key) != current.get(key)]
+
+
+def _short(value, width=60):
+    text = json.dumps(value, sort_keys=True)
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+
+def regress(args, out=None):
+    out = out or sys.stdout
+    template_path = args.template
+    paths = list(iter_documents(args.docs_dir))
+    previous = None
+    if args.previous:
+        with open(args.previous) as f:
+            previous = json.load(f)
+    cache_dir = None if args.no_cache else args.cache_dir
+    results = {}
+    timings = {}
+    errors = {}
+    changed = 0
+    start = time.time()
+    for path, result, seconds, error in map_documents(paths, template_path, args.jobs,
+                                                      cache_dir, args.base_url):
+        name = os.path.relpath(path, args.docs_dir)
+        timings[name] = seconds
+        if error:
+            errors[name] = error
+            print('ERROR    %s  %s' % (name, error), file=out)
+            continue
+        results[name] = result
+        if previous is None:
+            continue
+        if name not in previous:
+            changed += 1
+            print('NEW      %s  (%.1fms)' % (name, seconds * 1000), file=out)
+            continue
+        diffs = diff_results(previous[name], result)
+        if diffs:
+            changed += 1
+            print('CHANGED  %s  (%.1fms)' % (name, seconds * 1000), file=out)
+            for key, old, new in diffs:
+                print('    %s: %s -> %s' % (key, _short(old), _short(new)), file=out)
+    if previous is not None:
+        for name in sorted(set(previous) - set(results) - set(errors)):
+            changed += 1
+            print('MISSING  %s' % name, file=out)
+    elapsed = time.time() - start
+    if args.timings:
+        for name, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+            print('%9.1fms  %s' % (seconds * 1000, name), file=out)
+    print('%d documents in %.2fs, %d changed, %d errors' %
+          (len(paths), elapsed, changed, len(errors)), file=out)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, sort_keys=True, indent=1)
+    return 1 if changed or errors else 0
+
+
+def make_arg_parser():
+    parser = argparse.ArgumentParser(prog='take', description='Runs take templates.')
+    commands = parser.add_subparsers(dest='command')
+    cmd = commands.add_parser('extract', help='Write the results for each document as JSON '
+                                              'Lines.')
+    cmd.add_argument('template', help='the .take template file')
+    cmd.add_argument('inputs', nargs='+',
+                     help='files, URLs or - to read a WARC stream from stdin')
+    cmd.add_argument('-j', '--jobs', type=int, default=None,
+                     help='number of processes, defaults to the number of cores')
+    cmd.add_argument('--batch-size', type=int, default=16,
+                     help='documents read ahead per process (default: 16)')
+    cmd.add_argument('--base-url', help='make the links in the documents absolute')
+    cmd.add_argument('--progress-interval', type=float, default=5.0,
+                     help='seconds between progress reports on stderr (default: 5)')
+    cmd.add_argument('-q', '--quiet', action='store_true', help="don't report progress")
+    cmd.set_defaults(func=extract)
+    cmd = commands.add_parser('regress', help='Compare the results on a directory of '
+                                              'documents with a previous run.')
+    cmd.add_argument('template', help='the .take template file')
+    cmd.add_argument('docs_dir', help='the directory of saved documents')
+    cmd.add_argument('-p', '--previous', help='results of a previous run to compare with')
+    cmd.add_argument('-o', '--output', help='file to save the results to, as JSON')
+    cmd.add_argument('-j', '--jobs', type=int, default=None,
+                     help='number of processes, defaults to the number of cores')
+    cmd.add_argument('--cache-dir', default='.take-cache',
+                     help='directory to cache parsed documents in (default: .take-cache)')
+    cmd.add_argument('--no-cache', action='store_true', help="don't cache parsed documents")
+    cmd.add_argument('--base-url', help='make the links in the documents absolute')
+    cmd.add_argument('-t', '--timings', action='store_true',
+                     help='print the time for each document, slowest first')
+    cmd.set_defaults(func=regress)
+    return parser
+
+
+def main(argv=None):
+    parser = make_arg_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Helpers for running templates over a corpus of saved documents: a cache of
+parsed documents, a reader for WARC archives and the conversion of results
+to JSON.
+"""
+import hashlib
+import os
+
+from lxml import etree
+from pyquery import PyQuery
+
+from ._compat import string_types
+
+
+DOC_EXTENSIONS = ('.html', '.htm', '.xhtml', '.xml')
+
+
+def iter_documents(path, extensions=DOC_EXTENSIONS):
+    """
+    Yields the paths of the documents in the directory ``path``, sorted.
+    Hidden directories, ex: the default cache directory, are skipped.
+    """
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                yield os.path.join(dirpath, filename)
+
+
+class DocCache(object):
+    """
+    Caches parsed documents in ``cache_dir`` between runs. A parsed document
+    is saved as the XML serialization of its tree, which loads with the XML
+    parser instead of the slower, error-recovering HTML parser. Entries are
+    keyed by the document's path, size and modification time.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._parser = etree.XMLParser(huge_tree=True)
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # exists, possibly made by another worker
+            pass
+
+    def _cache_path(self, path):
+        stat = os.stat(path)
+        key = '%s:%d:%r' % (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.tree')
+
+    def load(self, path):
+        """Returns the `PyQuery` document for ``path``, from the cache when possible."""
+        cache_path = self._cache_path(path)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                return PyQuery(etree.fromstring(f.read(), self._parser))
+        with open(path, 'rb') as f:
+            doc = PyQuery(f.read())
+        self._save(doc, cache_path)
+        return doc
+
+    def _save(self, doc, cache_path):
+        if len(doc) != 1:
+            return
+        data = etree.tostring(doc[0])
+        # the HTML parser keeps xmlns as an attribute, which the XML parser would
+        # turn into namespaced tags the selectors don't match
+        if b'xmlns' in data:
+            return
+        try:
+            etree.fromstring(data, self._parser)
+        except etree.XMLSyntaxError:
+            # ex: prefixed tag names from the HTML
+            return
+        tmp_path = cache_path + '.%d.tmp' % os.getpid()
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, cache_path)
+
+
+def to_jsonable(value):
+    """Converts a template's result to values `json` can serialize."""
+    if isinstance(value, string_types) or value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, PyQuery):
+        return [etree.tostring(elm, encoding='unicode', with_tail=False)
+                if not isinstance(elm, string_types) else elm
+                for elm in value]
+    if isinstance(value, etree._Element):
+        return etree.tostring(value, encoding='unicode', with_tail=False)
+    if hasattr(value, 'items'):
+        return dict((key, to_jsonable(sub)) for key, sub in value.items())
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(sub) for sub in value]
+    return str(value)
+
+
+def _read_headers(fobj):
+    """Reads ``Name: value`` lines up to a blank line, `None` at EOF."""
+    headers = {}
+    line = fobj.readline()
+    # skip the blank lines between records
+    while line in (b'\r\n', b'\n'):
+        line = fobj.readline()
+    if not line:
+        return None
+    while line and line not in (b'\r\n', b'\n'):
+        name, _, value = line.partition(b':')
+        headers[name.strip().lower()] = value.strip()
+        line = fobj.readline()
+    return headers
+
+
+def iter_warc(fobj):
+    """
+    Yields the ``(uri, body)`` of the ``response`` and ``resource`` records in
+    a WARC stream, read one record at a time. The HTTP headers are removed
+    from responses, and responses which are not HTML are skipped.
+    """
+    while True:
+        headers = _read_headers(fobj)
+        if headers is None:
+            return
+        length = int(headers.get(b'content-length', 0))
+        body = fobj.read(length)
+        record_type = headers.get(b'warc-type', b'')
+        uri = headers.get(b'warc-target-uri', b'').decode('utf-8', 'replace')
+        if record_type == b'response':
+            http_headers, _, body = body.partition(b'\r\n\r\n')
+            content_type = [line for line in http_headers.lower().split(b'\r\n')
+                            if line.startswith(b'content-type:')]
+            if content_type and b'html' not in content_type[0]:
+                continue
+        elif record_type != b'resource':
+            continue
+        yield uri, body
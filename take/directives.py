@@ -4,16 +4,34 @@ import re
 from ._compat import string_types
 from .exceptions import UnexpectedTokenError, TakeSyntaxError
 from .scanner import TokenType
-from .utils import split_name, get_via_name_list, save_to_name_list
+from .utils import split_name, make_getter, make_setter, new_scope
 
 
 _WS = re.compile(r'\s+')
 
 
-class _SaveNode(namedtuple('_SaveNode', 'ident_parts')):
+def _do_steps(self, context):
+    """
+    The `do` of nodes with sub-contexts, runs the ``(sub_ctx_node, rv, value)``
+    from the node's `steps` generator recursively (see `take.parser.execute`).
+    """
+    memo = context.memo
+    for sub_ctx_node, rv, value in self.steps(context):
+        sub_ctx_node.do(None, rv, value, value, memo)
+
+
+class _SaveNode(namedtuple('_SaveNode', 'ident_parts setter')):
     __slots__ = ()
     def do(self, context):
-        save_to_name_list(context.rv, self.ident_parts, context.value)
+        self.setter(context.rv, context.value)
+
+    def __reduce__(self):
+        # the setter is made again from the name when unpickled
+        return _save_node, (self.ident_parts,)
+
+
+def _save_node(ident_parts):
+    return _SaveNode(ident_parts, make_setter(ident_parts))
 
 
 def make_save(parser):
@@ -25,18 +43,61 @@ def make_save(parser):
     # expecting only have one parameter
     if tok.type_ != TokenType.DirectiveStatementEnd:
         raise UnexpectedTokenError(tok.type_, TokenType.DirectiveStatementEnd, token=tok)
-    return None, _SaveNode(save_id_parts)
+    return None, _save_node(save_id_parts)
+
+
+class _SaveEachNode(namedtuple('_SaveEachNode', 'ident_parts sub_ctx_node rv_type setter')):
+    __slots__ = ()
+    do = _do_steps
+
+    def __reduce__(self):
+        return _save_each_node, (self.__class__, self.ident_parts, self.sub_ctx_node,
+                                 self.rv_type)
+
+    def steps(self, context):
+        results = []
+        self.setter(context.rv, results)
+        rv_type = self.rv_type
+        for item in context.value:
+            rv = rv_type()
+            results.append(rv)
+            yield self.sub_ctx_node, rv, item
 
 
-class _SaveEachNode(namedtuple('_SaveEachNode', 'ident_parts sub_ctx_node')):
+class _SaveEachValueNode(_SaveEachNode):
+    """
+    A ``save each`` whose sub-context is one query and the saves of its value,
+    ex: ``save each: items ; | text ; : title``, made by `take.peephole`. Runs
+    the query and saves for each item without running a sub-context.
+    """
     __slots__ = ()
+
     def do(self, context):
+        nodes = self.sub_ctx_node.nodes
+        if len(nodes) != 2:
+            # ex: the saves were pruned for `take(..., only=[...])`
+            return _do_steps(self, context)
+        queries = nodes[0].queries
+        setters = [save.setter for save in nodes[1].nodes]
+        memo = context.memo
         results = []
-        save_to_name_list(context.rv, self.ident_parts, results)
+        self.setter(context.rv, results)
+        rv_type = self.rv_type
         for item in context.value:
-            rv = {}
+            rv = rv_type()
             results.append(rv)
-            self.sub_ctx_node.do(None, rv, item, item)
+            if memo is None:
+                for query in queries:
+                    item = query(item)
+            else:
+                for query in queries:
+                    item = memo.query(query, item)
+            for setter in setters:
+                setter(rv, item)
+
+
+def _save_each_node(cls, ident_parts, sub_ctx_node, rv_type):
+    return cls(ident_parts, sub_ctx_node, rv_type, make_setter(ident_parts))
 
 
 def make_save_each(parser):
@@ -56,21 +117,29 @@ def make_save_each(parser):
         raise TakeSyntaxError('Invalid depth, expecting to start a "save each" context.',
                               extra=tok)
     #  parse the sub-context SaveEachNode will manage
-    sub_ctx = parser.spawn_context_parser()
-    sub_ctx_node, tok = sub_ctx.parse()
-    sub_ctx.destroy()
-    return tok, _SaveEachNode(save_id_parts, sub_ctx_node)
+    return parser.parse_sub_context(
+        lambda sub_ctx_node: _save_each_node(_SaveEachNode, save_id_parts, sub_ctx_node, dict))
 
 
-class _NamespaceNode(namedtuple('_NamespaceNode', 'ident_parts sub_ctx_node')):
+class _NamespaceNode(namedtuple('_NamespaceNode', 'ident_parts sub_ctx_node getter setter')):
     __slots__ = ()
-    def do(self, context):
+    do = _do_steps
+
+    def __reduce__(self):
+        return _namespace_node, (self.ident_parts, self.sub_ctx_node)
+
+    def steps(self, context):
         # re-use the namespace if it was already defined ealier in the doc
-        sub_rv = get_via_name_list(context.rv, self.ident_parts)
+        sub_rv = self.getter(context.rv)
         if not sub_rv:
-            sub_rv = {}
-            save_to_name_list(context.rv, self.ident_parts, sub_rv)
-        self.sub_ctx_node.do(None, sub_rv, context.value, context.value)
+            sub_rv = new_scope(context.rv, self.ident_parts)
+            self.setter(context.rv, sub_rv)
+        yield self.sub_ctx_node, sub_rv, context.value
+
+
+def _namespace_node(ident_parts, sub_ctx_node):
+    return _NamespaceNode(ident_parts, sub_ctx_node, make_getter(ident_parts),
+                          make_setter(ident_parts))
 
 
 def make_namespace(parser):
@@ -90,17 +159,17 @@ def make_namespace(parser):
         raise TakeSyntaxError('Invalid depth, expecting to start a "namespace" context.',
                               extra=tok)
     #  parse the sub-context _NamespaceNode will manage
-    sub_ctx = parser.spawn_context_parser()
-    sub_ctx_node, tok = sub_ctx.parse()
-    sub_ctx.destroy()
-    return tok, _NamespaceNode(save_id_parts, sub_ctx_node)
+    return parser.parse_sub_context(
+        lambda sub_ctx_node: _namespace_node(save_id_parts, sub_ctx_node))
 
 
-class _DefSubroutine(namedtuple('_DefSubroutine', 'sub_ctx_node')):
+class _DefSubroutine(namedtuple('_DefSubroutine', 'sub_ctx_node rv_type')):
     __slots__ = ()
-    def do(self, context):
-        rv = {}
-        self.sub_ctx_node.do(None, rv, context.value, context.value)
+    do = _do_steps
+
+    def steps(self, context):
+        rv = self.rv_type()
+        yield self.sub_ctx_node, rv, context.value
         context.last_value = rv
 
 
@@ -124,15 +193,12 @@ def make_def_subroutine(parser):
         raise TakeSyntaxError('Invalid depth, expecting to start a "def" subroutine context.',
                               extra=tok)
     #  parse the sub-context _DefSubroutine will manage
-    sub_ctx = parser.spawn_context_parser()
-    sub_ctx_node, tok = sub_ctx.parse()
-    sub_ctx.destroy()
-    subroutine = _DefSubroutine(sub_ctx_node)
-    parser.defs[def_name] = subroutine
-    return tok, None
+    def add_subroutine(sub_ctx_node):
+        parser.defs[def_name] = _DefSubroutine(sub_ctx_node, dict)
+    return parser.parse_sub_context(add_subroutine)
 
 
-class _MergeNode(namedtuple('_MergeNode', 'names_to_save save_all')):
+class _MergeNode(namedtuple('_MergeNode', 'names_to_save save_all accessors')):
     __slots__ = ()
     def do(self, context):
         if self.save_all:
@@ -141,9 +207,19 @@ class _MergeNode(namedtuple('_MergeNode', 'names_to_save save_all')):
         else:
             src = context.value
             dest = context.rv
-            for name_parts in self.names_to_save:
-                val = get_via_name_list(src, name_parts)
-                save_to_name_list(dest, name_parts, val)
+            for getter, setter in self.accessors:
+                setter(dest, getter(src))
+
+    def __reduce__(self):
+        return _merge_node, (self.names_to_save, self.save_all)
+
+
+def _merge_node(names_to_save, save_all):
+    accessors = None
+    if not save_all:
+        accessors = tuple((make_getter(name_parts), make_setter(name_parts))
+                          for name_parts in names_to_save)
+    return _MergeNode(names_to_save, save_all, accessors)
 
 
 def make_merge(parser):
@@ -161,23 +237,25 @@ def make_merge(parser):
     if tok.type_ != TokenType.DirectiveStatementEnd:
         raise UnexpectedTokenError(tok.type_, TokenType.DirectiveStatementEnd, token=tok)
     if names_to_save == [('*',)]:
-        all = True
-        names_to_save = None
+        return None, _merge_node(None, True)
+    return None, _merge_node(tuple(names_to_save), False)
+
+
+def shrink_query(val):
+    if not isinstance(val, string_types):
+        tx = val.text()
     else:
-        all = False
-        names_to_save = tuple(names_to_save)
-    return None, _MergeNode(names_to_save, all)
+        tx = val
+    return _WS.sub(' ', tx.strip())
 
 
 class _ShrinkNode(object):
     __slots__ = ()
     def do(self, context):
-        val = context.value
-        if not isinstance(val, string_types):
-            tx = val.text()
-        else:
-            tx = val
-        context.last_value = _WS.sub(' ', tx.strip())
+        context.last_value = shrink_query(context.value)
+
+    def __reduce__(self):
+        return _ShrinkNode, ()
 
 
 def make_shrink(parser):
@@ -204,9 +282,11 @@ def make_set_accessor_context(parser):
 
 class _CustomAccessor(namedtuple('_CustomAccessor', 'sub_ctx_node')):
     __slots__ = ()
-    def do(self, context):
+    do = _do_steps
+
+    def steps(self, context):
         rv = {}
-        self.sub_ctx_node.do(None, rv, context.value, context.value)
+        yield self.sub_ctx_node, rv, context.value
         context.last_value = rv.get('__last_value__', context.last_value)
 
 
@@ -229,24 +309,23 @@ def make_custom_accessor(parser):
     if tok.end <= parser.depth:
         raise TakeSyntaxError('Invalid depth, expecting to start a "def" subroutine context.',
                               extra=tok)
-    #  parse the sub-context _DefSubroutine will manage
-    sub_ctx = parser.spawn_context_parser()
-    sub_ctx_node, tok = sub_ctx.parse()
-    sub_ctx.destroy()
-    subroutine = _CustomAccessor(sub_ctx_node)
-    parser.defs[accessor_name] = subroutine
-    return tok, None
+    #  parse the sub-context _CustomAccessor will manage
+    def add_accessor(sub_ctx_node):
+        parser.defs[accessor_name] = _CustomAccessor(sub_ctx_node)
+    return parser.parse_sub_context(add_accessor)
 
 
 class _RxMatchNode(namedtuple('_RxMatchNode', 'sub_ctx_node')):
     __slots__ = ()
-    def do(self, context):
+    do = _do_steps
+
+    def steps(self, context):
         rx, text = context.value
         m = rx.search(text)
         # only execute the sub-context if there was a match
         if m:
             value = (m.group(0),) + m.groups()
-            self.sub_ctx_node.do(None, context.rv, value, value)
+            yield self.sub_ctx_node, context.rv, value
 
 
 def make_rx_match(parser):
@@ -261,11 +340,30 @@ def make_rx_match(parser):
     if tok.end <= parser.depth:
         raise TakeSyntaxError('Invalid depth, expecting to start a "rx match" context.',
                               extra=tok)
-    #  parse the sub-context SaveEachNode will manage
-    sub_ctx = parser.spawn_context_parser()
-    sub_ctx_node, tok = sub_ctx.parse()
-    sub_ctx.destroy()
-    return tok, _RxMatchNode(sub_ctx_node)
+    #  parse the sub-context _RxMatchNode will manage
+    return parser.parse_sub_context(_RxMatchNode)
+
+
+def make_import(parser):
+    # imported here since the library module parses with the parser, which imports this
+    from .library import load_library
+    paths = []
+    tok = parser.next_tok()
+    # can import more than one library
+    while tok.type_ == TokenType.DirectiveBodyItem:
+        paths.append(tok.content.strip())
+        tok = parser.next_tok()
+    if not paths:
+        raise TakeSyntaxError('The import directive requires a path.', tok)
+    if tok.type_ != TokenType.DirectiveStatementEnd:
+        raise UnexpectedTokenError(tok.type_, TokenType.DirectiveStatementEnd, token=tok)
+    for path in paths:
+        try:
+            defs = load_library(path, parser.base_dir)
+        except (IOError, OSError) as e:
+            raise TakeSyntaxError('Unable to import library: %s' % path, e)
+        parser.defs.update(defs)
+    return None, None
 
 
 BUILTIN_DIRECTIVES = {
@@ -281,4 +379,5 @@ BUILTIN_DIRECTIVES = {
     'set context':  make_set_accessor_context,
     'accessor':     make_custom_accessor,
     'rx match':     make_rx_match,
+    'import':       make_import,
 }
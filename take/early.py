@@ -0,0 +1,215 @@
+"""
+Stopping the parsing of a document once the parts a template uses are
+parsed, ex: for templates which only extract the ``<head>`` metadata of large
+pages.
+
+`find_region` analyzes the queries run on the document itself, the top-level
+queries and those of ``def`` and ``namespace`` bodies at the top-level. The
+queries in the sub-contexts of a query only see its results. When each of
+them is confined to the ``<head>``, or is the index accessor of a simple
+selector like ``$ h1 | 0``, the document is parsed with a pull parser and
+parsing stops once the ``<head>`` and the indexed matches have closed. The
+queries give the same results on the parsed part as on the whole document.
+"""
+import lxml.html
+from cssselect import parse as parse_css, SelectorError
+from cssselect.parser import CombinedSelector, Element
+from lxml import etree
+
+from .directives import _DefSubroutine, _CustomAccessor
+from .memo import _parse_simple, _CLASS_SEP_RX
+from .parser import ContextNode, QueryNode, _CSSQuery, _CSSIndexQuery, _CSSAttrQuery
+
+
+# the first chunk fed is this big and each next one twice bigger, up to `MAX_CHUNK_SIZE`
+FIRST_CHUNK_SIZE = 1 << 14
+MAX_CHUNK_SIZE = 1 << 18
+
+
+def _element_name(compound):
+    # ex: `Attrib[Element[meta][name = 'x']]`, the element is the innermost selector
+    while not isinstance(compound, Element):
+        compound = compound.selector
+    return compound.element
+
+
+def in_head(css):
+    """Whether all the matches of ``css`` are the ``<head>`` or in it."""
+    try:
+        selectors = parse_css(css)
+    except SelectorError:
+        return False
+    for selector in selectors:
+        if selector.pseudo_element:
+            return False
+        tree = selector.parsed_tree
+        # the compounds from right to left, with the combinator following each one
+        following = None
+        confined = False
+        while True:
+            compound = tree.subselector if isinstance(tree, CombinedSelector) else tree
+            # what follows the head can only be in it, or be its descendants' siblings
+            if ((_element_name(compound) or '').lower() == 'head'
+                    and following in (None, ' ', '>')):
+                confined = True
+                break
+            if not isinstance(tree, CombinedSelector):
+                break
+            following = tree.combinator
+            tree = tree.selector
+        if not confined:
+            return False
+    return True
+
+
+class Region(object):
+    """
+    The part of a document a template uses: the ``<head>`` if ``head``, and
+    the first ``count`` matches of the simple selectors in ``matches``, by
+    their ``(tag, ids, classes)``.
+    """
+
+    def __init__(self):
+        self.head = False
+        self.matches = {}
+
+    def add_query(self, query):
+        """Adds the region ``query`` uses, returns `False` if it isn't confined."""
+        if not isinstance(query, (_CSSQuery, _CSSIndexQuery, _CSSAttrQuery)):
+            return False
+        css = query.selector if isinstance(query, _CSSQuery) else query.css
+        if in_head(css):
+            self.head = True
+            return True
+        index = getattr(query, 'index', -1)
+        simple = _parse_simple(css) if index >= 0 else None
+        if simple is None:
+            return False
+        tag, ids, classes = simple
+        key = (tag and tag.lower(), tuple(ids), tuple(classes))
+        self.matches[key] = max(self.matches.get(key, 0), index + 1)
+        return True
+
+    def tags(self):
+        """The tags to get parser events for, `None` for all."""
+        tags = set(['head', 'body']) if self.head else set()
+        for tag, _, _ in self.matches:
+            if tag is None:
+                return None
+            tags.add(tag)
+        return sorted(tags)
+
+
+def _add_context(region, ctx_node):
+    """Adds the queries run on the document in ``ctx_node``, `False` if one isn't confined."""
+    # the contexts run on the document
+    pending = [ctx_node]
+    while pending:
+        ctx_node = pending.pop()
+        # whether the last value can be the document, sub-contexts are run on it
+        last_is_doc = True
+        for node in ctx_node.nodes:
+            if isinstance(node, QueryNode):
+                if not region.add_query(node.queries[0]):
+                    return False
+                last_is_doc = False
+            elif isinstance(node, ContextNode):
+                if last_is_doc:
+                    pending.append(node)
+            else:
+                sub_ctx_node = getattr(node, 'sub_ctx_node', None)
+                if sub_ctx_node is None:
+                    # ex: saves or merges the document itself
+                    return False
+                pending.append(sub_ctx_node)
+                if isinstance(node, _DefSubroutine):
+                    # the last value is the subroutine's result
+                    last_is_doc = False
+                elif isinstance(node, _CustomAccessor):
+                    # can be the document, ex: with `set context`
+                    last_is_doc = True
+    return True
+
+
+def find_region(ctx_node):
+    """The `Region` of the document the template ``ctx_node`` uses, or `None` if all of it."""
+    region = Region()
+    return region if _add_context(region, ctx_node) else None
+
+
+def _matches(elm, tag, ids, classes):
+    if tag is not None and elm.tag != tag:
+        return False
+    if ids and any(elm.get('id') != elm_id for elm_id in ids):
+        return False
+    if classes:
+        names = set(_CLASS_SEP_RX.split(elm.get('class') or ''))
+        if not names.issuperset(classes):
+            return False
+    return True
+
+
+class _Tracker(object):
+    """Follows the parser's events until the region has been parsed."""
+
+    def __init__(self, region):
+        self.head_done = not region.head
+        # simple selector -> [matches needed, matches seen, the last match]
+        self.pending = dict((key, [count, 0, None]) for key, count in region.matches.items())
+
+    def done(self):
+        return self.head_done and not self.pending
+
+    def event(self, event, elm):
+        if event == 'start':
+            if elm.tag == 'body':
+                # the head is closed, or there isn't one
+                self.head_done = True
+            for key, state in self.pending.items():
+                if state[1] < state[0] and _matches(elm, *key):
+                    state[1] += 1
+                    if state[1] == state[0]:
+                        state[2] = elm
+        else:
+            if elm.tag == 'head':
+                self.head_done = True
+            for key, state in list(self.pending.items()):
+                if state[2] is elm:
+                    del self.pending[key]
+
+
+def iter_slices(data, first=FIRST_CHUNK_SIZE, last=MAX_CHUNK_SIZE):
+    """Yields growing slices of ``data``, a string or a memoryview, as bytes or strings."""
+    start = 0
+    size = first
+    while start < len(data):
+        chunk = data[start:start + size]
+        yield chunk.tobytes() if isinstance(chunk, memoryview) else chunk
+        start += size
+        size = min(size * 2, last)
+
+
+def parse_region(chunks, region, encoding=None):
+    """
+    Feeds the ``chunks`` of a document to an HTML pull parser until the
+    ``region`` has been parsed. Returns ``(roots, stopped)``, the list of
+    root elements and whether the parsing stopped before the end.
+    """
+    parser = etree.HTMLPullParser(events=('start', 'end'), tag=region.tags(),
+                                  encoding=encoding)
+    # the same elements as lxml.html's parser
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    tracker = _Tracker(region)
+    fed = stopped = False
+    for chunk in chunks:
+        parser.feed(chunk)
+        fed = True
+        for event, elm in parser.read_events():
+            tracker.event(event, elm)
+        if tracker.done():
+            stopped = True
+            break
+    if not fed:
+        return [], False
+    root = parser.close()
+    return ([] if root is None else [root]), stopped
@@ -0,0 +1,517 @@
+"""
+Running templates on the parser's events instead of a parsed document, for
+templates whose queries on the document are simple selectors.
+
+`find_selections` analyzes the CSS queries run on the document and on the
+matches of other CSS queries, ex: ``$ .item`` and the ``$ a | 0 [href]`` in
+its ``save each``. When each of them is a chain of ``tag#id.class``
+compounds joined by descendant or child combinators, the document is parsed
+with an lxml parser target: the selectors are matched against the stack of
+open elements as the start tags arrive, and only the matched elements whose
+text or attributes are used are built into trees. The template then runs as
+usual, with a memo which answers the CSS queries from the collected matches,
+so the results are the same as for the whole document. Parsing stops once
+the indexed matches on the document, ex: ``$ h1 | 0``, are found.
+
+Calling Python for each start and end tag costs more than lxml building the
+whole tree in C, so the events are only faster when the parsing can stop
+early, see `Selections.stops`. Documents which parse as XML are parsed
+whole, as `PyQuery` would, since an XML parse can't stop early.
+"""
+import lxml.html
+from cssselect import parse as parse_css, SelectorError
+from cssselect.parser import Class, CombinedSelector, Element, Hash
+from lxml import etree
+from pyquery import PyQuery
+
+from .directives import _SaveNode, _SaveEachNode, _NamespaceNode, _DefSubroutine, \
+     _MergeNode, _ShrinkNode, shrink_query
+from .early import iter_slices
+from .memo import _CLASS_SEP_RX
+from .parser import ContextNode, QueryNode, _CSSQuery, _CSSIndexQuery, _CSSAttrQuery, \
+     _IndexQuery, _AttrQuery, text_query, own_text_query
+from .peephole import shrunk_text_query, shrunk_own_text_query
+
+
+# queries which use the text of elements
+_TEXT_QUERIES = (text_query, own_text_query, shrunk_text_query, shrunk_own_text_query)
+
+
+def _compound(selector):
+    """Returns ``(tag, ids, classes)`` for a ``tag#id.class`` compound, otherwise `None`."""
+    ids = []
+    classes = []
+    while not isinstance(selector, Element):
+        if isinstance(selector, Class):
+            classes.append(selector.class_name)
+        elif isinstance(selector, Hash):
+            ids.append(selector.id)
+        else:
+            # ex: attributes or pseudo-classes
+            return None
+        selector = selector.selector
+    if selector.namespace is not None:
+        return None
+    # the same as the HTML translator PyQuery uses
+    tag = selector.element.lower() if selector.element else None
+    return tag, tuple(ids), frozenset(classes)
+
+
+def parse_chain(css):
+    """
+    Returns the compounds of ``css`` from right to left, each with the
+    combinator before it, if it's a chain of ``tag#id.class`` compounds
+    joined by ``' '`` or ``'>'``, otherwise `None`.
+    """
+    try:
+        selectors = parse_css(css)
+    except SelectorError:
+        return None
+    if len(selectors) != 1 or selectors[0].pseudo_element:
+        return None
+    tree = selectors[0].parsed_tree
+    chain = []
+    while isinstance(tree, CombinedSelector):
+        if tree.combinator not in (' ', '>'):
+            return None
+        chain.append((_compound(tree.subselector), tree.combinator))
+        tree = tree.selector
+    chain.append((_compound(tree), None))
+    if any(compound is None for compound, _ in chain):
+        return None
+    return chain
+
+
+class _Match(object):
+    """The match of a selection whose elements aren't built, with the element's attributes."""
+    __slots__ = ('attrib',)
+
+    def __init__(self, attrib):
+        self.attrib = attrib
+
+    def get(self, name, default=None):
+        return self.attrib.get(name, default)
+
+
+def _compound_matches(compound, entry):
+    name, ids, classes = compound
+    tag, attrib = entry
+    if name is not None and tag != name:
+        return False
+    for elm_id in ids:
+        if attrib.get('id') != elm_id:
+            return False
+    if classes:
+        names = attrib.get('class')
+        return bool(names) and classes.issubset(_CLASS_SEP_RX.split(names))
+    return True
+
+
+def _chain_matches(chain, i, stack, n, lo):
+    """Whether the ancestors of ``stack[n]``, down to ``stack[lo]``, match ``chain[i:]``."""
+    if i == len(chain):
+        return True
+    compound = chain[i][0]
+    if chain[i - 1][1] == '>':
+        return (n > lo and _compound_matches(compound, stack[n - 1]) and
+                _chain_matches(chain, i + 1, stack, n - 1, lo))
+    for p in range(n - 1, lo - 1, -1):
+        if _compound_matches(compound, stack[p]) and _chain_matches(chain, i + 1, stack, p, lo):
+            return True
+    return False
+
+
+class Selection(object):
+    """
+    A CSS query of the template, with the selections run on its matches in
+    ``children``. ``index`` is `None` for all the matches, ``attr`` the
+    attribute of an attribute query. ``tree`` is whether the text of the
+    matches is used, so the matched elements are built.
+    """
+    __slots__ = ('query', 'chain', 'index', 'attr', 'children', 'tree', 'group')
+
+    def __init__(self, query, chain):
+        self.query = query
+        self.chain = chain
+        self.index = getattr(query, 'index', None)
+        self.attr = getattr(query, '_attr_name', None)
+        self.children = []
+        self.tree = False
+        self.group = None
+
+    def matches(self, stack, n, lo):
+        return (_compound_matches(self.chain[0][0], stack[n]) and
+                _chain_matches(self.chain, 1, stack, n, lo))
+
+    def result(self, found):
+        """The query's result from its matches, the indexed match only for indexes > -1."""
+        index = self.index
+        if index is not None and index < 0:
+            found = [found[index]] if len(found) >= -index else []
+        if self.attr is not None:
+            return found[0].get(self.attr) if found else None
+        return PyQuery(found)
+
+
+class _Group(object):
+    """The selections run on the same element, by the tag they match."""
+    __slots__ = ('selections', 'by_tag', 'any_tag', 'bounded')
+
+    def __init__(self, selections):
+        self.selections = selections
+        self.by_tag = {}
+        self.any_tag = []
+        for sel in selections:
+            tag = sel.chain[0][0][0]
+            if tag is None:
+                self.any_tag.append(sel)
+            else:
+                self.by_tag.setdefault(tag, []).append(sel)
+        self.bounded = sum(1 for sel in selections if sel.index is not None and sel.index > -1)
+        if self.bounded < len(selections):
+            # matches are needed until the end
+            self.bounded = -1
+
+
+class Selections(object):
+    """
+    The selections of a template, ``roots`` are those run on the document.
+    ``stops`` is whether they only need some of the matches on the document,
+    ex: ``$ h1 | 0``, so the parsing stops once they're found.
+    """
+
+    def __init__(self):
+        self.roots = []
+        self.by_query = {}
+        self.group = None
+        self.stops = False
+
+    def add(self, query, src):
+        """Adds ``query``, run on the matches of the selection ``src`` or the document if `None`."""
+        sel = self.by_query.get(query)
+        if sel is None:
+            css = query.selector if isinstance(query, _CSSQuery) else query.css
+            chain = parse_chain(css)
+            if chain is None:
+                return None
+            sel = self.by_query[query] = Selection(query, chain)
+        parent = self.roots if src is None else src.children
+        if sel not in parent:
+            parent.append(sel)
+        return sel
+
+    def finish(self):
+        self.group = _Group(self.roots)
+        self.stops = self.group.bounded != -1
+        for sel in self.by_query.values():
+            sel.group = _Group(sel.children) if sel.children else None
+        return self
+
+
+# the values in the analysis, `(kind, selection)`: the document, a match or the
+# matches of a selection, a string or the results of a subroutine
+DOC, ONE, MANY, SCALAR, RESULTS = 'doc', 'one', 'many', 'scalar', 'results'
+
+
+def _query_value(selections, query, value):
+    """The value ``query`` makes from ``value``, `None` if not supported."""
+    kind, src = value
+    if isinstance(query, (_CSSQuery, _CSSIndexQuery, _CSSAttrQuery)):
+        # selectors are matched within one element
+        if kind not in (DOC, ONE):
+            return None
+        sel = selections.add(query, src)
+        if sel is None:
+            return None
+        if isinstance(query, _CSSAttrQuery):
+            return SCALAR, None
+        return (MANY if isinstance(query, _CSSQuery) else ONE), sel
+    if kind in (ONE, MANY):
+        if isinstance(query, _IndexQuery):
+            return ONE, src
+        if isinstance(query, _AttrQuery) or query in _TEXT_QUERIES or query is shrink_query:
+            src.tree = True
+            return SCALAR, None
+    elif kind == SCALAR and query is shrink_query:
+        return SCALAR, None
+    return None
+
+
+def find_selections(ctx_node):
+    """The `Selections` of the template ``ctx_node``, `None` if it doesn't only use them."""
+    selections = Selections()
+    pending = [(ctx_node, (DOC, None))]
+    seen = set()
+    while pending:
+        ctx_node, value = pending.pop()
+        # the subroutines are shared by their call sites
+        if (id(ctx_node), value) in seen:
+            continue
+        seen.add((id(ctx_node), value))
+        kind, src = value
+        last_value = value
+        for node in ctx_node.nodes:
+            if isinstance(node, QueryNode):
+                last_value = value
+                for query in node.queries:
+                    last_value = _query_value(selections, query, last_value)
+                    if last_value is None:
+                        return None
+            elif isinstance(node, ContextNode):
+                pending.append((node, last_value))
+            elif isinstance(node, _SaveNode):
+                # elements would be saved from the partial trees
+                if kind not in (SCALAR, RESULTS):
+                    return None
+            elif isinstance(node, _SaveEachNode):
+                if kind not in (ONE, MANY):
+                    return None
+                pending.append((node.sub_ctx_node, (ONE, src)))
+            elif isinstance(node, _NamespaceNode):
+                pending.append((node.sub_ctx_node, value))
+            elif isinstance(node, _DefSubroutine):
+                pending.append((node.sub_ctx_node, value))
+                last_value = RESULTS, None
+            elif isinstance(node, _MergeNode):
+                if kind != RESULTS:
+                    return None
+            elif isinstance(node, _ShrinkNode):
+                if kind == DOC or kind == RESULTS:
+                    return None
+                if src is not None:
+                    src.tree = True
+                last_value = SCALAR, None
+            else:
+                # ex: accessors and regexps
+                return None
+    return selections.finish()
+
+
+class _Stop(Exception):
+    """Raised by the target when the rest of the document isn't needed."""
+
+
+class _Scope(object):
+    """
+    The matching of a `_Group` in the element ``key`` at ``depth`` of the
+    stack, or in the document.
+    """
+    __slots__ = ('group', 'lo', 'depth', 'key', 'counts', 'pending')
+
+    def __init__(self, group, depth, key):
+        self.group = group
+        # the ancestors of the matches are looked at down to the element itself
+        self.lo = max(depth, 0)
+        self.depth = depth
+        self.key = key
+        self.counts = {}
+        self.pending = group.bounded
+
+
+class _Target(object):
+    """
+    The parser target collecting the matches of the `Selections`. The stack
+    has the ``(tag, attrib)`` of the open elements.
+    """
+
+    def __init__(self, selections, attr_trees):
+        # attributes are read from built elements, ex: to make links absolute
+        self.attr_trees = attr_trees
+        self.stack = []
+        self.doc_scope = _Scope(selections.group, -1, None)
+        self.scopes = [self.doc_scope]
+        # (query, match or None for the document) -> matches
+        self.matches = {}
+        self.builder = None
+        self.builder_depth = None
+        self.roots = []
+
+    def _test(self, scope, sels, kept):
+        stack = self.stack
+        n = len(stack) - 1
+        counts = scope.counts
+        for sel in sels:
+            count = counts.get(sel, 0)
+            index = sel.index
+            if index is not None and -1 < index < count:
+                # already found
+                continue
+            if not sel.matches(stack, n, scope.lo):
+                continue
+            counts[sel] = count + 1
+            if index is None or index < 0:
+                pass
+            elif index == count:
+                scope.pending -= 1
+            else:
+                continue
+            if kept is None:
+                kept = []
+            kept.append((sel, scope))
+        return kept
+
+    def start(self, tag, attrib):
+        self.stack.append((tag, attrib))
+        kept = None
+        for scope in self.scopes:
+            group = scope.group
+            sels = group.by_tag.get(tag)
+            if sels:
+                kept = self._test(scope, sels, kept)
+            if group.any_tag:
+                kept = self._test(scope, group.any_tag, kept)
+        if kept:
+            self._matched(tag, attrib, kept)
+        elif self.builder is not None:
+            self.builder.start(tag, attrib)
+
+    def _matched(self, tag, attrib, kept):
+        n = len(self.stack) - 1
+        elm = match = None
+        if self.builder is not None:
+            elm = self.builder.start(tag, attrib)
+        # the selections started in each match, a match can be found through more than one
+        # scope, ex: `$ *` matches the element of its own scope
+        scoped = {}
+        while kept:
+            spawned = {}
+            for sel, scope in kept:
+                if sel.tree or (sel.attr is not None and self.attr_trees):
+                    if elm is None:
+                        # the same elements as lxml.html's parser
+                        self.builder = etree.TreeBuilder(parser=lxml.html.html_parser)
+                        self.builder_depth = n
+                        elm = self.builder.start(tag, attrib)
+                    key = elm
+                else:
+                    if match is None:
+                        match = _Match(attrib)
+                    key = match
+                self.matches.setdefault((sel.query, scope.key), []).append(key)
+                if sel.group is not None:
+                    spawned.setdefault(key, []).append(sel.group)
+            kept = None
+            for key, groups in spawned.items():
+                done = scoped.setdefault(key, set())
+                sels = []
+                for group in groups:
+                    sels.extend(sel for sel in group.selections
+                                if sel not in done and sel not in sels)
+                if not sels:
+                    continue
+                done.update(sels)
+                if len(groups) == 1 and len(sels) == len(groups[0].selections):
+                    group = groups[0]
+                else:
+                    group = _Group(sels)
+                scope = _Scope(group, n, key)
+                self.scopes.append(scope)
+                # the element itself is in its descendant-or-self matches
+                kept = self._test(scope, group.selections, kept)
+
+    def end(self, tag):
+        stack = self.stack
+        stack.pop()
+        n = len(stack)
+        scopes = self.scopes
+        while scopes[-1].depth == n:
+            scopes.pop()
+        if self.builder is not None:
+            self.builder.end(tag)
+            if n == self.builder_depth:
+                self.roots.append(self.builder.close())
+                self.builder = None
+        if not self.doc_scope.pending and self.builder is None and len(scopes) == 1:
+            raise _Stop()
+
+    def close(self):
+        return None
+
+
+class _TreeTarget(_Target):
+    """A `_Target` which also builds the text of the matched elements."""
+
+    def data(self, data):
+        if self.builder is not None:
+            self.builder.data(data)
+
+    def comment(self, text):
+        if self.builder is not None:
+            self.builder.comment(text)
+
+    def pi(self, target, data=None):
+        if self.builder is not None:
+            self.builder.pi(target, data)
+
+
+class MatchMemo(object):
+    """Answers the template's CSS queries from the matches collected by the parser target."""
+
+    def __init__(self, selections, matches, doc=None):
+        self._selections = selections.by_query
+        self._matches = matches
+        # the document the matches are for, set once it's made
+        self.doc = doc
+
+    def query(self, query, value):
+        sel = self._selections.get(query)
+        if sel is None:
+            return query(value)
+        if value is self.doc:
+            key = None
+        elif isinstance(value, PyQuery):
+            if not len(value):
+                return sel.result([])
+            key = value[0]
+        else:
+            key = value
+        return sel.result(self._matches.get((query, key), []))
+
+
+def parse_events(html, selections, base_url=None):
+    """
+    Parses the HTML string or bytes ``html`` like `PyQuery` does, as XML or
+    else as HTML, collecting the matches of the ``selections`` when it's
+    parsed as HTML. Returns the ``(doc, memo)`` to run the template with, the
+    memo is `None` for a whole document parsed as XML. Returns `None` for
+    documents which aren't a full HTML document and have to be parsed as
+    usual.
+    """
+    if isinstance(html, bytes):
+        looks_like_html = lxml.html._looks_like_full_html_bytes
+    else:
+        looks_like_html = lxml.html._looks_like_full_html_unicode
+    if not looks_like_html(html):
+        # lxml.html would parse a fragment
+        return None
+    try:
+        # an XML parse can't stop early, an error later on would parse it as HTML, so the
+        # tree is built, it's cheaper than the events. It's fed in slices since most pages
+        # fail as XML near the start
+        parser = etree.XMLParser()
+        for chunk in iter_slices(html):
+            parser.feed(chunk)
+        roots = [parser.close()]
+        memo = None
+    except etree.XMLSyntaxError:
+        attr_trees = bool(base_url)
+        builds = any(sel.tree or (sel.attr is not None and attr_trees)
+                     for sel in selections.by_query.values())
+        # the parser doesn't call the text and comment methods of targets without them
+        target = (_TreeTarget if builds else _Target)(selections, attr_trees)
+        parser = etree.HTMLParser(target=target)
+        try:
+            # fed in slices, the target stops the parsing between them
+            for chunk in iter_slices(html):
+                parser.feed(chunk)
+            parser.close()
+        except _Stop:
+            pass
+        roots = target.roots
+        memo = MatchMemo(selections, target.matches)
+    doc = PyQuery(roots)
+    if base_url:
+        doc.make_links_absolute(base_url)
+    if memo is not None:
+        memo.doc = doc
+    return doc, memo
@@ -70,3 +70,7 @@ class TakeSyntaxError(Exception):
                 '      message: {!r}\n'
                 '        extra: {!r}\n'
                 '}}').format(self.message, self.extra)
+
+
+class DeadCodeWarning(UserWarning):
+    pass
@@ -0,0 +1,125 @@
+"""
+Inlining of ``def`` subroutines and custom accessors into their call sites.
+
+- An accessor whose body is only a chain of queries ending with ``set context``
+  (ex: ``$ li | 0 ; set context``) is replaced by a single query node with all
+  of the queries, so calling it doesn't run a sub-context into a dict.
+
+- A subroutine call followed by a sub-context with only ``merge: *`` has the
+  subroutine body spliced into the calling context, so the body saves directly
+  to the caller's result instead of a dict which is then copied. This is only
+  done when the body saves to single-part names, where the two are the same.
+"""
+from .directives import _SaveNode, _SaveEachNode, _DefSubroutine, _CustomAccessor, \
+     _MergeNode, _SetAccessorLastValueContext, _RxMatchNode
+from .parser import ContextNode, QueryNode
+from .prune import _PRODUCERS, _same_or_new
+
+
+def _accessor_queries(ctx_node):
+    """
+    Returns the queries for an accessor body made of a query chain ending with
+    ``set context``, otherwise `None`.
+    """
+    queries = ()
+    nodes = ctx_node.nodes
+    while True:
+        if len(nodes) == 1 and isinstance(nodes[0], _SetAccessorLastValueContext):
+            return queries
+        if (len(nodes) != 2 or not isinstance(nodes[0], QueryNode) or
+                not isinstance(nodes[1], ContextNode)):
+            return None
+        queries += nodes[0].queries
+        nodes = nodes[1].nodes
+
+
+def _saves_flat(ctx_node):
+    """True if the context only saves to single-part names in its own result."""
+    for node in ctx_node.nodes:
+        if isinstance(node, ContextNode):
+            if not _saves_flat(node):
+                return False
+        elif isinstance(node, _RxMatchNode):
+            if not _saves_flat(node.sub_ctx_node):
+                return False
+        elif isinstance(node, (_SaveNode, _SaveEachNode)):
+            if len(node.ident_parts) != 1:
+                return False
+        elif isinstance(node, _MergeNode):
+            if not node.save_all and any(len(name_parts) != 1
+                                         for name_parts in node.names_to_save):
+                return False
+        elif not isinstance(node, _PRODUCERS):
+            return False
+    return True
+
+
+def _is_merge_all(node):
+    return (isinstance(node, ContextNode) and len(node.nodes) == 1 and
+            isinstance(node.nodes[0], _MergeNode) and node.nodes[0].save_all)
+
+
+def _last_value_unused(nodes):
+    """True if no sub-context uses the last_value before the next producer."""
+    for node in nodes:
+        if isinstance(node, _PRODUCERS):
+            return True
+        if isinstance(node, ContextNode):
+            return False
+    return True
+
+
+class _Inlining(object):
+
+    def __init__(self):
+        # inlined subroutines, by id of the original since call sites share them
+        self.defs = {}
+
+    def subroutine(self, node):
+        inlined = self.defs.get(id(node))
+        if inlined is None:
+            sub_ctx_node = self.context(node.sub_ctx_node)
+            queries = None
+            if isinstance(node, _CustomAccessor):
+                queries = _accessor_queries(sub_ctx_node)
+            if queries is not None:
+                inlined = QueryNode(queries, None)
+            elif sub_ctx_node is not node.sub_ctx_node:
+                inlined = node._replace(sub_ctx_node=sub_ctx_node)
+            else:
+                inlined = node
+            self.defs[id(node)] = inlined
+        return inlined
+
+    def context(self, ctx_node):
+        nodes = []
+        src_nodes = ctx_node.nodes
+        i = 0
+        while i < len(src_nodes):
+            node = src_nodes[i]
+            if isinstance(node, (_DefSubroutine, _CustomAccessor)):
+                node = self.subroutine(node)
+                if (isinstance(node, _DefSubroutine) and i + 1 < len(src_nodes) and
+                        _is_merge_all(src_nodes[i + 1]) and
+                        _last_value_unused(src_nodes[i + 2:]) and
+                        _last_value_unused(node.sub_ctx_node.nodes) and
+                        _saves_flat(node.sub_ctx_node)):
+                    # neither uses the other's last_value, so splice the body in
+                    # and skip the merge sub-context
+                    nodes.extend(node.sub_ctx_node.nodes)
+                    i += 2
+                    continue
+            elif isinstance(node, ContextNode):
+                node = self.context(node)
+            elif hasattr(node, 'sub_ctx_node'):
+                sub_ctx_node = self.context(node.sub_ctx_node)
+                if sub_ctx_node is not node.sub_ctx_node:
+                    node = node._replace(sub_ctx_node=sub_ctx_node)
+            nodes.append(node)
+            i += 1
+        return _same_or_new(ctx_node, nodes)
+
+
+def inline_subroutines(ctx_node):
+    """Returns a copy of the parsed ``ctx_node`` with subroutines inlined."""
+    return _Inlining().context(ctx_node)
@@ -0,0 +1,126 @@
+"""
+Subroutine libraries, ``.take`` files with only ``def:`` and ``accessor:``
+statements which templates bring in with the ``import:`` directive.
+
+A library is parsed and compiled (see `take.inline` and `take.prune`) once per
+process, all the templates importing it share the same subroutine nodes. The
+cache is keyed by the absolute path and is refreshed when the file, or one of
+the libraries it imports, changes. Loading is serialized by a lock, so
+threads making templates which import the same library parse it once.
+"""
+import os
+import threading
+import warnings
+
+from .exceptions import TakeSyntaxError, DeadCodeWarning
+from .inline import _Inlining
+from .prune import _Pruning, _line_nums
+
+
+# absolute path -> (((path, mtime) of it and its imports, ...), {name: subroutine node})
+_LIBRARIES = {}
+# held while checking and filling the cache, a library's imports are loaded with it held
+_LOCK = threading.RLock()
+# the import chain of each thread: ``loading`` has the libraries being loaded, to catch
+# circular imports, ``imported`` the (path, mtime) of the libraries imported by each of them
+_chain = threading.local()
+
+
+def _import_chain():
+    if not hasattr(_chain, 'loading'):
+        _chain.loading = set()
+        _chain.imported = []
+    return _chain
+
+
+def resolve_path(path, base_dir=None):
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir or os.getcwd(), path)
+    return os.path.abspath(path)
+
+
+def _compile(defs, path):
+    """Inlines and removes dead code from the subroutines, like `TakeTemplate` does."""
+    inlining = _Inlining()
+    removed = []
+    pruning = _Pruning(removed, {})
+    compiled = {}
+    for name, node in defs.items():
+        # accessors can be inlined to a query node, including imported ones
+        if hasattr(node, 'sub_ctx_node'):
+            node = inlining.subroutine(node)
+        if hasattr(node, 'sub_ctx_node'):
+            node = pruning.subroutine(node)
+        compiled[name] = node
+    line_nums = sorted(set(_line_nums(removed)))
+    if line_nums:
+        warnings.warn('Removed queries with no effect on the results, in %s on lines: %s' %
+                      (path, ', '.join(str(n) for n in line_nums)),
+                      DeadCodeWarning, stacklevel=3)
+    return compiled
+
+
+def parse_library(src, base_dir=None, path='<library>'):
+    """
+    Parses the library ``src`` and returns its subroutines by name, including
+    the ones it imports.
+    """
+    # imported here since the parser imports the directives which import this
+    from .parser import parse
+    defs = {}
+    node = parse(src, base_dir, exports=defs)
+    if node.nodes:
+        raise TakeSyntaxError('A library can only contain "def", "accessor" and '
+                              '"import" statements.', path)
+    return _compile(defs, path)
+
+
+def load_library(path, base_dir=None):
+    """
+    Returns the subroutines of the library at ``path``, relative to
+    ``base_dir``, parsing it only if it's not cached or has changed.
+    """
+    path = resolve_path(path, base_dir)
+    with _LOCK:
+        chain = _import_chain()
+        cached = _LIBRARIES.get(path)
+        if cached is not None and _unchanged(cached[0]):
+            _imported(chain, cached[0])
+            return cached[1]
+        if path in chain.loading:
+            raise TakeSyntaxError('Circular library import.', path)
+        # the imported libraries' defs are inlined in this one's, so it depends on their files
+        files = [(path, os.path.getmtime(path))]
+        chain.loading.add(path)
+        chain.imported.append(files)
+        try:
+            with open(path, 'rb') as f:
+                defs = parse_library(f.read().decode('utf-8'), os.path.dirname(path), path)
+        finally:
+            chain.loading.discard(path)
+            chain.imported.pop()
+        files = tuple(sorted(set(files)))
+        _LIBRARIES[path] = (files, defs)
+        _imported(chain, files)
+        return defs
+
+
+def _unchanged(files):
+    """Whether none of the ``(path, mtime)`` files changed."""
+    try:
+        return all(os.path.getmtime(path) == mtime for path, mtime in files)
+    except OSError:
+        # ex: deleted
+        return False
+
+
+def _imported(chain, files):
+    # the library being loaded depends on the files of the ones it imports
+    if chain.imported:
+        chain.imported[-1].extend(files)
+
+
+def clear_cache():
+    """Forgets the loaded libraries."""
+    with _LOCK:
+        _LIBRARIES.clear()
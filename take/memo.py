@@ -0,0 +1,251 @@
+"""
+Memoization of CSS selector results while extracting data from one document,
+and an index of the document's elements for simple selectors.
+"""
+import re
+import time
+
+from lxml import etree
+from pyquery import PyQuery
+
+from ._compat import string_types
+from .parser import _ATTR_ALIASES, _DEFAULT_TRANSLATOR, copy_pq, pq_namespaces
+
+
+# results can be None, ex: a missing attribute
+_MISSING = object()
+
+
+class SelectorMemo(object):
+    """
+    Caches the results of CSS selector queries by the selector and the
+    elements it's applied to. Only valid for one document, the cached results
+    are stale if the document is modified.
+
+    ``hits`` and ``misses`` count the cached and evaluated selector queries.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def query(self, query, value):
+        selector = getattr(query, 'selector', None)
+        if selector is None:
+            return query(value)
+        if isinstance(value, PyQuery):
+            key = (selector, tuple(value))
+        elif isinstance(value, etree._Element):
+            key = (selector, (value,))
+        else:
+            # ex: the query parses a string
+            return query(value)
+        result = self._results.get(key, _MISSING)
+        if result is _MISSING:
+            self.misses += 1
+            result = self._results[key] = query(value)
+        else:
+            self.hits += 1
+        return result
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def stats(self):
+        """Returns the counters as a dict."""
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate,
+                'size': len(self._results)}
+
+    def clear(self):
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# ex: ``div``, ``#main``, ``.item``, ``li.item.new``
+_SIMPLE_SELECTOR_RX = re.compile(r'^(\*|[A-Za-z_][A-Za-z0-9_-]*)?((?:[#.][A-Za-z_][A-Za-z0-9_-]*)*)$')
+_PART_RX = re.compile(r'([#.])([A-Za-z0-9_-]+)')
+# what XPath's normalize-space() splits on, as CSS class selectors use
+_CLASS_SEP_RX = re.compile(r'[ \t\r\n]+')
+
+
+def _parse_simple(selector):
+    """Returns ``(tag, ids, classes)`` for a simple selector, otherwise `None`."""
+    m = _SIMPLE_SELECTOR_RX.match(selector)
+    if m is None or not selector:
+        return None
+    tag = m.group(1)
+    ids = []
+    classes = []
+    for kind, name in _PART_RX.findall(m.group(2)):
+        (ids if kind == '#' else classes).append(name)
+    return (None if tag == '*' else tag), ids, classes
+
+
+class ElementIndex(SelectorMemo):
+    """
+    A `SelectorMemo` which also answers tag, ``#id`` and ``.class`` selectors,
+    and compounds of them like ``li.item``, applied to the document's root
+    element from an index of the elements by id, class and tag. The index is
+    built in one pass over the document after the first such selector, which
+    is run normally to time a tree walk. Other selectors are memoized.
+
+    ``index_hits`` counts the selectors answered from the index, and
+    ``saved_seconds`` estimates the time saved over walking the tree for
+    each of them, less the time building the index took. ``paid_off`` is
+    `True` once that's positive.
+    """
+
+    def __init__(self):
+        super(ElementIndex, self).__init__()
+        self._root = None
+        self._simple = {}
+        self.index_hits = 0
+        self.walks = 0
+        self.walk_seconds = 0.0
+        self.build_seconds = 0.0
+
+    def _build(self, root):
+        start = time.time()
+        elements = []
+        ids = {}
+        classes = {}
+        tags = {}
+        for elm in root.iter():
+            tag = elm.tag
+            if not isinstance(tag, string_types):
+                # comments and processing instructions
+                continue
+            elements.append(elm)
+            tags.setdefault(tag, []).append(elm)
+            elm_id = elm.get('id')
+            if elm_id is not None:
+                ids.setdefault(elm_id, []).append(elm)
+            names = elm.get('class')
+            if names:
+                for name in set(_CLASS_SEP_RX.split(names)):
+                    if name:
+                        classes.setdefault(name, []).append(elm)
+        self._root = root
+        self._elements = elements
+        self._ids = ids
+        self._classes = classes
+        self._tags = tags
+        self.build_seconds += time.time() - start
+
+    def _find(self, tag, ids, classes):
+        """The elements matching a simple selector, in document order."""
+        if ids:
+            found = self._ids.get(ids[0], ())
+        elif classes:
+            found = self._classes.get(classes[0], ())
+        elif tag is not None:
+            return self._tags.get(tag, [])
+        else:
+            return self._elements
+        return [elm for elm in found
+                if (tag is None or elm.tag == tag) and
+                all(elm.get('id') == elm_id for elm_id in ids) and
+                (not classes or set(classes).issubset(
+                    _CLASS_SEP_RX.split(elm.get('class') or '')))]
+
+    def _indexable(self, query, value):
+        """Returns ``(root, pq, simple, selector)`` if the index can answer the query."""
+        selector = getattr(query, 'selector', None)
+        name = selector if isinstance(selector, string_types) else (
+            selector[0] if isinstance(selector, tuple) else None)
+        if name is None:
+            return None
+        simple = self._simple.get(name, False)
+        if simple is False:
+            simple = self._simple[name] = _parse_simple(name)
+        if simple is None:
+            return None
+        pq = value if isinstance(value, PyQuery) else None
+        if pq is not None:
+            if len(pq) != 1 or pq_namespaces(pq):
+                return None
+            root = pq[0]
+            translator = pq._translator
+        elif isinstance(value, etree._Element):
+            root = value
+            translator = _DEFAULT_TRANSLATOR
+        else:
+            return None
+        if not isinstance(root, etree._Element) or root.getparent() is not None:
+            # only the document's root context
+            return None
+        tag, ids, classes = simple
+        if tag is not None and translator.lower_case_element_names:
+            tag = tag.lower()
+        return root, pq, (tag, ids, classes), selector
+
+    def query(self, query, value):
+        indexable = self._indexable(query, value)
+        if indexable is None:
+            return super(ElementIndex, self).query(query, value)
+        root, pq, simple, selector = indexable
+        if root is not self._root:
+            # time a tree walk with this selector, then index the document
+            start = time.time()
+            result = query(value)
+            self.walk_seconds += time.time() - start
+            self.walks += 1
+            self._build(root)
+            return result
+        self.index_hits += 1
+        found = self._find(*simple)
+        if isinstance(selector, tuple):
+            i = selector[1] if selector[1] > -1 else len(found) + selector[1]
+            found = found[i:i + 1] if i > -1 else []
+            if len(selector) == 3:
+                attr = _ATTR_ALIASES.get(selector[2], selector[2])
+                return found[0].get(attr) if found else None
+        if pq is None:
+            return PyQuery(list(found))
+        return copy_pq(pq, list(found))
+
+    @property
+    def saved_seconds(self):
+        if not self.walks:
+            return 0.0
+        return self.index_hits * self.walk_seconds / self.walks - self.build_seconds
+
+    @property
+    def paid_off(self):
+        return self.saved_seconds > 0
+
+    def stats(self):
+        """Returns the counters as a dict, with the index's."""
+        stats = super(ElementIndex, self).stats()
+        stats.update(index_hits=self.index_hits, build_seconds=self.build_seconds,
+                     saved_seconds=self.saved_seconds, paid_off=self.paid_off)
+        return stats
+
+    def clear(self):
+        super(ElementIndex, self).clear()
+        self._root = None
+        self.index_hits = 0
+        self.walks = 0
+        self.walk_seconds = 0.0
+        self.build_seconds = 0.0
+
+
+def make_memo(memo, index=False):
+    """
+    Returns the `SelectorMemo` for the ``memo`` argument of `take()`: `True`
+    for a new one, an existing instance to read its counters after, or `None`.
+    With ``index=True``, a new or the given `ElementIndex`.
+    """
+    if index:
+        if isinstance(memo, ElementIndex):
+            return memo
+        if isinstance(memo, SelectorMemo):
+            raise ValueError('index=True needs an ElementIndex for memo, not a SelectorMemo')
+        return ElementIndex()
+    if memo is True:
+        return SelectorMemo()
+    return memo or None
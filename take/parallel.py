@@ -0,0 +1,85 @@
+"""
+Running the independent top-level branches of a template in threads, for
+free-threaded Python builds where threads run Python code in parallel.
+
+The top-level nodes are split into runs which don't use each other's last
+value, and the runs saving to the same top-level keys are grouped into
+branches, like the units of `take.watch`. Each branch is run with `execute`
+into its own result, and the results are merged in the order of the
+branches. On builds with the GIL the branches would only take turns, so the
+template is run serially.
+"""
+import sys
+from multiprocessing.pool import ThreadPool
+
+from .parser import ContextNode, QueryNode, execute
+from .schema import group_by_keys, keys_overlap
+
+
+def gil_enabled():
+    """Whether the GIL is enabled, always `True` before free-threaded builds (3.13)."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is None or is_gil_enabled()
+
+
+def _runs(nodes):
+    """
+    Splits ``nodes`` into runs which can be run separately: a run starts at a
+    query, which starts from the context's value, or at a node which isn't
+    followed by a sub-context before the next query, since sub-contexts are
+    what use the last value of the nodes before them.
+    """
+    starts = []
+    uses_last_value = False
+    for i in range(len(nodes) - 1, -1, -1):
+        node = nodes[i]
+        if isinstance(node, ContextNode):
+            uses_last_value = True
+        elif isinstance(node, QueryNode):
+            uses_last_value = False
+            starts.append(i)
+        elif not uses_last_value:
+            starts.append(i)
+    starts.reverse()
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    ends = starts[1:] + [len(nodes)]
+    return [nodes[start:end] for start, end in zip(starts, ends) if start < end]
+
+
+def split_branches(ctx_node):
+    """
+    Returns the branches of ``ctx_node`` as a list of `ContextNode`, the runs
+    saving to the same top-level keys are in the same branch.
+    """
+    runs = _runs(ctx_node.nodes)
+    groups = group_by_keys([ContextNode(ctx_node.depth, run) for run in runs])
+    return [ContextNode(ctx_node.depth, [node for i in indexes for node in runs[i]])
+            for indexes in groups]
+
+
+def run_branches(branches, rv_type, value, make_memo, threads):
+    """
+    Runs the ``branches`` on ``value`` in ``threads`` threads, each with the
+    memo from ``make_memo()``, and returns their merged results. Returns
+    `None` if the results turn out to share keys, ex: merged from a field,
+    in which case the template has to be run serially.
+    """
+    def run(branch):
+        rv = rv_type()
+        execute(branch, rv, value, make_memo())
+        return rv
+
+    pool = ThreadPool(min(threads, len(branches)))
+    try:
+        results = pool.map(run, branches)
+    finally:
+        pool.close()
+        pool.join()
+    if keys_overlap(results):
+        return None
+    rv = rv_type()
+    for result in results:
+        for key in result:
+            rv[key] = result[key]
+    return rv
@@ -1,8 +1,8 @@
 from collections import namedtuple, MutableMapping, Sequence
-from itertools import chain
 import re
 import sys
 
+from lxml import etree
 from pyquery import PyQuery
 
 from ._compat import string_types, StringIO
@@ -10,7 +10,7 @@ from .directives import BUILTIN_DIRECTIVES
 from .exceptions import AlreadyParsedError, UnexpectedEOFError, \
      UnexpectedTokenError, InvalidDirectiveError, TakeSyntaxError
 from .scanner import Scanner, TokenType
-from .utils import split_name, get_via_name_list
+from .utils import split_name, make_getter
 
 
 _BUILTIN_DIRECTIVES_IDS = set(BUILTIN_DIRECTIVES.keys())
@@ -23,42 +23,277 @@ def ensure_pq(elm):
         return PyQuery(elm)
 
 
+def pq_namespaces(pq):
+    """The namespaces of ``pq``, PyQuery before 1.3 doesn't keep them."""
+    return getattr(pq, 'namespaces', None)
+
+
+def copy_pq(pq, elements):
+    """
+    Util to make a `PyQuery` of ``elements`` found from ``pq``, like
+    ``PyQuery._copy`` of newer versions, which older ones don't have.
+    """
+    namespaces = pq_namespaces(pq)
+    if namespaces:
+        return pq.__class__(elements, parent=pq, namespaces=namespaces)
+    return pq.__class__(elements, parent=pq)
+
+
+class _Query(object):
+    """
+    Base of the queries made by the ``make_*_query`` functions. Queries are
+    callables which pickle as their class and the arguments they were made
+    with, so compiled templates can be sent to other processes. Anything
+    precomputed from the arguments is made again when unpickled.
+    """
+    __slots__ = ()
+
+    def _args(self):
+        raise NotImplementedError()
+
+    def prepare(self):
+        """Builds what the query would build lazily, see `take.preload`."""
+
+    def __reduce__(self):
+        return self.__class__, self._args()
+
+
+class _CSSQuery(_Query):
+    # `selector` lets a `SelectorMemo` share the results of queries with the same selector
+    __slots__ = ('selector',)
+
+    def __init__(self, selector):
+        self.selector = selector
+
+    def _args(self):
+        return (self.selector,)
+
+    def __call__(self, elm):
+        return ensure_pq(elm)(self.selector)
+
+
 def make_css_query(selector):
-    return lambda elm: ensure_pq(elm)(selector)
+    return _CSSQuery(selector)
 
 
-def make_regexp_query(rx):
-    def regexp_query(value):
+class _RegexpQuery(_Query):
+    __slots__ = ('rx',)
+
+    def __init__(self, rx):
+        self.rx = rx
+
+    def _args(self):
+        return (self.rx,)
+
+    def __call__(self, value):
         if isinstance(value, string_types):
-            return (rx, value)
+            return (self.rx, value)
         else:
-            return (rx, ensure_pq(value).text())
-    return regexp_query
+            return (self.rx, ensure_pq(value).text())
 
 
-def make_index_query(index_str):
-    index = int(index_str)
-    if index > -1:
-        def index_query(value):
+def make_regexp_query(rx):
+    return _RegexpQuery(rx)
+
+
+class _IndexQuery(_Query):
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def _args(self):
+        return (self.index,)
+
+    def __call__(self, value):
+        index = self.index
+        if index > -1:
             if hasattr(value, 'eq'):
                 return value.eq(index)
             elif isinstance(value, Sequence) and len(value) > index:
                 return value[index]
             else:
-                return ensure_pq(elm).eq(index)
-    else:
+                return ensure_pq(value).eq(index)
         # PyQuery doesn't handle negative indexes, so calc the real index each time
-        def index_query(value):
-            if hasattr(value, 'eq'):
-                i = len(value) + index
-                return value.eq(i)
-            elif isinstance(value, Sequence) and len(value) + index > -1:
-                return value[index]
-            else:
-                elm = ensure_pq(elm)
-                i = len(elm) + index
-                elm.eq(i)
-    return index_query
+        if hasattr(value, 'eq'):
+            i = len(value) + index
+            # out of range, `eq()` would wrap a negative index around
+            return value.eq(i if i > -1 else len(value))
+        elif isinstance(value, Sequence) and len(value) + index > -1:
+            return value[index]
+        else:
+            elm = ensure_pq(value)
+            i = len(elm) + index
+            return elm.eq(i if i > -1 else len(elm))
+
+
+def make_index_query(index_str):
+    return _IndexQuery(int(index_str))
+
+
+class _MatchTranslatorMixin(object):
+    """
+    Translates each selector to a single location step which tests the matched
+    element's ancestors and preceding siblings, ex: ``a[ancestor::li]`` for
+    ``li a``, instead of a path walking down from the context. libxml2 finds
+    the positional matches of these in one pass over the descendants.
+    """
+
+    def xpath_descendant_combinator(self, left, right):
+        return right.add_condition('ancestor::%s' % left)
+
+    def xpath_child_combinator(self, left, right):
+        return right.add_condition('parent::%s' % left)
+
+    def xpath_direct_adjacent_combinator(self, left, right):
+        return right.add_condition('preceding-sibling::*[1][self::%s]' % left)
+
+    def xpath_indirect_adjacent_combinator(self, left, right):
+        return right.add_condition('preceding-sibling::%s' % left)
+
+
+_DEFAULT_TRANSLATOR = PyQuery._translator_class(xhtml=False)
+
+_ATTR_ALIASES = {'class_': 'class', 'for_': 'for'}
+
+# match translators by the translator class they extend
+_match_translators = {}
+
+
+def _match_xpath(translator, selector):
+    """The single step XPath for ``selector``, or `None` if it depends on positions."""
+    cls = translator.__class__
+    match_cls = _match_translators.get(cls)
+    if match_cls is None:
+        match_cls = _match_translators[cls] = type('Match' + cls.__name__,
+                                                   (_MatchTranslatorMixin, cls), {})
+    # the same as `PyQuery._css_to_xpath`
+    xpath = match_cls(xhtml=translator.xhtml).css_to_xpath(selector.replace('[@', '['),
+                                                           'descendant-or-self::')
+    if 'position()' in xpath or 'last()' in xpath:
+        # ex: the jQuery `:first` pseudo-class, which counts the nodes of a step
+        return None
+    return xpath
+
+
+class _IndexedFinder(object):
+    """
+    Finds the indexed match of ``selector`` in an element or `PyQuery` as a
+    list, using a positional XPath which libxml2 stops evaluating at the
+    requested match, or walks from the end for negative indexes, instead of
+    collecting all the matches.
+    """
+    __slots__ = ('selector', 'position', 'css_query', 'index_query', 'xpaths')
+
+    def __init__(self, selector, index):
+        self.selector = selector
+        if index > -1:
+            self.position = str(index + 1)
+        elif index == -1:
+            self.position = 'last()'
+        else:
+            self.position = 'last() - %d' % (-index - 1)
+        self.css_query = _CSSQuery(selector)
+        self.index_query = _IndexQuery(index)
+        # compiled XPaths by the translator, the namespaces and whether the context is a root
+        self.xpaths = {}
+
+    def _xpath(self, translator, namespaces, is_root):
+        key = (translator.__class__, translator.xhtml, is_root,
+               tuple(sorted(namespaces.items())) if namespaces else None)
+        xpath = self.xpaths.get(key)
+        if xpath is None:
+            # the ancestors and siblings a single step tests can be outside the context,
+            # except for a root element
+            path = _match_xpath(translator, self.selector) if is_root else None
+            if path is None:
+                # the same as `PyQuery._css_to_xpath`
+                path = translator.css_to_xpath(self.selector.replace('[@', '['),
+                                               'descendant-or-self::')
+            xpath = self.xpaths[key] = etree.XPath('(%s)[%s]' % (path, self.position),
+                                                   namespaces=namespaces)
+        return xpath
+
+    def prepare(self):
+        """Compiles the XPaths used for documents parsed as HTML, ex: before forking."""
+        self._xpath(_DEFAULT_TRANSLATOR, None, True)
+        self._xpath(_DEFAULT_TRANSLATOR, None, False)
+
+    def __call__(self, elm):
+        if isinstance(elm, etree._Element):
+            # what `PyQuery(elm)` would use
+            translator, namespaces = _DEFAULT_TRANSLATOR, None
+        else:
+            pq = ensure_pq(elm)
+            if len(pq) != 1 or not isinstance(pq[0], etree._Element):
+                # positions would be counted per element instead of over all the matches
+                return self.index_query(self.css_query(pq))
+            elm = pq[0]
+            translator, namespaces = pq._translator, pq_namespaces(pq)
+        return self._xpath(translator, namespaces, elm.getparent() is None)(elm)
+
+
+class _CSSIndexQuery(_Query):
+    """The CSS query and index accessor of ``$ <selector> | <index>`` as one query."""
+    __slots__ = ('css', 'index', '_find_indexed')
+
+    def __init__(self, css, index):
+        self.css = css
+        self.index = index
+        self._find_indexed = _IndexedFinder(css, index)
+
+    def _args(self):
+        return (self.css, self.index)
+
+    def prepare(self):
+        self._find_indexed.prepare()
+
+    @property
+    def selector(self):
+        return (self.css, self.index)
+
+    def __call__(self, elm):
+        pq = ensure_pq(elm)
+        return copy_pq(pq, self._find_indexed(pq))
+
+
+def make_css_index_query(selector, index_str):
+    return _CSSIndexQuery(selector, int(index_str))
+
+
+class _CSSAttrQuery(_Query):
+    """
+    The CSS query, index and attribute accessors of ``$ <selector> | <index>
+    [<attr>]`` as one query, which gets the attribute from the lxml element
+    without making `PyQuery` objects.
+    """
+    __slots__ = ('css', 'index', 'attr', '_find_indexed', '_attr_name')
+
+    def __init__(self, css, index, attr):
+        self.css = css
+        self.index = index
+        self.attr = attr
+        self._find_indexed = _IndexedFinder(css, index)
+        # the same names as `PyQuery.attr`
+        self._attr_name = _ATTR_ALIASES.get(attr, attr)
+
+    def _args(self):
+        return (self.css, self.index, self.attr)
+
+    def prepare(self):
+        self._find_indexed.prepare()
+
+    @property
+    def selector(self):
+        return (self.css, self.index, self.attr)
+
+    def __call__(self, elm):
+        found = self._find_indexed(elm)
+        return found[0].get(self._attr_name) if len(found) else None
+
+
+def make_css_attr_query(selector, index_str, attr):
+    return _CSSAttrQuery(selector, int(index_str), attr)
 
 
 def text_query(elm):
@@ -71,25 +306,62 @@ def own_text_query(elm):
                    if isinstance(item, string_types))
 
 
+class _AttrQuery(_Query):
+    # `attr` lets `take.peephole` merge it with a preceding CSS query
+    __slots__ = ('attr',)
+
+    def __init__(self, attr):
+        self.attr = attr
+
+    def _args(self):
+        return (self.attr,)
+
+    def __call__(self, elm):
+        return ensure_pq(elm).attr(self.attr)
+
+
 def make_attr_query(attr):
-    return lambda elm: ensure_pq(elm).attr(attr)
+    return _AttrQuery(attr)
+
+
+class _FieldQuery(_Query):
+    # `name_parts` is exposed for the static analysis in `take.schema`
+    __slots__ = ('name_parts', '_getter')
+
+    def __init__(self, name_parts):
+        self.name_parts = name_parts
+        self._getter = make_getter(name_parts)
+
+    def _args(self):
+        return (self.name_parts,)
+
+    def __call__(self, src):
+        return self._getter(src)
 
 
 def make_field_query(name):
-    name_list = split_name(name)
-    return lambda source: get_via_name_list(source, name_list)
+    return _FieldQuery(split_name(name))
 
 
 class ContextNode(object):
-    __slots__ = ('__depth', '__nodes', '__rv', '__value', 'last_value')
+    __slots__ = ('__depth', '__nodes', '__rv', '__value', '__memo', 'last_value')
 
     def __init__(self, depth, nodes):
         self.__depth = depth
         self.__nodes = nodes
         self.__rv = None
         self.__value = None
+        self.__memo = None
         self.last_value = None
 
+    @property
+    def depth(self):
+        return self.__depth
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
     @property
     def rv(self):
         return self.__rv
@@ -98,8 +370,18 @@ class ContextNode(object):
     def value(self):
         return self.__value
 
-    def do(self, context, rv=None, value=None, last_value=None):
+    @property
+    def memo(self):
+        return self.__memo
+
+    def __reduce__(self):
+        # the state of the last run isn't pickled
+        return ContextNode, (self.__depth, self.__nodes)
+
+    def do(self, context, rv=None, value=None, last_value=None, memo=None):
         self.__rv = rv if rv != None else context.rv
+        # the optional `SelectorMemo` is shared by all the contexts of an execution
+        self.__memo = memo if context is None else context.memo
         # value in a sub-context is derived from the last_value in the parent context
         self.__value = value if value != None else context.last_value
         self.last_value = last_value if last_value != None else self.__value
@@ -107,65 +389,152 @@ class ContextNode(object):
             node.do(self)
 
 
-class QueryNode(namedtuple('QueryNode', 'queries')):
+class _Frame(object):
+    """The state of a context being executed by `execute`, in place of its `ContextNode`."""
+    __slots__ = ('rv', 'value', 'last_value', 'memo', 'nodes', 'steps')
+
+    def __init__(self, ctx_node, rv, value, memo):
+        self.rv = rv
+        self.value = value
+        self.last_value = value
+        self.memo = memo
+        self.nodes = iter(ctx_node.nodes)
+        self.steps = None
+
+
+def execute(ctx_node, rv, value, memo=None):
+    """
+    Runs ``ctx_node`` like `ContextNode.do`, but with an explicit stack of
+    frames instead of recursing into sub-contexts, so the nesting depth isn't
+    limited by the recursion limit. Nodes with sub-contexts have a ``steps``
+    generator which yields the ``(sub_ctx_node, rv, value)`` to run.
+    """
+    stack = [_Frame(ctx_node, rv, value, memo)]
+    while stack:
+        frame = stack[-1]
+        if frame.steps is not None:
+            sub = next(frame.steps, None)
+            if sub is None:
+                frame.steps = None
+            else:
+                sub_ctx_node, sub_rv, sub_value = sub
+                stack.append(_Frame(sub_ctx_node, sub_rv, sub_value, frame.memo))
+            continue
+        node = next(frame.nodes, None)
+        if node is None:
+            stack.pop()
+        elif isinstance(node, ContextNode):
+            # value in a sub-context is derived from the last_value in the parent context
+            stack.append(_Frame(node, frame.rv, frame.last_value, frame.memo))
+        elif hasattr(node, 'steps'):
+            frame.steps = node.steps(frame)
+        else:
+            node.do(frame)
+
+
+def nesting_depth(ctx_node):
+    """The deepest nesting of sub-contexts in ``ctx_node``, without recursing."""
+    deepest = 0
+    pending = [(ctx_node, 1)]
+    while pending:
+        ctx_node, depth = pending.pop()
+        deepest = max(deepest, depth)
+        for node in ctx_node.nodes:
+            sub_ctx_node = node if isinstance(node, ContextNode) else getattr(node, 'sub_ctx_node', None)
+            if sub_ctx_node is not None:
+                pending.append((sub_ctx_node, depth + 1))
+    return deepest
+
+
+class QueryNode(namedtuple('QueryNode', 'queries line_num')):
     __slots__ = ()
     def do(self, context):
         # start last_value based on context.value
         val = context.value
+        memo = context.memo
         # queries can be a sequence of queries
-        for query in self.queries:
-            val = query(val)
+        if memo is None:
+            for query in self.queries:
+                val = query(val)
+        else:
+            for query in self.queries:
+                val = memo.query(query, val)
         # update context.last_value
         context.last_value = val
 
 
-class ChainedMapping(MutableMapping):
+_MISSING = object()
+
+
+class ScopeTable(MutableMapping):
     """
-    A dictionary that looks for a specific key and if it's not present looks for
-    it on it's parent
+    A flat dictionary for names defined in nested scopes. Setting a name in an
+    inner scope records the shadowed value in an undo log, and leaving the
+    scope restores the values set since it was entered. Lookups are a single
+    dict lookup and a scope which defines nothing costs nothing.
     """
 
-    def __init__(self, parent=None, *args, **kwargs):
-        self.parent = parent or {}
-        self.store = {}
-        if args:
-            self.update(*args)
-        if kwargs:
-            self.update(**kwargs)
+    def __init__(self, *args, **kwargs):
+        self._store = {}
+        self._undo = []
+        if args or kwargs:
+            self.update(*args, **kwargs)
 
     def __getitem__(self, key):
-        if key in self.store:
-            return self.store[key]
-        return self.parent[key]
+        return self._store[key]
 
     def __setitem__(self, key, value):
-        self.store[key] = value
+        self._undo.append((key, self._store.get(key, _MISSING)))
+        self._store[key] = value
 
     def __delitem__(self, key):
-        del self.store[key]
+        self._undo.append((key, self._store.pop(key)))
+
+    def __contains__(self, key):
+        return key in self._store
 
     def __iter__(self):
-        return chain(iter(self.store), iter(self.parent))
+        return iter(self._store)
 
     def __len__(self):
-        return len(self.store) + len(self.parent)
+        return len(self._store)
+
+    def get(self, key, default=None):
+        return self._store.get(key, default)
+
+    def enter_scope(self):
+        """Returns the marker to pass to `leave_scope`."""
+        return len(self._undo)
+
+    def leave_scope(self, marker):
+        """Undoes the changes made since `enter_scope` returned ``marker``."""
+        store = self._store
+        undo = self._undo
+        while len(undo) > marker:
+            key, value = undo.pop()
+            if value is _MISSING:
+                del store[key]
+            else:
+                store[key] = value
 
-    def make_child(self, *args, **kwargs):
-        return ChainedMapping(self, *args, **kwargs)
 
-    def destroy(self, *args, **kwargs):
-        self.parent = None
-        self.store = None
+# a directive's sub-context, parsed by the parse loop (see `ContextParser.parse_sub_context`)
+_PendingSubContext = namedtuple('_PendingSubContext', 'parser build')
 
 
 class ContextParser(object):
 
-    def __init__(self, depth, tok_gen, defs=None, from_inline=False):
+    def __init__(self, depth, tok_gen, defs=None, from_inline=False, base_dir=None):
         self._depth = depth
         self._tok_generator = tok_gen
-        self._defs = defs or ChainedMapping()
+        self._defs = defs if defs is not None else ScopeTable()
+        # the defs made in this context are removed when it's destroyed
+        self._defs_marker = self._defs.enter_scope()
         self._from_inline = from_inline
+        # directory `import:` paths are relative to
+        self._base_dir = base_dir
         self._nodes = None
+        self._end_tok = None
         self._tok = None
         self._is_done = False
 
@@ -181,12 +550,17 @@ class ContextParser(object):
     def tok(self):
         return self._tok
 
+    @property
+    def base_dir(self):
+        return self._base_dir
+
     def destroy(self):
         self._depth = None
         self._tok_generator = None
-        self._defs.destroy()
+        self._defs.leave_scope(self._defs_marker)
         self._defs = None
         self._nodes = None
+        self._end_tok = None
         self._tok = None
         self._is_done = None
 
@@ -194,16 +568,37 @@ class ContextParser(object):
     def parse(self):
         if self._is_done:
             raise AlreadyParsedError
-        self._nodes = []
-        tok = self._parse()
-        return ContextNode(self._depth, self._nodes), tok
+        # sub-contexts are parsed with an explicit stack of the parsers' steps, instead of
+        # recursing, so the nesting depth of templates isn't limited by the recursion limit
+        stack = [(self, self._steps())]
+        result = None
+        while stack:
+            parser, steps = stack[-1]
+            try:
+                sub_ctx = steps.send(result)
+            except StopIteration:
+                stack.pop()
+                result = ContextNode(parser._depth, parser._nodes), parser._end_tok
+                continue
+            result = None
+            stack.append((sub_ctx, sub_ctx._steps()))
+        return result
+
+
+    def parse_sub_context(self, build):
+        """
+        For directives with a sub-context, returns the ``(end_tok, node)`` for
+        the sub-context starting at the current context token. It's parsed by
+        the parse loop, which then calls ``build(sub_ctx_node)`` in this
+        context to make the directive's node (or `None`).
+        """
+        return None, _PendingSubContext(self.spawn_context_parser(), build)
 
 
     def spawn_context_parser(self, depth=None, from_inline=False):
         if depth == None:
             depth = self._tok.end
-        defs = self._defs.make_child()
-        return ContextParser(depth, self._tok_generator, defs, from_inline)
+        return ContextParser(depth, self._tok_generator, self._defs, from_inline, self._base_dir)
 
 
     def next_tok(self, eof_errors=True):
@@ -216,7 +611,14 @@ class ContextParser(object):
             if eof_errors:
                 raise UnexpectedEOFError
 
-    def _parse(self):
+    def _steps(self):
+        """
+        Generator which parses this context, yielding the parsers of sub-contexts to the
+        `parse` loop and receiving their ``(node, end_tok)``. The end token is set on
+        `_end_tok` when done.
+        """
+        self._nodes = []
+        self._end_tok = None
         while True:
             tok = self.next_tok()
             if tok.type_ == TokenType.QueryStatement:
@@ -224,7 +626,14 @@ class ContextParser(object):
                 tok = None
             elif tok.type_ == TokenType.DirectiveStatement:
                 # some directives consume a context token to determine if they end (eg SaveEachNode)
-                tok = self._parse_directive()
+                tok, pending = self._parse_directive()
+                if pending is not None:
+                    sub_ctx_node, tok = yield pending.parser
+                    pending.parser.destroy()
+                    node = pending.build(sub_ctx_node)
+                    if node != None:
+                        # node is `None` for `def:` subroutines
+                        self._nodes.append(node)
             else:
                 raise UnexpectedTokenError(tok.type_,
                                           (TokenType.QueryStatement, TokenType.DirectiveStatement),
@@ -232,14 +641,17 @@ class ContextParser(object):
             if not tok:
                 tok = self.next_tok(eof_errors=False)
             if self._is_done:
-                # returning None means EOF ended this context, not a context exit
+                # a None end token means EOF ended this context, not a context exit
                 return
             if tok.type_ not in (TokenType.Context, TokenType.InlineSubContext):
                 raise UnexpectedTokenError(self._tok.type_,
                                            (TokenType.Context, TokenType.InlineSubContext),
                                            token=tok)
             if tok.type_ == TokenType.InlineSubContext:
-                end_tok = self._parse_inline_context()
+                sub_ctx = self.spawn_context_parser(self._depth, True)
+                sub_ctx_node, end_tok = yield sub_ctx
+                self._nodes.append(sub_ctx_node)
+                sub_ctx.destroy()
                 if not end_tok:
                     # reached EOF
                     return
@@ -251,7 +663,10 @@ class ContextParser(object):
                     # sub-context, releases to the parent context or continues in this context
                     tok = end_tok
             if tok.end > self._depth:
-                end_tok = self._parse_context()
+                sub_ctx = self.spawn_context_parser()
+                sub_ctx_node, end_tok = yield sub_ctx
+                self._nodes.append(sub_ctx_node)
+                sub_ctx.destroy()
                 if not end_tok:
                     # end_tok is either the last token grabbed by the sub-context or None, if it is
                     # None, then we have reached EOF
@@ -265,28 +680,18 @@ class ContextParser(object):
                 # sub-context with indent+4 but exit with indent+2, so, exit the sub-context but
                 # would be in another sub-context (prob should not allow)
             if tok.end < self._depth:
-                return tok
+                self._end_tok = tok
+                return
             # context token is the same depth as the current context parser
             # exit if the current context parse was created from an inline context
             # (they only persist when the context token is deeper)
             if self._from_inline:
-                return tok
-
-    def _parse_context(self):
-        sub_ctx = self.spawn_context_parser()
-        sub_ctx_node, tok = sub_ctx.parse()
-        self._nodes.append(sub_ctx_node)
-        sub_ctx.destroy()
-        return tok
-
-    def _parse_inline_context(self):
-        sub_ctx = self.spawn_context_parser(self._depth, True)
-        sub_ctx_node, tok = sub_ctx.parse()
-        self._nodes.append(sub_ctx_node)
-        sub_ctx.destroy()
-        return tok
+                self._end_tok = tok
+                return
 
     def _parse_query(self):
+        # the QueryStatement token
+        line_num = self._tok.line_num
         self.next_tok()
         if self._tok.type_ == TokenType.CSSSelector:
             queries = self._parse_css_selector()
@@ -299,33 +704,40 @@ class ContextParser(object):
         else:
             raise UnexpectedTokenError(self._tok.type_, (TokenType.CSSSelector,
                                                          TokenType.AccessorSequence))
-        node = QueryNode(queries)
+        node = QueryNode(queries, line_num)
         self._nodes.append(node)
 
     def _parse_css_selector(self):
         selector = self._tok.content.strip()
-        # expects a valid css selector
-        query = make_css_query(selector)
         self.next_tok()
         if self._tok.type_ == TokenType.QueryStatementEnd:
-            return (query,)
+            # expects a valid css selector
+            return (make_css_query(selector),)
         elif self._tok.type_ == TokenType.AccessorSequence:
-            return (query,) + self._parse_accessor_seq()
+            return self._parse_accessor_seq(selector)
         else:
             raise UnexpectedTokenError(self._tok.type_, (TokenType.QueryStatementEnd,
                                                          TokenType.AccessorSequence))
 
-    def _parse_accessor_seq(self):
+    def _parse_accessor_seq(self, selector=None):
+        # the CSS selector preceding the accessors, if any, is the first query
         queries = ()
         tok = self.next_tok()
         # index accessor has to be first
-        if tok.type_ == TokenType.IndexAccessor:
+        has_index = tok.type_ == TokenType.IndexAccessor
+        if has_index:
             index_str = tok.content
-            queries = (make_index_query(index_str),)
+            if selector is None:
+                queries = (make_index_query(index_str),)
+            else:
+                # stops at the indexed match instead of finding all of them
+                queries = (make_css_index_query(selector, index_str),)
             tok = self.next_tok()
             # index accessor can be the only accessor
             if tok.type_ == TokenType.QueryStatementEnd:
                 return queries
+        elif selector is not None:
+            queries = (make_css_query(selector),)
         # text accessor
         if tok.type_ == TokenType.TextAccessor:
             queries += (text_query,)
@@ -354,7 +766,7 @@ class ContextParser(object):
                 TokenType.AttrAccessor,
                 TokenType.FieldAccessor,
             )
-            if not queries:
+            if not has_index:
                 expected += (TokenType.IndexAccessor,)
             raise UnexpectedTokenError(tok.type_, expected, token=tok)
         # can only have one of text accessor or attr accessor, so do not need to loop
@@ -383,13 +795,16 @@ class ContextParser(object):
         name = tok.content.strip()
         if name in BUILTIN_DIRECTIVES:
             end_tok, node = BUILTIN_DIRECTIVES[name](self)
+            if isinstance(node, _PendingSubContext):
+                return end_tok, node
             if node != None:
                 # node is `None` for `def:` subroutines
                 self._nodes.append(node)
-            return end_tok
+            return end_tok, None
         def_node = self._defs.get(name)
         if def_node:
             self._parse_call_user_subroutine(def_node)
+            return None, None
         else:
             raise InvalidDirectiveError(name, 'Unknown directive: %s' % name)
 
@@ -401,7 +816,13 @@ class ContextParser(object):
             raise UnexpectedTokenError(tok.type_, TokenType.DirectiveStatementEnd, token=tok)
 
 
-def parse(src):
+def parse(src, base_dir=None, exports=None, defs=None):
+    """
+    Parses the template ``src``. Relative ``import:`` paths are resolved from
+    ``base_dir``, the current directory by default. ``defs`` are subroutines,
+    by name, to make available to the template. If ``exports`` is given, the
+    top-level subroutines are added to it.
+    """
     if isinstance(src, string_types):
         fobj = StringIO(src)
     else:
@@ -411,8 +832,10 @@ def parse(src):
     tok = next(tok_generator)
     if tok.type_ != TokenType.Context:
         raise UnexpectedTokenError(tok.type_, TokenType.Context, 'Leading context token not found')
-    ctx_parser = ContextParser(tok.end, tok_generator)
+    ctx_parser = ContextParser(tok.end, tok_generator, ScopeTable(defs or ()), base_dir=base_dir)
     node, last_tok = ctx_parser.parse()
+    if exports is not None:
+        exports.update(ctx_parser.defs)
     ctx_parser.destroy()
     if last_tok:
         raise UnexpectedTokenError(last_tok, 'EOF')
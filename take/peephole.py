@@ -0,0 +1,135 @@
+"""
+Peephole optimizations, rewriting short sequences of queries and directives
+which are common in templates into single operations:
+
+- ``shrink`` right after a query is run as the query's last step, and
+  ``| text`` or ``| own_text`` followed by ``shrink`` is one query.
+
+- A CSS query followed by an attribute accessor, ex: ``$ a | [href]`` or
+  ``$ a | 0 [href]``, finds the match with a positional XPath and gets the
+  attribute from the lxml element, without making `PyQuery` objects.
+
+- A ``save each`` whose sub-context is one query and the saves of its value,
+  ex: ``save each: items ; | text ; : title``, runs the query for each item
+  without running a sub-context.
+
+The results are the same as for the nodes they replace.
+"""
+from ._compat import string_types
+from .directives import _ShrinkNode, _SaveNode, _SaveEachNode, _SaveEachValueNode, \
+     shrink_query
+from .inline import _last_value_unused
+from .parser import ContextNode, QueryNode, _AttrQuery, make_css_attr_query, text_query, \
+     own_text_query
+from .prune import _same_or_new
+
+
+def shrunk_text_query(elm):
+    return shrink_query(text_query(elm))
+
+
+def shrunk_own_text_query(elm):
+    return shrink_query(own_text_query(elm))
+
+
+_SHRUNK_QUERIES = {
+    text_query: shrunk_text_query,
+    own_text_query: shrunk_own_text_query,
+}
+
+
+def _css_match(query):
+    """The ``(selector, index)`` of a CSS query's match used by an attribute accessor."""
+    selector = getattr(query, 'selector', None)
+    if isinstance(selector, string_types):
+        # the attribute accessor uses the first match
+        return selector, 0
+    if isinstance(selector, tuple) and len(selector) == 2:
+        return selector
+    return None
+
+
+def fuse_queries(queries):
+    """Returns the ``queries`` with the common pairs of queries fused."""
+    fused = []
+    for query in queries:
+        prev = fused[-1] if fused else None
+        if query is shrink_query and prev in _SHRUNK_QUERIES:
+            fused[-1] = _SHRUNK_QUERIES[prev]
+        elif isinstance(query, _AttrQuery) and prev is not None and _css_match(prev):
+            selector, index = _css_match(prev)
+            fused[-1] = make_css_attr_query(selector, str(index), query.attr)
+        else:
+            fused.append(query)
+    return tuple(fused)
+
+
+def _shrinks_value(ctx_node):
+    """True for a sub-context which is ``shrink`` and sub-contexts using its value."""
+    nodes = ctx_node.nodes
+    return (bool(nodes) and isinstance(nodes[0], _ShrinkNode) and
+            all(isinstance(node, ContextNode) for node in nodes[1:]))
+
+
+def _saves_query_value(ctx_node):
+    """True for a sub-context which is one query and the saves of its value."""
+    nodes = ctx_node.nodes
+    return (len(nodes) == 2 and isinstance(nodes[0], QueryNode) and
+            isinstance(nodes[1], ContextNode) and bool(nodes[1].nodes) and
+            all(isinstance(node, _SaveNode) for node in nodes[1].nodes))
+
+
+class _Peephole(object):
+
+    def __init__(self):
+        # rewritten nodes with sub-contexts, by id of the original since the call sites
+        # of a subroutine share it
+        self.defs = {}
+
+    def sub_context(self, node):
+        sub_ctx_node = self.context(node.sub_ctx_node)
+        if sub_ctx_node is not node.sub_ctx_node:
+            node = node._replace(sub_ctx_node=sub_ctx_node)
+        return node
+
+    def context(self, ctx_node):
+        nodes = []
+        src_nodes = ctx_node.nodes
+        i = 0
+        while i < len(src_nodes):
+            node = src_nodes[i]
+            if isinstance(node, QueryNode):
+                queries = node.queries
+                if (i + 1 < len(src_nodes) and isinstance(src_nodes[i + 1], ContextNode) and
+                        _shrinks_value(src_nodes[i + 1]) and
+                        _last_value_unused(src_nodes[i + 2:])):
+                    # the sub-contexts after the shrink get the shrunk value from the
+                    # query instead
+                    nodes.append(QueryNode(fuse_queries(queries + (shrink_query,)),
+                                           node.line_num))
+                    nodes.extend(self.context(sub) for sub in src_nodes[i + 1].nodes[1:])
+                    i += 2
+                    continue
+                fused = fuse_queries(queries)
+                if fused != queries:
+                    node = QueryNode(fused, node.line_num)
+            elif isinstance(node, ContextNode):
+                node = self.context(node)
+            elif isinstance(node, _SaveEachNode):
+                node = self.sub_context(node)
+                if _saves_query_value(node.sub_ctx_node):
+                    node = _SaveEachValueNode(*node)
+            elif hasattr(node, 'sub_ctx_node'):
+                # the same subroutine is referenced from every call site
+                rewritten = self.defs.get(id(node))
+                if rewritten is None:
+                    rewritten = self.defs[id(node)] = self.sub_context(node)
+                node = rewritten
+            nodes.append(node)
+            i += 1
+        return _same_or_new(ctx_node, nodes)
+
+
+def peephole(ctx_node):
+    """Returns a copy of the parsed ``ctx_node`` with the peephole optimizations applied."""
+    return _Peephole().context(ctx_node)
@@ -0,0 +1,62 @@
+"""
+Preloading templates in a server's parent process, before it forks its
+workers. The templates are parsed and compiled, what their queries would
+build on first use is built, and the objects are moved out of the garbage
+collector's reach with `gc.freeze`, so collections in the workers don't
+write to the pages they share with the parent.
+"""
+import gc
+from collections import OrderedDict
+
+from .parser import ContextNode, QueryNode, _Query
+from .take_template import TakeTemplate
+
+
+def prepare_node(ctx_node):
+    """Builds the lazily built state of the queries in ``ctx_node``, without recursing."""
+    pending = [ctx_node]
+    while pending:
+        ctx_node = pending.pop()
+        for node in ctx_node.nodes:
+            if isinstance(node, ContextNode):
+                pending.append(node)
+                continue
+            if isinstance(node, QueryNode):
+                for query in node.queries:
+                    if isinstance(query, _Query):
+                        query.prepare()
+            sub_ctx_node = getattr(node, 'sub_ctx_node', None)
+            if sub_ctx_node is not None:
+                pending.append(sub_ctx_node)
+
+
+def freeze():
+    """
+    Collects garbage, then moves all the objects to the permanent generation
+    which collections skip. Does nothing on Python versions without
+    `gc.freeze`, before 3.7.
+    """
+    gc_freeze = getattr(gc, 'freeze', None)
+    if gc_freeze is None:
+        return False
+    gc.collect()
+    gc_freeze()
+    return True
+
+
+def preload(paths, freeze_gc=True, **kwargs):
+    """
+    Returns an `OrderedDict` of the templates at ``paths``, by path, ready to
+    be shared with forked workers. ``kwargs`` are passed to
+    `TakeTemplate.from_file`, ``iterative`` defaults to true since the
+    recursive run stores its state on the shared nodes. Unless ``freeze_gc``
+    is false, the objects are frozen with `gc.freeze`, which should be the
+    last thing done before forking.
+    """
+    kwargs.setdefault('iterative', True)
+    templates = OrderedDict((path, TakeTemplate.from_file(path, **kwargs)) for path in paths)
+    for tmpl in templates.values():
+        prepare_node(tmpl.node)
+    if freeze_gc:
+        freeze()
+    return templates
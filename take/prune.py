@@ -0,0 +1,210 @@
+"""
+Pruning of parsed node trees down to the nodes that contribute to some of the
+result keys.
+
+Requested keys are given as a tree of dicts (see `request_tree`) where `None`
+means everything under that key. A node is kept if it saves to a requested
+key, contains nodes that do, or produces the value a kept sub-context uses.
+"""
+from .directives import _SaveNode, _SaveEachNode, _NamespaceNode, _DefSubroutine, \
+     _CustomAccessor, _MergeNode, _ShrinkNode, _RxMatchNode, _merge_node
+from .parser import ContextNode, QueryNode
+from .utils import split_name, Done, trampoline
+
+
+_SKIP = object()
+
+# nodes which only set the context's last_value, they are only needed when a
+# following sub-context uses it
+_PRODUCERS = (QueryNode, _DefSubroutine, _CustomAccessor, _ShrinkNode)
+
+
+def request_tree(names):
+    """
+    Makes the requested keys tree from dotted names, ex: ``['a', 'b.c']`` is
+    ``{'a': None, 'b': {'c': None}}``.
+    """
+    tree = {}
+    for name in names:
+        parts = split_name(name) if not isinstance(name, tuple) else name
+        scope = tree
+        for part in parts[:-1]:
+            sub = scope.get(part, {})
+            if sub is None:
+                # already requesting everything under the parent key
+                break
+            scope = scope.setdefault(part, sub)
+        else:
+            scope[parts[-1]] = None
+    return tree
+
+
+def _sub_request(request, name_parts):
+    for part in name_parts:
+        if request is None:
+            return None
+        if part not in request:
+            return _SKIP
+        request = request[part]
+    return request
+
+
+def _prune_merge(node, request):
+    if node.save_all:
+        return node
+    names = tuple(name_parts for name_parts in node.names_to_save
+                  if _sub_request(request, name_parts) is not _SKIP)
+    if not names:
+        return None
+    if names == node.names_to_save:
+        return node
+    return _merge_node(names, False)
+
+
+def _same_or_new(ctx_node, nodes):
+    """
+    Re-uses ``ctx_node`` if ``nodes`` are its nodes, so unchanged subtrees (ex:
+    from imported libraries) stay shared.
+    """
+    if len(nodes) == len(ctx_node.nodes) and all(a is b for a, b in zip(nodes, ctx_node.nodes)):
+        return ctx_node
+    return ContextNode(ctx_node.depth, nodes)
+
+
+def _with_sub_ctx(node, sub_ctx_node):
+    return node if sub_ctx_node is node.sub_ctx_node else node._replace(sub_ctx_node=sub_ctx_node)
+
+
+class _Pruning(object):
+    """
+    State for one pruning pass. ``removed`` collects the dropped nodes and, if
+    ``defs`` is given, the bodies of subroutines are pruned too (memoized by
+    the id of the subroutine node since they're shared by all call sites).
+    """
+
+    def __init__(self, removed=None, defs=None):
+        self.removed = removed
+        self.defs = defs
+
+    def drop(self, node):
+        if self.removed is not None:
+            self.removed.append(node)
+
+    def subroutine(self, node):
+        return trampoline(self._subroutine(node))
+
+    def context(self, ctx_node, request):
+        """Returns the pruned ``ctx_node``, or `None` when nothing in it contributes."""
+        return trampoline(self._context(ctx_node, request))
+
+    def _subroutine(self, node):
+        if self.defs is None:
+            yield Done(node)
+            return
+        pruned = self.defs.get(id(node))
+        if pruned is None:
+            # results of subroutines are used as a whole
+            sub_ctx_node = ((yield self._context(node.sub_ctx_node, None)) or
+                            ContextNode(node.sub_ctx_node.depth, []))
+            pruned = self.defs[id(node)] = _with_sub_ctx(node, sub_ctx_node)
+        yield Done(pruned)
+
+    def _node(self, node, request):
+        """Yields the pruned node, or `None` when it doesn't contribute."""
+        if isinstance(node, ContextNode):
+            yield Done((yield self._context(node, request)))
+        elif isinstance(node, _SaveNode):
+            yield Done(node if _sub_request(request, node.ident_parts) is not _SKIP else None)
+        elif isinstance(node, _SaveEachNode):
+            sub_request = _sub_request(request, node.ident_parts)
+            if sub_request is _SKIP:
+                yield Done(None)
+                return
+            # the list is requested even if none of the item keys are
+            sub_ctx_node = ((yield self._context(node.sub_ctx_node, sub_request)) or
+                            ContextNode(node.sub_ctx_node.depth, []))
+            yield Done(_with_sub_ctx(node, sub_ctx_node))
+        elif isinstance(node, _NamespaceNode):
+            sub_request = _sub_request(request, node.ident_parts)
+            if sub_request is _SKIP:
+                yield Done(None)
+                return
+            sub_ctx_node = yield self._context(node.sub_ctx_node, sub_request)
+            if sub_ctx_node is None:
+                if sub_request is not None:
+                    yield Done(None)
+                    return
+                # still saves an empty dict
+                sub_ctx_node = ContextNode(node.sub_ctx_node.depth, [])
+            yield Done(_with_sub_ctx(node, sub_ctx_node))
+        elif isinstance(node, _RxMatchNode):
+            sub_ctx_node = yield self._context(node.sub_ctx_node, request)
+            yield Done(_with_sub_ctx(node, sub_ctx_node) if sub_ctx_node else None)
+        elif isinstance(node, _MergeNode):
+            yield Done(_prune_merge(node, request))
+        else:
+            # anything else could have side effects, keep it
+            yield Done(node)
+
+    def _context(self, ctx_node, request):
+        nodes = []
+        last_value_used = False
+        # walk backwards, so it's known if a sub-context uses a last_value
+        for node in reversed(ctx_node.nodes):
+            if isinstance(node, _PRODUCERS):
+                if not last_value_used:
+                    self.drop(node)
+                    continue
+                # earlier producers are overwritten by this one
+                last_value_used = False
+                if isinstance(node, (_DefSubroutine, _CustomAccessor)):
+                    node = yield self._subroutine(node)
+            else:
+                pruned = yield self._node(node, request)
+                if pruned is None:
+                    self.drop(node)
+                    continue
+                node = pruned
+                if isinstance(node, ContextNode):
+                    last_value_used = True
+            nodes.append(node)
+        if not nodes:
+            yield Done(None)
+            return
+        nodes.reverse()
+        yield Done(_same_or_new(ctx_node, nodes))
+
+
+def prune(ctx_node, request):
+    """
+    Returns a copy of ``ctx_node`` with only the nodes contributing to the
+    ``request`` keys tree, or `None` if nothing in it does.
+    """
+    return _Pruning().context(ctx_node, request)
+
+
+def _line_nums(nodes):
+    for node in nodes:
+        if isinstance(node, QueryNode):
+            # inlined accessors don't have a line
+            if node.line_num is not None:
+                yield node.line_num
+        elif isinstance(node, ContextNode):
+            for line_num in _line_nums(node.nodes):
+                yield line_num
+        elif isinstance(node, (_NamespaceNode, _RxMatchNode, _SaveEachNode)):
+            for line_num in _line_nums((node.sub_ctx_node,)):
+                yield line_num
+
+
+def eliminate_dead_code(ctx_node):
+    """
+    Removes the queries and sub-contexts which have no effect on the results,
+    including in subroutines. Returns the new node and the sorted line numbers
+    of the removed queries.
+    """
+    removed = []
+    node = _Pruning(removed, {}).context(ctx_node, None)
+    if node is None:
+        node = ContextNode(ctx_node.depth, [])
+    return node, sorted(set(_line_nums(removed)))
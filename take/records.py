@@ -0,0 +1,211 @@
+"""
+Compact, ``__slots__`` based result records.
+
+The keys a template saves are known once it is parsed, so instead of a ``dict``
+per ``save each`` item, ``namespace`` and ``def`` result, a record type with one
+slot per key can be generated for each of those scopes. Records behave like
+read/write mappings and ``Record.to_dict()`` converts them (deeply) to the
+plain ``dict`` results a template produces by default.
+"""
+from .directives import _SaveEachNode, _NamespaceNode, _DefSubroutine, _RxMatchNode
+from .parser import ContextNode
+from .schema import SCALAR, walk, def_schema
+
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+_UNSET = object()
+
+
+class Record(object):
+    """
+    Base class for the generated record types. Keys the template does not
+    declare statically (ex: from ``merge: *``) are kept in an overflow dict.
+    """
+    __slots__ = ('_extra',)
+
+    _fields = ()
+    _slot_names = {}
+    _child_types = {}
+
+    def __getitem__(self, key):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        slot = self._slot_names.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+        else:
+            extra = getattr(self, '_extra', None)
+            if extra is None:
+                extra = self._extra = {}
+            extra[key] = value
+
+    def __delitem__(self, key):
+        slot = self._slot_names.get(key)
+        try:
+            if slot is not None:
+                delattr(self, slot)
+            else:
+                del self._extra[key]
+        except (AttributeError, KeyError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.get(key, _UNSET) is not _UNSET
+
+    def __iter__(self):
+        for key in self._fields:
+            if hasattr(self, self._slot_names[key]):
+                yield key
+        extra = getattr(self, '_extra', None)
+        if extra:
+            for key in extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.to_dict())
+
+    def __reduce__(self):
+        # generated types are not importable, so pickle as the plain result
+        return (dict, (self.to_dict(),))
+
+    def get(self, key, default=None):
+        slot = self._slot_names.get(key)
+        if slot is not None:
+            return getattr(self, slot, default)
+        extra = getattr(self, '_extra', None)
+        if extra is None:
+            return default
+        return extra.get(key, default)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def update(self, other):
+        for key in other.keys():
+            self[key] = other[key]
+
+    def make_child(self, name_parts):
+        """
+        Makes the empty container for the value saved at ``name_parts``, which
+        is a record when the template declares keys for it.
+        """
+        child_type = type(self)
+        for part in name_parts:
+            child_type = child_type._child_types.get(part)
+            if child_type is None:
+                return {}
+        return child_type()
+
+    def to_dict(self):
+        return dict((key, _to_plain(value)) for key, value in self.items())
+
+
+MutableMapping.register(Record)
+
+
+def _to_plain(value):
+    # exact type checks, `PyQuery` values are lists too
+    if isinstance(value, Record):
+        return value.to_dict()
+    elif type(value) is list:
+        return [_to_plain(item) for item in value]
+    elif type(value) is dict:
+        return dict((key, _to_plain(val)) for key, val in value.items())
+    return value
+
+
+def make_record_type(name, fields, child_types=None):
+    """
+    Makes a `Record` subclass with a slot for each of ``fields``. Slots are
+    named positionally since keys need not be valid identifiers.
+    """
+    fields = tuple(fields)
+    slot_names = dict((field, '_%d' % i) for i, field in enumerate(fields))
+    attrs = {
+        '__slots__': tuple(slot_names[field] for field in fields),
+        '_fields': fields,
+        '_slot_names': slot_names,
+        '_child_types': dict(child_types or {}),
+    }
+    return type(str(name), (Record,), attrs)
+
+
+def record_type(schema, name='Record'):
+    """
+    Makes the record type for a dict `take.schema` schema, with child types for
+    the keys holding dicts.
+    """
+    child_types = dict((key, record_type(sub, '%s_%s' % (name, key)))
+                       for key, sub in schema.items()
+                       if isinstance(sub, dict))
+    return make_record_type(name, schema.keys(), child_types)
+
+
+def _type_name(name_parts):
+    return '_'.join(('Record',) + tuple(name_parts))
+
+
+def _with_records(ctx_node, defs, schema_defs):
+    """
+    Returns a copy of the node tree where ``save each`` and ``def`` nodes make
+    records, namespaces and dotted names get theirs via `Record.make_child`.
+    """
+    nodes = []
+    for node in ctx_node.nodes:
+        if isinstance(node, ContextNode):
+            node = _with_records(node, defs, schema_defs)
+        elif isinstance(node, (_NamespaceNode, _RxMatchNode)):
+            node = node._replace(sub_ctx_node=_with_records(node.sub_ctx_node, defs, schema_defs))
+        elif isinstance(node, _SaveEachNode):
+            item_schema = {}
+            walk(node.sub_ctx_node, item_schema, SCALAR, schema_defs)
+            node = node._replace(sub_ctx_node=_with_records(node.sub_ctx_node, defs, schema_defs),
+                                 rv_type=record_type(item_schema, _type_name(node.ident_parts)))
+        elif isinstance(node, _DefSubroutine):
+            # the same subroutine is referenced from every call site
+            if id(node) not in defs:
+                rv_type = record_type(def_schema(node, schema_defs), 'Record_def')
+                sub_ctx_node = _with_records(node.sub_ctx_node, defs, schema_defs)
+                defs[id(node)] = node._replace(sub_ctx_node=sub_ctx_node, rv_type=rv_type)
+            node = defs[id(node)]
+        nodes.append(node)
+    return ContextNode(ctx_node.depth, nodes)
+
+
+def with_records(node):
+    """
+    Returns ``(node, rv_type)``, a copy of the parsed ``node`` that saves into
+    records, and the record type to use for the top-level result.
+    """
+    schema_defs = {}
+    schema = {}
+    walk(node, schema, SCALAR, schema_defs)
+    return _with_records(node, {}, schema_defs), record_type(schema)
@@ -0,0 +1,196 @@
+"""
+Static extraction of the result structure a template produces.
+
+The schema mirrors the result: a ``dict`` for each dict in the result (the
+top-level result, namespaces, dotted names, ``def`` results), a one item
+``list`` holding the item schema for ``save each`` lists and `SCALAR` for any
+other saved value.
+"""
+from .directives import _SaveNode, _SaveEachNode, _NamespaceNode, _DefSubroutine, \
+     _CustomAccessor, _MergeNode, _ShrinkNode, _RxMatchNode
+from .parser import ContextNode, QueryNode
+from .utils import Done, trampoline
+
+
+SCALAR = 'scalar'
+
+
+def _copy(schema):
+    copied = [None]
+    # (schema, dest, key), an explicit stack since schemas nest as deep as templates
+    pending = [(schema, copied, 0)]
+    while pending:
+        schema, dest, key = pending.pop()
+        if isinstance(schema, dict):
+            sub_dest = dest[key] = {}
+            for sub_key, sub in schema.items():
+                # keeps the key order
+                sub_dest[sub_key] = None
+                pending.append((sub, sub_dest, sub_key))
+        elif isinstance(schema, list):
+            sub_dest = dest[key] = [None]
+            pending.append((schema[0], sub_dest, 0))
+        else:
+            dest[key] = schema
+    return copied[0]
+
+
+def merge_schemas(first, second):
+    """
+    Merges two schemas for the same key into a new schema. Dicts and lists are
+    merged, a dict or list wins over `SCALAR`.
+    """
+    merged = [None]
+    pending = [(first, second, merged, 0)]
+    while pending:
+        first, second, dest, key = pending.pop()
+        if isinstance(first, dict) and isinstance(second, dict):
+            sub_dest = dest[key] = {}
+            for sub_key, sub in first.items():
+                sub_dest[sub_key] = None
+                if sub_key in second:
+                    pending.append((sub, second[sub_key], sub_dest, sub_key))
+                else:
+                    sub_dest[sub_key] = _copy(sub)
+            for sub_key, sub in second.items():
+                if sub_key not in first:
+                    sub_dest[sub_key] = _copy(sub)
+        elif isinstance(first, list) and isinstance(second, list):
+            sub_dest = dest[key] = [None]
+            pending.append((first[0], second[0], sub_dest, 0))
+        elif first == SCALAR:
+            dest[key] = _copy(second)
+        else:
+            dest[key] = _copy(first)
+    return merged[0]
+
+
+def get_via_schema(schema, name_parts):
+    """The schema of the value found at ``name_parts``, `SCALAR` when unknown."""
+    for part in name_parts:
+        if not isinstance(schema, dict) or part not in schema:
+            return SCALAR
+        schema = schema[part]
+    return schema
+
+
+def _add(scope, name_parts, schema):
+    for part in name_parts[:-1]:
+        sub = scope.get(part)
+        if not isinstance(sub, dict):
+            sub = scope[part] = {}
+        scope = sub
+    last = name_parts[-1]
+    scope[last] = merge_schemas(scope[last], schema) if last in scope else _copy(schema)
+
+
+def _descend(scope, name_parts):
+    for part in name_parts:
+        sub = scope.get(part)
+        if not isinstance(sub, dict):
+            sub = scope[part] = {}
+        scope = sub
+    return scope
+
+
+def _query_schema(queries, value_schema):
+    for query in queries:
+        name_parts = getattr(query, 'name_parts', None)
+        if name_parts is not None:
+            value_schema = get_via_schema(value_schema, name_parts)
+        else:
+            value_schema = SCALAR
+    return value_schema
+
+
+def def_schema(def_node, defs):
+    """The schema of the result of a ``def`` subroutine, memoized in ``defs``."""
+    return trampoline(_def_schema(def_node, defs))
+
+
+def _def_schema(def_node, defs):
+    schema = defs.get(id(def_node))
+    if schema is None:
+        schema = defs[id(def_node)] = {}
+        yield _walk(def_node.sub_ctx_node, schema, SCALAR, defs)
+    yield Done(schema)
+
+
+def walk(ctx_node, scope, value_schema, defs):
+    """
+    Adds the keys saved by ``ctx_node`` to the ``scope`` schema dict.
+    ``value_schema`` is the schema of the context's value.
+    """
+    trampoline(_walk(ctx_node, scope, value_schema, defs))
+
+
+def _walk(ctx_node, scope, value_schema, defs):
+    last_schema = value_schema
+    for node in ctx_node.nodes:
+        if isinstance(node, ContextNode):
+            yield _walk(node, scope, last_schema, defs)
+        elif isinstance(node, QueryNode):
+            last_schema = _query_schema(node.queries, value_schema)
+        elif isinstance(node, _SaveNode):
+            _add(scope, node.ident_parts, value_schema)
+        elif isinstance(node, _SaveEachNode):
+            item_schema = {}
+            yield _walk(node.sub_ctx_node, item_schema, SCALAR, defs)
+            _add(scope, node.ident_parts, [item_schema])
+        elif isinstance(node, _NamespaceNode):
+            yield _walk(node.sub_ctx_node, _descend(scope, node.ident_parts), value_schema, defs)
+        elif isinstance(node, _RxMatchNode):
+            # rx match sub-contexts save to the enclosing scope
+            yield _walk(node.sub_ctx_node, scope, SCALAR, defs)
+        elif isinstance(node, _MergeNode):
+            if node.save_all:
+                if isinstance(value_schema, dict):
+                    for key, sub in value_schema.items():
+                        _add(scope, (key,), sub)
+            else:
+                for name_parts in node.names_to_save:
+                    _add(scope, name_parts, get_via_schema(value_schema, name_parts))
+        elif isinstance(node, _DefSubroutine):
+            last_schema = yield _def_schema(node, defs)
+        elif isinstance(node, (_CustomAccessor, _ShrinkNode)):
+            last_schema = SCALAR
+    yield Done(None)
+
+
+def build_schema(node):
+    """Returns the schema of the results of the parsed template ``node``."""
+    schema = {}
+    walk(node, schema, SCALAR, {})
+    return schema
+
+
+def group_by_keys(nodes):
+    """
+    Groups the ``nodes``, `ContextNode` objects run on the same value, so the
+    ones saving to the same top-level keys are in the same group. Returns the
+    groups as sorted lists of indexes into ``nodes``, in order.
+    """
+    groups = []
+    for i, node in enumerate(nodes):
+        indexes = [i]
+        keys = set(build_schema(node))
+        for other in [g for g in groups if g[1] & keys]:
+            groups.remove(other)
+            indexes += other[0]
+            keys |= other[1]
+        groups.append((sorted(indexes), keys))
+    groups.sort()
+    return [indexes for indexes, _ in groups]
+
+
+def keys_overlap(results):
+    """
+    Whether any of the ``results`` dicts share a top-level key, ex: when saved
+    by a merge from a field, whose keys aren't known before running.
+    """
+    seen = set()
+    for rv in results:
+        if seen.intersection(rv):
+            return True
+        seen.update(rv)
+    return False
@@ -0,0 +1,88 @@
+"""
+Fetching documents with the parsing overlapping the download. The response
+is read in chunks as they arrive and fed to an lxml HTML parser, so the tree
+is built while the rest is still downloading, and the whole body is never
+held in memory along with the tree.
+"""
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+import lxml.html
+
+from .early import FIRST_CHUNK_SIZE, parse_region
+
+
+# lxml's push parser has a cost for each feed, which dominates below ~64KB
+CHUNK_SIZE = 1 << 18
+# the same as PyQuery's
+DEFAULT_TIMEOUT = 60
+
+
+def iter_response(response, chunk_size=CHUNK_SIZE, first_size=None):
+    """
+    Yields the body of ``response`` as it arrives, in chunks of at least
+    ``chunk_size`` bytes except for the last. With ``first_size``, the chunks
+    start that big and double up to ``chunk_size``.
+    """
+    # read1 returns what has arrived instead of waiting for all the bytes, python 3 only
+    read = getattr(response, 'read1', response.read)
+    wanted = first_size or chunk_size
+    parts = []
+    size = 0
+    while True:
+        part = read(wanted - size)
+        if not part:
+            break
+        parts.append(part)
+        size += len(part)
+        if size >= wanted:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+            wanted = min(wanted * 2, chunk_size)
+    if parts:
+        yield b''.join(parts)
+
+
+def response_charset(response):
+    """The charset of the response's ``Content-Type`` header, or `None`."""
+    info = response.info()
+    get_charset = getattr(info, 'get_content_charset', None)
+    if get_charset is not None:
+        return get_charset()
+    # python 2
+    return info.getparam('charset')
+
+
+def parse_chunks(chunks, encoding=None):
+    """
+    Feeds the ``chunks`` of a document to an HTML parser, returns the list of
+    root elements, empty for an empty document.
+    """
+    parser = lxml.html.HTMLParser(encoding=encoding)
+    fed = False
+    for chunk in chunks:
+        parser.feed(chunk)
+        fed = True
+    if not fed:
+        return []
+    root = parser.close()
+    return [] if root is None else [root]
+
+
+def parse_url(url, chunk_size=CHUNK_SIZE, timeout=DEFAULT_TIMEOUT, region=None):
+    """
+    Returns the list of root elements of the document at ``url``, parsed as
+    it downloads. With a ``region`` (see `take.early`), the download stops
+    once it's parsed.
+    """
+    response = urlopen(url, timeout=timeout)
+    try:
+        if region is not None:
+            chunks = iter_response(response, chunk_size, min(FIRST_CHUNK_SIZE, chunk_size))
+            return parse_region(chunks, region, response_charset(response))[0]
+        return parse_chunks(iter_response(response, chunk_size), response_charset(response))
+    finally:
+        response.close()
@@ -1,27 +1,418 @@
+import multiprocessing
+import os
+import threading
+import warnings
+from multiprocessing.pool import ThreadPool
+
+import lxml.html
+from lxml import etree
 from pyquery import PyQuery
 
-from .parser import parse
+from .early import find_region, iter_slices, parse_region
+from .events import find_selections, parse_events
+from .exceptions import DeadCodeWarning
+from .inline import inline_subroutines
+from .memo import SelectorMemo, make_memo
+from .parallel import gil_enabled, split_branches, run_branches
+from .parser import parse, execute, nesting_depth, ContextNode
+from .peephole import peephole
+from .prune import prune, request_tree, eliminate_dead_code
+from .records import with_records
+from ._compat import string_types
+from .schema import build_schema
+from .stream import CHUNK_SIZE, DEFAULT_TIMEOUT, parse_url
+from .utils import split_name
+
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+def make_doc(args, kwargs, base_url=None):
+    """Makes the `PyQuery` document from the `take()` arguments."""
+    base_url = kwargs.pop('base_url', None) or base_url
+    _doc = PyQuery(*args, **kwargs)
+    if base_url:
+        _doc.make_links_absolute(base_url)
+    return _doc
+
+
+# lxml serializes the parses made with the same parser, so each thread has its own
+_thread_parsers = threading.local()
+
+
+def parse_in_thread(html):
+    """
+    Parses ``html`` like `PyQuery` does, as XML or else as HTML, but with this
+    thread's own HTML parser so threads parse concurrently. Returns the list
+    of root elements.
+    """
+    try:
+        return [etree.fromstring(html)]
+    except etree.XMLSyntaxError:
+        parser = getattr(_thread_parsers, 'html', None)
+        if parser is None:
+            parser = _thread_parsers.html = lxml.html.HTMLParser()
+        return [lxml.html.fromstring(html, parser=parser)]
+
+
+# the arguments of `take()` which aren't passed to `PyQuery`
+TAKE_OPTIONS = ('only', 'memo', 'index', 'early', 'parallel', 'events')
+
+
+def split_options(kwargs):
+    """
+    Returns ``(options, kwargs)``, the `take()` options in ``kwargs``, all of
+    `TAKE_OPTIONS` with `None` for those not given, and the other arguments,
+    which are for `PyQuery`.
+    """
+    kwargs = dict(kwargs)
+    options = dict((name, kwargs.pop(name, None)) for name in TAKE_OPTIONS)
+    return options, kwargs
+
+
+# templates nested deeper than this are run with `execute`, and skip the compile passes
+# since they recurse
+MAX_RECURSIVE_DEPTH = 100
+
+
+def _check_memo(memo, method):
+    if isinstance(memo, SelectorMemo):
+        raise ValueError('%s() makes a memo for each document, use memo=True' % method)
 
 
 class TakeTemplate(object):
 
     @staticmethod
     def from_file(path, **kwargs):
+        # imports are relative to the template's directory
+        kwargs.setdefault('base_dir', os.path.dirname(os.path.abspath(path)))
         with open(path, 'rb') as f:
             return TakeTemplate(f.read().decode('utf-8'), **kwargs)
 
     def __init__(self, src, **kwargs):
-        self.node = parse(src)
+        base_dir = kwargs.get('base_dir', None)
+        self.node = parse(src, base_dir)
         self.base_url = kwargs.get('base_url', None)
+        deep = nesting_depth(self.node) > MAX_RECURSIVE_DEPTH
+        # deep templates are pickled as their source, pickle would recurse as deep as they nest
+        self._source = (src, base_dir) if deep else None
+        # iterative=True runs the template with an explicit stack instead of recursing
+        self.iterative = kwargs.get('iterative', deep)
+        if not deep and kwargs.get('inline_subroutines', True):
+            self.node = inline_subroutines(self.node)
+        # remove queries whose results are never used, unless disabled
+        if not deep and kwargs.get('eliminate_dead_code', True):
+            self.node, line_nums = eliminate_dead_code(self.node)
+            if line_nums:
+                warnings.warn('Removed queries with no effect on the results, on template '
+                              'lines: %s' % ', '.join(str(n) for n in line_nums),
+                              DeadCodeWarning, stacklevel=2)
+        # fuse common sequences of queries and directives, unless disabled
+        if not deep and kwargs.get('peephole', True):
+            self.node = peephole(self.node)
+        # records=True saves results to generated __slots__ records instead of dicts
+        self.records = kwargs.get('records', False)
+        if deep and self.records:
+            # the record types nest as deep as the template
+            raise ValueError('records=True is not supported for templates nested deeper '
+                             'than %d levels' % MAX_RECURSIVE_DEPTH)
+        self._dict_node = None
+        self._with_records()
+        # pruned nodes for `take(..., only=[...])`, by requested names
+        self._plans = {}
+        # branches for `take(..., parallel=True)`, by the node of the plan
+        self._branches = {}
+        # the parts of documents the plans use, see `take.early`
+        self._regions = {}
+        # the selectors of the plans run on parser events, see `take.events`
+        self._selections = {}
 
-    def take(self, *args, **kwargs):
-        base_url = kwargs.pop('base_url', None) or self.base_url
-        _doc = PyQuery(*args, **kwargs)
-        if base_url:
-            _doc.make_links_absolute(base_url)
-        rv = {}
-        self.node.do(None, rv=rv, value=_doc, last_value=_doc)
+    def _with_records(self):
+        if self.records:
+            # kept for pickling, the generated record types can't be pickled
+            self._dict_node = self.node
+            self.node, self._rv_type = with_records(self.node)
+        else:
+            self._rv_type = dict
+
+    def __getstate__(self):
+        """
+        Compiled templates pickle as their node trees, ex: to send them to
+        `multiprocessing` workers, without the caches and generated types,
+        which are made again when unpickled.
+        """
+        state = self.__dict__.copy()
+        state['_plans'] = {}
+        state['_branches'] = {}
+        state['_regions'] = {}
+        state['_selections'] = {}
+        del state['_rv_type']
+        if self._source is not None:
+            state['node'] = state['_dict_node'] = None
+        elif self.records:
+            state['node'] = state['_dict_node']
+            state['_dict_node'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._source is not None:
+            self.node = parse(*self._source)
+        self._with_records()
+
+    def schema(self):
+        """
+        Returns the structure of the results of this template, see `take.schema`.
+        """
+        return build_schema(self.node)
+
+    def _plan(self, only):
+        """The node to run to get the ``only`` keys, all keys if `None`."""
+        if only is None:
+            return self.node
+        key = frozenset(split_name(name) for name in only)
+        node = self._plans.get(key)
+        if node is None:
+            node = prune(self.node, request_tree(key))
+            if node is None:
+                node = ContextNode(self.node.depth, [])
+            self._plans[key] = node
+        return node
+
+    def _region(self, node):
+        """The `Region` of the documents ``node`` uses, `None` for all of them."""
+        if node not in self._regions:
+            self._regions[node] = find_region(node)
+        return self._regions[node]
+
+    def _selections_of(self, node):
+        """The `Selections` of ``node``, `None` if it has to run on a parsed document."""
+        if node not in self._selections:
+            # the analysis walks the node tree, which deep templates aren't compiled for
+            self._selections[node] = (find_selections(node) if self._source is None
+                                      else None)
+        return self._selections[node]
+
+    def _take_events(self, node, html, base_url, events):
+        """
+        Runs ``node`` on the parser's events for ``html``, `None` if it can't
+        be. Unless ``events`` is true, only when the parsing can stop early.
+        """
+        selections = self._selections_of(node)
+        if selections is None or not (events or selections.stops):
+            return None
+        parsed = parse_events(html, selections, base_url or self.base_url)
+        if parsed is None:
+            return None
+        return self._run(node, *parsed)
+
+    def _make_doc(self, args, kwargs):
+        return make_doc(args, kwargs, self.base_url)
+
+    def _run(self, node, _doc, memo=None, iterative=False):
+        rv = self._rv_type()
+        if self.iterative or iterative:
+            execute(node, rv, _doc, memo)
+        else:
+            node.do(None, rv=rv, value=_doc, last_value=_doc, memo=memo)
         return rv
 
+    def _run_parallel(self, node, _doc, memo, index, threads):
+        """
+        Runs the independent branches of ``node`` in threads, see
+        `take.parallel`. Returns `None` when the template has to be run
+        serially instead.
+        """
+        if gil_enabled() or self._source is not None or isinstance(memo, SelectorMemo):
+            # the GIL would run the branches in turns, the branches of deep templates
+            # aren't analyzed, and a given memo isn't shared between threads
+            return None
+        branches = self._branches.get(node)
+        if branches is None:
+            branches = self._branches[node] = split_branches(node)
+        if len(branches) < 2:
+            return None
+        return run_branches(branches, self._rv_type, _doc, lambda: make_memo(memo, index),
+                            threads or multiprocessing.cpu_count())
+
+    def _take_doc(self, node, _doc, options, iterative=False):
+        """Runs ``node`` on the document with the `take()` ``options``, see `split_options`."""
+        # memo=True or a SelectorMemo caches selector results during this call, index=True
+        # answers simple selectors from an index of the document's elements
+        memo_arg = options['memo']
+        index = options['index'] or False
+        memo = make_memo(memo_arg, index)
+        # parallel=True, or a number of threads, runs independent branches concurrently on
+        # free-threaded builds
+        parallel = options['parallel']
+        if parallel:
+            threads = None if parallel is True else parallel
+            rv = self._run_parallel(node, _doc, memo_arg, index, threads)
+            if rv is not None:
+                return rv
+        return self._run(node, _doc, memo, iterative)
+
+    def _parse_early(self, node, html):
+        """
+        The roots of the HTML string ``html`` parsed until the parts ``node``
+        uses, `None` if they aren't known.
+        """
+        region = self._region(node)
+        if region is None:
+            return None
+        return parse_region(iter_slices(html), region)[0]
+
+    def take(self, *args, **kwargs):
+        options, kwargs = split_options(kwargs)
+        # only=[...] limits the results to those names, skipping the queries for the others
+        node = self._plan(options['only'])
+        # templates which only use simple selectors, and only some of their matches on
+        # the document, run on the parser's events for an HTML string, see `take.events`.
+        # events=True uses them for any simple selectors, events=False never
+        if (options['events'] is not False and len(args) == 1 and
+                isinstance(args[0], (string_types, bytes)) and not options['memo'] and
+                not options['index'] and not options['parallel'] and not options['early'] and
+                set(kwargs) <= set(['base_url'])):
+            rv = self._take_events(node, args[0], kwargs.get('base_url'), options['events'])
+            if rv is not None:
+                return rv
+        # early=True parses an HTML string only until the parts the template uses, when
+        # they are known
+        if options['early'] and args and isinstance(args[0], (string_types, bytes)):
+            roots = self._parse_early(node, args[0])
+            if roots is not None:
+                args = (roots,) + args[1:]
+        return self._take_doc(node, self._make_doc(args, kwargs), options)
+
+    def take_lazy(self, *args, **kwargs):
+        """
+        Like `take`, but returns a `LazyResult` which only runs the parts of the
+        template needed for the keys that are accessed. Takes the arguments of
+        `take()`, except ``parallel``.
+        """
+        options, kwargs = split_options(kwargs)
+        if options['parallel']:
+            raise ValueError('take_lazy() runs the keys as they are accessed, without parallel=')
+        only = options['only']
+        if options['early'] and args and isinstance(args[0], (string_types, bytes)):
+            roots = self._parse_early(self._plan(only), args[0])
+            if roots is not None:
+                args = (roots,) + args[1:]
+        memo = make_memo(options['memo'], options['index'] or False)
+        return LazyResult(self, self._make_doc(args, kwargs), memo, only)
+
+    def take_mmap(self, path, splitter=None, **kwargs):
+        """
+        Yields the results for each document in the file at ``path``, which is
+        memory-mapped and split into documents with ``splitter`` (after each
+        ``</html>`` by default, see `take.archive`). Takes the other arguments
+        of `take()`, a memo is made for each document, and the documents are
+        always parsed as with ``early=True``.
+        """
+        from .archive import iter_documents, split_html
+        options, kwargs = split_options(kwargs)
+        _check_memo(options['memo'], 'take_mmap')
+        node = self._plan(options['only'])
+        # the documents are only parsed until the parts the template uses, when known
+        for root in iter_documents(path, splitter or split_html, self._region(node)):
+            yield self._take_doc(node, make_doc((root,), dict(kwargs), self.base_url), options)
+
+    def take_url(self, url, chunk_size=CHUNK_SIZE, timeout=DEFAULT_TIMEOUT, **kwargs):
+        """
+        Like ``take(url=url)``, but the response is parsed as it downloads, in
+        chunks of ``chunk_size`` bytes, see `take.stream`. When the template
+        only uses known parts of documents, ex: the ``<head>``, the download
+        stops once they are parsed. Takes the other arguments of `take()`.
+        """
+        region = self._region(self._plan(kwargs.get('only')))
+        return self.take(parse_url(url, chunk_size, timeout, region), **kwargs)
+
+    def take_many(self, docs, threads=None, **kwargs):
+        """
+        Returns the list of results for the documents in ``docs``, parsed and
+        run in a pool of ``threads`` threads, the number of cores by default.
+        lxml releases the GIL while parsing, so the documents are parsed
+        concurrently. The template is shared by the threads: each document is
+        run with `execute`, which keeps the state of the run in its own frames
+        instead of the template's nodes. Takes the other arguments of
+        `take()`, a memo is made for each document.
+        """
+        options, kwargs = split_options(kwargs)
+        _check_memo(options['memo'], 'take_many')
+        node = self._plan(options['only'])
+
+        def run(doc):
+            if isinstance(doc, (string_types, bytes)):
+                roots = self._parse_early(node, doc) if options['early'] else None
+                doc = parse_in_thread(doc) if roots is None else roots
+            _doc = make_doc((doc,), dict(kwargs), self.base_url)
+            return self._take_doc(node, _doc, options, iterative=True)
+
+        pool = ThreadPool(threads or multiprocessing.cpu_count())
+        try:
+            return pool.map(run, docs)
+        finally:
+            pool.close()
+            pool.join()
+
     def __call__(self, *args, **kwargs):
         return self.take(*args, **kwargs)
+
+
+class LazyResult(Mapping):
+    """
+    Read-only mapping of a template's results, each top-level key is extracted
+    on first access. Iterating or getting the length extracts all the keys.
+    With ``only``, the results are limited to those names, as with `take()`.
+    """
+
+    def __init__(self, template, doc, memo=None, only=None):
+        self._template = template
+        self._doc = doc
+        # the keys are extracted separately, so share the selector results
+        self._memo = memo or SelectorMemo()
+        self._only = only
+        self._static_keys = set(build_schema(template._plan(only)))
+        self._data = {}
+        self._taken = set()
+        self._all_taken = False
+
+    def _take(self, only):
+        rv = self._template._run(self._template._plan(only), self._doc, self._memo)
+        self._data.update(rv)
+
+    def _take_all(self):
+        if not self._all_taken:
+            self._data = {}
+            self._take(self._only)
+            self._all_taken = True
+
+    def _key_names(self, key):
+        """The names to take for the top-level ``key``."""
+        if self._only is None:
+            return (key,)
+        return [name for name in self._only if split_name(name)[0] == key]
+
+    def __getitem__(self, key):
+        if not self._all_taken and key not in self._taken:
+            if key in self._static_keys:
+                self._take(self._key_names(key))
+                self._taken.add(key)
+            else:
+                # not a key the template is known to save, ex: merged from a field
+                self._take_all()
+        return self._data[key]
+
+    def __iter__(self):
+        self._take_all()
+        return iter(self._data)
+
+    def __len__(self):
+        self._take_all()
+        return len(self._data)
+
+    def __repr__(self):
+        return 'LazyResult(%r)' % self._data
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+from ._compat import string_types
+from .early import find_region, iter_slices, parse_region
+from .events import find_selections, parse_events
+from .memo import SelectorMemo, make_memo
+from .parser import ContextNode
+from .take_template import TakeTemplate, make_doc, split_options
+
+
+# the `take()` options a set can't run with: the templates share one memo, which
+# parallel branches would need one each of
+_UNSUPPORTED_OPTIONS = ('parallel',)
+
+
+class TemplateSet(object):
+    """
+    Runs several templates against the same document. The document is parsed
+    and has its links made absolute once, and the results of CSS selectors
+    are shared between the templates.
+
+    ``templates`` is a mapping or a sequence of ``(name, template)`` pairs,
+    the templates can be `TakeTemplate` instances or template sources. The
+    links are made absolute once for all the templates, so the templates
+    with a ``base_url`` must have the same one, and ``base_url`` defaults to
+    it. A `ValueError` is raised otherwise.
+    """
+
+    def __init__(self, templates, base_url=None):
+        if hasattr(templates, 'items'):
+            templates = templates.items()
+        self.templates = OrderedDict(
+            (name, TakeTemplate(tmpl) if isinstance(tmpl, string_types) else tmpl)
+            for name, tmpl in templates)
+        base_urls = set(tmpl.base_url for tmpl in self.templates.values() if tmpl.base_url)
+        if base_url:
+            base_urls.add(base_url)
+        if len(base_urls) > 1:
+            raise ValueError('The templates of a TemplateSet are run with the same base_url, '
+                             'got: %s' % ', '.join(sorted(base_urls)))
+        self.base_url = base_urls.pop() if base_urls else None
+        # (nodes of the templates, region, selections) by the ``only`` names, the region
+        # and selections are those of all the templates, see `take.early` and `take.events`
+        self._plans = {}
+
+    def _plan(self, only):
+        key = None if only is None else frozenset(only)
+        plan = self._plans.get(key)
+        if plan is None:
+            nodes = [tmpl._plan(only) for tmpl in self.templates.values()]
+            # the templates are each run on the document, like the sub-contexts of a
+            # template's top-level
+            ctx_node = ContextNode(0, nodes)
+            deep = any(tmpl._source is not None for tmpl in self.templates.values())
+            plan = self._plans[key] = (nodes, find_region(ctx_node),
+                                       None if deep else find_selections(ctx_node))
+        return plan
+
+    def take(self, *args, **kwargs):
+        """
+        Takes the same arguments as `TakeTemplate.take()`, except ``parallel``,
+        and returns a dict of the results of each template, by name. ``only``
+        applies to each template. A `SelectorMemo` can be given with ``memo`` to
+        get its counters, ``index=True`` uses an `ElementIndex`.
+        """
+        options, kwargs = split_options(kwargs)
+        unsupported = [name for name in _UNSUPPORTED_OPTIONS if options[name]]
+        if unsupported:
+            raise TypeError('TemplateSet.take() does not support: %s' % ', '.join(unsupported))
+        nodes, region, selections = self._plan(options['only'])
+        memo = make_memo(options['memo'], options['index'] or False)
+        html = args[0] if len(args) == 1 and isinstance(args[0], (string_types, bytes)) else None
+        _doc = None
+        # like `take()`, on the parser's events when all the templates qualify
+        if (html is not None and selections is not None and memo is None and
+                not options['early'] and options['events'] is not False and
+                (options['events'] or selections.stops) and set(kwargs) <= set(['base_url'])):
+            parsed = parse_events(html, selections, kwargs.get('base_url') or self.base_url)
+            if parsed is not None:
+                _doc, memo = parsed
+        if _doc is None:
+            if options['early'] and html is not None and region is not None:
+                args = (parse_region(iter_slices(html), region)[0],)
+            _doc = make_doc(args, kwargs, self.base_url)
+        memo = memo or SelectorMemo()
+        return dict((name, tmpl._run(node, _doc, memo))
+                    for (name, tmpl), node in zip(self.templates.items(), nodes))
+
+    def __call__(self, *args, **kwargs):
+        return self.take(*args, **kwargs)
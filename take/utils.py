@@ -19,6 +19,17 @@ def get_via_name_list(src, name_parts):
     return src.get(name_parts[-1])
 
 
+def new_scope(dest, name_parts):
+    """
+    Util to make an empty container for the name sequence in `dest`. Plain dicts
+    get a `dict`, records (see `take.records`) get their generated child type.
+    """
+    make_child = getattr(dest, 'make_child', None)
+    if make_child is None:
+        return {}
+    return make_child(name_parts)
+
+
 def save_to_name_list(dest, name_parts, value):
     """
     Util to save some name sequence to a dict. For instance, `("location","query")` would save
@@ -27,6 +38,93 @@ def save_to_name_list(dest, name_parts, value):
     if len(name_parts) > 1:
         for part in name_parts[:-1]:
             if part not in dest:
-                dest[part] = {}
+                dest[part] = new_scope(dest, (part,))
             dest = dest[part]
     dest[name_parts[-1]] = value
+
+
+def make_getter(name_parts):
+    """
+    Precomputes `get_via_name_list` for `name_parts`, returning a function
+    which takes the source dict.
+    """
+    if len(name_parts) == 1:
+        key, = name_parts
+        def getter(src):
+            return src.get(key)
+    elif len(name_parts) == 2:
+        first, key = name_parts
+        def getter(src):
+            src = src.get(first)
+            if src is None:
+                return None
+            return src.get(key)
+    else:
+        parts = tuple(name_parts[:-1])
+        key = name_parts[-1]
+        def getter(src):
+            for part in parts:
+                src = src.get(part)
+                if src is None:
+                    return None
+            return src.get(key)
+    return getter
+
+
+def make_setter(name_parts):
+    """
+    Precomputes `save_to_name_list` for `name_parts`, returning a function
+    which takes the destination dict and the value.
+    """
+    if len(name_parts) == 1:
+        key, = name_parts
+        def setter(dest, value):
+            dest[key] = value
+    elif len(name_parts) == 2:
+        first, key = name_parts
+        first_parts = (first,)
+        def setter(dest, value):
+            sub = dest.get(first)
+            if sub is None:
+                sub = dest[first] = new_scope(dest, first_parts)
+            sub[key] = value
+    else:
+        parts = tuple((part, (part,)) for part in name_parts[:-1])
+        key = name_parts[-1]
+        def setter(dest, value):
+            for part, part_parts in parts:
+                sub = dest.get(part)
+                if sub is None:
+                    sub = dest[part] = new_scope(dest, part_parts)
+                dest = sub
+            dest[key] = value
+    return setter
+
+
+class Done(object):
+    """The result of a generator run by `trampoline`."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def trampoline(gen):
+    """
+    Util to run the generator ``gen`` with an explicit stack instead of
+    recursing, so walks of the node tree aren't limited by the recursion
+    limit. The generators yield the generators whose results they need, which
+    are sent back to them, and then their own result as a `Done`.
+    """
+    stack = [gen]
+    value = None
+    while True:
+        out = stack[-1].send(value)
+        value = None
+        if isinstance(out, Done):
+            stack.pop()
+            if not stack:
+                return out.value
+            value = out.value
+        else:
+            stack.append(out)
@@ -0,0 +1,219 @@
+"""
+Watch mode, for editing a template while running it against a set of saved
+documents.
+
+The template is split into its top-level blocks, a line at the top-level
+indentation and the deeper lines after it. When the template changes, only
+the blocks whose source changed, or which could call a changed ``def``, are
+parsed again. Blocks saving to the same top-level keys are grouped
+into units, and only the units with changed blocks are run again on the
+documents.
+"""
+import os
+import re
+import time
+from collections import OrderedDict
+
+from .exceptions import TakeSyntaxError, UnexpectedTokenError, ScanError
+from .inline import inline_subroutines
+from .parser import parse, execute, nesting_depth, ContextNode
+from .peephole import peephole
+from .prune import eliminate_dead_code
+from .schema import group_by_keys, keys_overlap
+from .take_template import make_doc, MAX_RECURSIVE_DEPTH
+
+
+_INDENT_RX = re.compile(r'\S')
+_COMMENT_TEST_RX = re.compile(r'^\s*#.*$')
+
+
+def split_blocks(src):
+    """Splits the template source into the source of each top-level block."""
+    blocks = []
+    # leading blank lines and comments go in the first block
+    lines = []
+    root = None
+    for line in src.splitlines(True):
+        m = _INDENT_RX.search(line)
+        if m and not _COMMENT_TEST_RX.match(line):
+            if root is None:
+                root = m.start()
+                blocks.append(lines)
+            elif m.start() <= root:
+                lines = []
+                blocks.append(lines)
+        lines.append(line)
+    return [''.join(lines) for lines in blocks]
+
+
+class IncrementalTemplate(object):
+    """
+    A parsed template which is updated with the edited source, re-parsing only
+    the changed blocks. ``units`` is the list of ``(key, node)`` of the groups
+    of blocks which save to the same keys, the key only changes when one of
+    the unit's blocks is parsed again.
+    """
+
+    def __init__(self, src='', base_dir=None):
+        self.base_dir = base_dir
+        # (block source, ids of the defs it can call) -> (defs, node, defs it makes)
+        self._blocks = {}
+        self.units = []
+        # number of blocks parsed by the last update
+        self.parsed = 0
+        self.update(src)
+
+    def _compile(self, src, exports=None, defs=None):
+        node = parse(src, self.base_dir, exports, defs)
+        if nesting_depth(node) > MAX_RECURSIVE_DEPTH:
+            # like `TakeTemplate`, deep blocks skip the passes which recurse
+            return node
+        node = inline_subroutines(node)
+        node, _ = eliminate_dead_code(node)
+        return peephole(node)
+
+    def _parse_blocks(self, sources):
+        blocks = {}
+        nodes = []
+        defs = {}
+        for block_src in sources:
+            # a block can only call the subroutines whose name is in its source
+            key = (block_src, frozenset((name, id(node)) for name, node in defs.items()
+                                        if name in block_src))
+            block = self._blocks.get(key)
+            if block is None:
+                exports = {}
+                node = self._compile(block_src, exports, defs)
+                own_defs = dict((name, sub) for name, sub in exports.items()
+                                if defs.get(name) is not sub)
+                # keeps the defs the key refers to alive
+                block = (defs, node, own_defs)
+                self.parsed += 1
+            blocks[key] = block
+            nodes.append(block[1])
+            if block[2]:
+                defs = dict(defs)
+                defs.update(block[2])
+        return blocks, nodes
+
+    def update(self, src):
+        """Updates the template to the ``src``, returns the number of blocks parsed."""
+        self.parsed = 0
+        try:
+            blocks, nodes = self._parse_blocks(split_blocks(src))
+        except (TakeSyntaxError, UnexpectedTokenError, ScanError):
+            # the blocks might not be separable, ex: a multi-line regexp at the top-level
+            # indentation, so fall back to parsing all of it
+            blocks = {}
+            nodes = [self._compile(src)]
+            self.parsed = 1
+        self._blocks = blocks
+        self.units = self._group(nodes)
+        return self.parsed
+
+    def _group(self, nodes):
+        # blocks saving to the same top-level keys are merged into one unit
+        nodes = [node for node in nodes if node.nodes]
+        return [_unit([nodes[i] for i in indexes]) for indexes in group_by_keys(nodes)]
+
+    def merge_units(self):
+        """Merges all the units into one, used when their results turn out to overlap."""
+        if self.units:
+            self.units = [_unit([node for key, _ in self.units for node in key])]
+
+    @property
+    def node(self):
+        """The node for the whole template."""
+        nodes = [node for _, unit in self.units for node in unit.nodes]
+        return ContextNode(self.units[0][1].depth if self.units else 0, nodes)
+
+
+def _unit(block_nodes):
+    """The ``(key, node)`` of a unit, the key is the tuple of the block nodes."""
+    nodes = [node for block in block_nodes for node in block.nodes]
+    return tuple(block_nodes), ContextNode(block_nodes[0].depth, nodes)
+
+
+class Watcher(object):
+    """
+    Runs the template at ``path`` on the ``documents``, a mapping of names to
+    HTML, and re-runs the changed parts of it when the file changes. The
+    documents are parsed once.
+    """
+
+    def __init__(self, path, documents, base_url=None):
+        self.path = path
+        self.template = IncrementalTemplate(base_dir=os.path.dirname(os.path.abspath(path)))
+        self.documents = OrderedDict((name, make_doc((html,), {}, base_url))
+                                     for name, html in documents.items())
+        # unit key -> {document name: result}
+        self._results = {}
+        self._mtime = None
+        # number of units run by the last check
+        self.ran = 0
+
+    def _run_units(self):
+        results = {}
+        self.ran = 0
+        for key, unit in self.template.units:
+            unit_results = self._results.get(key)
+            if unit_results is None:
+                unit_results = {}
+                for name, doc in self.documents.items():
+                    rv = {}
+                    # units can nest deeper than the recursion limit
+                    execute(unit, rv, doc)
+                    unit_results[name] = rv
+                self.ran += 1
+            results[key] = unit_results
+        self._results = results
+
+    def check(self):
+        """
+        Reloads the template if the file changed and returns the results by
+        document name, otherwise returns `None`.
+        """
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return None
+        with open(self.path, 'rb') as f:
+            self.template.update(f.read().decode('utf-8'))
+        self._mtime = mtime
+        self._run_units()
+        for name in self.documents:
+            if keys_overlap(self._results[key][name] for key, _ in self.template.units):
+                # ex: merged from a field, the keys can't be known before running
+                self.template.merge_units()
+                self._run_units()
+                break
+        return self.results()
+
+    def results(self):
+        """The results of the template for each document, by name."""
+        results = OrderedDict()
+        for name in self.documents:
+            rv = {}
+            for key, _ in self.template.units:
+                rv.update(self._results[key][name])
+            results[name] = rv
+        return results
+
+    def watch(self, callback, interval=0.5, on_error=None):
+        """
+        Checks the template every ``interval`` seconds and calls ``callback``
+        with the results when it changed. Errors are passed to ``on_error`` if
+        given, otherwise raised.
+        """
+        while True:
+            try:
+                results = self.check()
+            except Exception as e:
+                if on_error is None:
+                    raise
+                # retry after the next change
+                self._mtime = os.path.getmtime(self.path)
+                on_error(e)
+            else:
+                if results is not None:
+                    callback(results)
+            time.sleep(interval)
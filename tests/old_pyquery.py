@@ -0,0 +1,13 @@
+from pyquery import PyQuery
+
+
+class OldPyQuery(PyQuery):
+    """Like the `PyQuery` of the pinned 1.2.9, without ``namespaces`` and ``_copy``."""
+
+    def __init__(self, *args, **kwargs):
+        super(OldPyQuery, self).__init__(*args, **kwargs)
+        del self.namespaces
+
+    @property
+    def _copy(self):
+        raise AttributeError('_copy')
@@ -0,0 +1,78 @@
+import os
+import pytest
+
+from take import TakeTemplate
+from take.archive import iter_documents, split_html, split_on
+from take.memo import SelectorMemo
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html', 'rb') as f:
+    html_fixture = f.read()
+
+
+TMPL = """
+    $ h1 | 0 text ;         : title
+    $ nav a
+        save each           : links
+            | [href] ;          : url
+"""
+
+
+@pytest.mark.archive
+class TestArchive():
+
+    def test_split_html(self):
+        data = b'<html><p>a</p></html>\n<HTML><p>b</p></html >\n  \n'
+        assert [data[start:end] for start, end in split_html(data)] == [
+            b'<html><p>a</p></html>', b'\n<HTML><p>b</p></html >']
+
+
+    def test_split_on(self):
+        splitter = split_on(b'\x00')
+        assert list(splitter(b'a\x00bc\x00')) == [(0, 1), (2, 4)]
+        assert list(splitter(b'a\x00bc')) == [(0, 1), (2, 4)]
+
+
+    def test_iter_documents(self, tmpdir):
+        path = tmpdir.join('docs.html')
+        path.write_binary(b'<html><p>a</p></html>\n\n<html><p>b</p></html>\n')
+        roots = list(iter_documents(str(path)))
+        assert [root.findtext('.//p') for root in roots] == ['a', 'b']
+
+
+    def test_empty_file(self, tmpdir):
+        path = tmpdir.join('empty.html')
+        path.write_binary(b'')
+        assert list(iter_documents(str(path))) == []
+
+
+    def test_take_mmap(self, tmpdir):
+        path = tmpdir.join('docs.html')
+        page = b'<html><body>' + html_fixture + b'</body></html>'
+        path.write_binary(b'\n'.join([page] * 3))
+        tt = TakeTemplate(TMPL)
+        results = list(tt.take_mmap(str(path)))
+        assert len(results) == 3
+        expected = tt(html_fixture.decode('utf-8'))
+        assert results == [expected] * 3
+
+
+    def test_take_mmap_splitter(self, tmpdir):
+        path = tmpdir.join('docs.bin')
+        path.write_binary(b'\x00'.join([html_fixture] * 2))
+        tt = TakeTemplate(TMPL)
+        results = list(tt.take_mmap(str(path), splitter=split_on(b'\x00'),
+                                    base_url='http://example.com', only=['title']))
+        assert results == [{'title': tt(html_fixture.decode('utf-8'))['title']}] * 2
+
+
+    def test_take_mmap_options(self, tmpdir):
+        path = tmpdir.join('docs.bin')
+        path.write_binary(b'\x00'.join([html_fixture] * 2))
+        tt = TakeTemplate(TMPL)
+        expected = tt(html_fixture.decode('utf-8'))
+        for options in ({'memo': True}, {'index': True}, {'early': True}):
+            results = list(tt.take_mmap(str(path), splitter=split_on(b'\x00'), **options))
+            assert results == [expected] * 2
+        with pytest.raises(ValueError):
+            list(tt.take_mmap(str(path), memo=SelectorMemo()))
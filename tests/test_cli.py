@@ -0,0 +1,99 @@
+import io
+import json
+import os
+import pytest
+
+from take import TakeTemplate
+from take.cli import main, make_arg_parser, extract
+from take.corpus import DocCache
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+TMPL = """
+$ h1 | 0 text ;         : title
+$ nav a
+    save each           : links
+        | [href] ;          : url
+"""
+
+
+@pytest.fixture
+def corpus(tmpdir):
+    tmpdir.join('page.take').write(TMPL)
+    docs = tmpdir.mkdir('docs')
+    docs.join('a.html').write(html_fixture)
+    docs.mkdir('sub').join('b.html').write(html_fixture.replace('Text in h1', 'Other h1'))
+    return tmpdir
+
+
+@pytest.mark.cli
+class TestRegress():
+
+    def test_regress(self, corpus, capsys):
+        tmpl = str(corpus.join('page.take'))
+        docs = str(corpus.join('docs'))
+        cache_dir = str(corpus.join('cache'))
+        first = str(corpus.join('first.json'))
+        assert main(['regress', tmpl, docs, '-j', '1', '--cache-dir', cache_dir,
+                     '-o', first]) == 0
+        with open(first) as f:
+            results = json.load(f)
+        assert results['a.html'] == TakeTemplate(TMPL)(html_fixture)
+        assert results[os.path.join('sub', 'b.html')]['title'] == 'Other h1'
+        assert len(os.listdir(cache_dir)) == 2
+        capsys.readouterr()
+        # the second run loads the cached trees
+        corpus.join('docs', 'sub', 'b.html').write(html_fixture.replace('Text in h1', 'New h1'))
+        assert main(['regress', tmpl, docs, '-j', '1', '--cache-dir', cache_dir,
+                     '-p', first]) == 1
+        out = capsys.readouterr()[0]
+        assert 'CHANGED  %s' % os.path.join('sub', 'b.html') in out
+        assert 'title: "Other h1" -> "New h1"' in out
+        assert '1 changed, 0 errors' in out
+
+
+    def test_doc_cache(self, tmpdir):
+        path = tmpdir.join('a.html')
+        path.write(html_fixture)
+        cache = DocCache(str(tmpdir.join('cache')))
+        doc = cache.load(str(path))
+        cached = cache.load(str(path))
+        assert doc is not cached
+        tt = TakeTemplate(TMPL)
+        assert tt(cached) == tt(doc) == tt(html_fixture)
+
+
+def warc_record(uri, html):
+    body = ('HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n\r\n' +
+            html).encode('utf-8')
+    headers = ('WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: %s\r\n'
+               'Content-Length: %d\r\n\r\n' % (uri, len(body))).encode('utf-8')
+    return headers + body + b'\r\n\r\n'
+
+
+@pytest.mark.cli
+class TestExtract():
+
+    def test_extract_files_and_warc(self, corpus):
+        tmpl = str(corpus.join('page.take'))
+        doc = str(corpus.join('docs', 'a.html'))
+        warcinfo = (b'WARC/1.0\r\nWARC-Type: warcinfo\r\nContent-Length: 4\r\n\r\n'
+                    b'info\r\n\r\n')
+        stdin = io.BytesIO(warcinfo +
+                           warc_record('http://example.com/one', html_fixture) +
+                           warc_record('http://example.com/two', '<h1>Two</h1>'))
+        out = io.StringIO()
+        err = io.StringIO()
+        args = make_arg_parser().parse_args(['extract', tmpl, doc, '-', '-j', '1'])
+        assert extract(args, out, stdin, err) == 0
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [row['source'] for row in rows] == [doc, 'http://example.com/one',
+                                                   'http://example.com/two']
+        assert rows[0]['result'] == TakeTemplate(TMPL)(html_fixture)
+        # links in WARC records are made absolute with the record's URI
+        assert rows[1]['result']['links'][0]['url'] == 'http://example.com/local/a'
+        assert rows[2]['result'] == {'title': 'Two', 'links': []}
+        assert '3 documents' in err.getvalue()
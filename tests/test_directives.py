@@ -4,7 +4,7 @@ import pytest
 from pyquery import PyQuery
 
 from take import TakeTemplate
-from take.parser import InvalidDirectiveError, UnexpectedTokenError, TakeSyntaxError
+from take.parser import InvalidDirectiveError, UnexpectedTokenError, TakeSyntaxError, ScopeTable
 from take.scanner import ScanError
 
 here = os.path.dirname(os.path.abspath(__file__))
@@ -259,6 +259,21 @@ class TestDefDirective():
         assert data == expect
 
 
+    def test_def_scope_table(self):
+        defs = ScopeTable(simple=1)
+        marker = defs.enter_scope()
+        defs['simple'] = 2
+        defs['other'] = 3
+        # shadowed names are only counted once
+        assert len(defs) == 2
+        assert defs['simple'] == 2
+        inner = defs.enter_scope()
+        defs.leave_scope(inner)
+        assert defs['other'] == 3
+        defs.leave_scope(marker)
+        assert dict(defs) == {'simple': 1}
+
+
 @pytest.mark.directives
 @pytest.mark.merge_directive
 class TestMergeDirective():
@@ -0,0 +1,120 @@
+import pytest
+
+from take import TakeTemplate
+from take.early import in_head, find_region, parse_region, iter_slices
+
+
+HEAD_TMPL = """
+    $ head title | 0 text ;                 : title
+    $ head link[rel=canonical] | 0 [href] ; : canonical
+    $ head meta
+        save each                           : meta
+            | [name] ;                          : name
+            | [content] ;                       : content
+    $ h1.main | 0 text ;                    : heading
+"""
+
+PAGE = (u'<html><head><title>The Title</title>'
+        u'<link rel="canonical" href="http://example.com/page">'
+        u'<meta name="description" content="a page"><meta name="author" content="me">'
+        u'</head><body><h1>not this</h1><h1 class="main big">The <b>Heading</b></h1>'
+        u'%s<footer><h1 class="main">later</h1></footer></body></html>') % (
+            u'<p>filler <a href="/x">text</a></p>' * 5000)
+
+
+def _counted(chunks, seen):
+    for chunk in chunks:
+        seen.append(len(chunk))
+        yield chunk
+
+
+@pytest.mark.early
+class TestRegion():
+
+    def test_in_head(self):
+        assert in_head('head title')
+        assert in_head('html > head meta[name=description]')
+        assert in_head('HEAD title ~ meta')
+        assert in_head('head')
+        assert not in_head('title')
+        assert not in_head('head + body a')
+        assert not in_head('head title, body a')
+        assert not in_head('head ~ body')
+        assert not in_head('[invalid')
+
+
+    def test_find_region(self):
+        region = find_region(TakeTemplate(HEAD_TMPL).node)
+        assert region.head
+        assert region.matches == {('h1', (), ('main',)): 1}
+        assert region.tags() == ['body', 'h1', 'head']
+        region = find_region(TakeTemplate('$ p | 2 text ; : third\n$ .x | 0 text ; : x').node)
+        assert not region.head
+        assert region.matches == {('p', (), ()): 3, (None, (), ('x',)): 1}
+        assert region.tags() is None
+
+
+    def test_def_and_namespace_bodies(self):
+        region = find_region(TakeTemplate("""
+            def: meta
+                $ head title | 0 text ;     : title
+            namespace: page
+                meta
+                    merge               : title
+                $ h1 | 1 text ;         : second
+        """).node)
+        assert region.head
+        assert region.matches == {('h1', (), ()): 2}
+
+
+    def test_unconfined(self):
+        for tmpl in ('$ a | 0 [href] ;      : url\n$ p ;    : ps',
+                     '$ head title | -1 text ; : title\n$ h1 | -1 text ; : last',
+                     '$ body a | 0 text ; : first',
+                     '| 0 text ; : first',
+                     'save: doc',
+                     'namespace: ns\n    $ p\n        save each: ps\n            | text ; : text'):
+            assert find_region(TakeTemplate(tmpl).node) is None, tmpl
+
+
+@pytest.mark.early
+class TestEarlyStop():
+
+    def test_parse_region(self):
+        region = find_region(TakeTemplate(HEAD_TMPL).node)
+        seen = []
+        roots, stopped = parse_region(_counted(iter_slices(PAGE), seen), region)
+        assert stopped
+        assert sum(seen) < len(PAGE) // 10
+        assert roots[0].findtext('head/title') == 'The Title'
+        roots, stopped = parse_region(iter_slices(PAGE[:200]), region)
+        assert not stopped
+        assert parse_region([], region) == ([], False)
+
+
+    def test_take_early(self):
+        tt = TakeTemplate(HEAD_TMPL)
+        data = tt(PAGE, early=True)
+        assert data == tt(PAGE)
+        assert data['heading'] == 'The Heading'
+        assert data['meta'][1] == {'name': 'author', 'content': 'me'}
+        assert tt(PAGE.encode('utf-8'), early=True) == data
+        assert tt(PAGE, early=True, only=['title']) == {'title': 'The Title'}
+        # not confined, parsed as usual
+        tt = TakeTemplate('$ footer h1 | 0 text ; : footer')
+        assert tt(PAGE, early=True) == {'footer': 'later'}
+
+
+    def test_no_head(self):
+        tt = TakeTemplate(HEAD_TMPL)
+        page = u'<html><body><h1 class="main">x</h1><p>y</p></body></html>'
+        assert tt(page, early=True) == tt(page)
+
+
+    def test_take_mmap(self, tmpdir):
+        path = tmpdir.join('docs.html')
+        path.write_binary((PAGE + u'\n' + PAGE.replace(u'The Title', u'Second')).encode('utf-8'))
+        tt = TakeTemplate(HEAD_TMPL)
+        results = list(tt.take_mmap(str(path)))
+        assert [r['title'] for r in results] == ['The Title', 'Second']
+        assert results[0] == tt(PAGE)
@@ -0,0 +1,100 @@
+import os
+import pytest
+
+from take import TakeTemplate
+from take.events import find_selections, parse_chain, parse_events
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+# a full HTML document which isn't well-formed XML, so it's parsed as HTML
+PAGE = (u'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Doc</title></head>'
+        u'<body>%s<p>later</p></body></html>') % html_fixture
+
+
+FIRST_TMPL = """
+    $ h1 | 0 text ;                         : title
+    $ ul | 1 [title] ;                      : title2
+    $ nav a | 0
+        | [href] ;                              : url
+"""
+
+EACH_TMPL = """
+    $ section > ul li
+        save each                           : links
+            $ a | 0 [href] ;                    : url
+            $ a | 0 text ;                      : text
+    $ h1#id-on-h1 | text ;                  : title
+    $ li | -1 text ; shrink ;               : last
+    +                                       : ns
+        $ article | 0 own_text ;                : own
+"""
+
+
+def _parse(tmpl, html):
+    tt = TakeTemplate(tmpl)
+    return parse_events(html, find_selections(tt.node))
+
+
+@pytest.mark.events
+class TestEvents():
+
+    def test_parse_chain(self):
+        assert parse_chain('div > a.b.c') == [(('a', (), frozenset(['b', 'c'])), '>'),
+                                              (('div', (), frozenset()), None)]
+        assert parse_chain('#x') == [((None, ('x',), frozenset()), None)]
+        assert parse_chain('a[href]') is None
+        assert parse_chain('li:first-child') is None
+        assert parse_chain('h1 + p') is None
+        assert parse_chain('h1, p') is None
+
+
+    def test_find_selections(self):
+        tt = TakeTemplate(FIRST_TMPL)
+        selections = find_selections(tt.node)
+        assert len(selections.roots) == 3
+        assert selections.stops
+        assert not find_selections(TakeTemplate(EACH_TMPL).node).stops
+        # not simple selectors, an accessor or an element saved as is
+        for src in ('$ a[href] | 0 text ; : a',
+                    '$ h1 | 0 text\n    `(\\w+)`\n        rx match\n            | 1 ; : a',
+                    '$ h1 | 0 ; : a'):
+            assert find_selections(TakeTemplate(src).node) is None
+
+
+    def test_same_results(self):
+        for tmpl in (FIRST_TMPL, EACH_TMPL):
+            tt = TakeTemplate(tmpl)
+            expected = tt(PAGE, events=False)
+            assert tt(PAGE) == expected
+            assert tt(PAGE, events=True) == expected
+            assert tt(PAGE.encode('utf-8'), events=True) == expected
+            assert (tt(PAGE, events=True, base_url='http://example.com/') ==
+                    tt(PAGE, events=False, base_url='http://example.com/'))
+        data = TakeTemplate(EACH_TMPL)(PAGE, events=True)
+        assert data['links'][0] == {'url': 'http://ext.com/a', 'text': 'first content link'}
+        assert data['ns']['own'] == 'own text  more own text'
+
+
+    def test_stops_early(self):
+        doc, memo = _parse(FIRST_TMPL, PAGE)
+        assert memo is not None
+        # only the elements whose text or attributes are used are built
+        assert [elm.tag for elm in doc] == ['h1', 'a']
+        assert TakeTemplate(FIRST_TMPL)(PAGE) == {
+            'title': 'Text in h1',
+            'title2': 'content ul title',
+            'url': '/local/a',
+        }
+
+
+    def test_fallback(self):
+        # a fragment, parsed as a fragment by lxml.html
+        assert _parse(FIRST_TMPL, html_fixture) is None
+        # well-formed XML is parsed as usual
+        xml = u'<html><body>%s</body></html>' % html_fixture
+        doc, memo = _parse(FIRST_TMPL, xml)
+        assert memo is None
+        tt = TakeTemplate(FIRST_TMPL)
+        assert tt(xml) == tt(xml, events=False)
@@ -0,0 +1,116 @@
+import os
+import pytest
+
+from take import TakeTemplate
+from take.directives import _DefSubroutine, _CustomAccessor
+from take.parser import ContextNode
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+def all_nodes(ctx_node):
+    for node in ctx_node.nodes:
+        yield node
+        sub_ctx_node = node if isinstance(node, ContextNode) else getattr(node, 'sub_ctx_node', None)
+        if sub_ctx_node is not None:
+            for sub in all_nodes(sub_ctx_node):
+                yield sub
+
+
+def assert_same_results(tmpl):
+    data = TakeTemplate(tmpl)(html_fixture)
+    assert data == TakeTemplate(tmpl, inline_subroutines=False)(html_fixture)
+    return data
+
+
+@pytest.mark.inline
+class TestInlineSubroutines():
+
+    def test_inline_accessor(self):
+        TMPL = """
+            accessor: li 0
+                $ li ; | 0
+                    set context
+            $ ul
+                li 0
+                    | text ;            : li_0_text
+            $ p
+                li 0 ;                  : no_li
+        """
+        tt = TakeTemplate(TMPL)
+        assert not any(isinstance(node, _CustomAccessor) for node in all_nodes(tt.node))
+        assert len(tt.node.nodes[1].nodes[0].queries) == 2
+        data = assert_same_results(TMPL)
+        assert data['li_0_text'] == 'first nav item'
+        assert len(data['no_li']) == 0
+
+
+    def test_accessor_not_inlined(self):
+        TMPL = """
+            accessor: in stuff
+                `in (\w+)`
+                    rx match
+                        set context
+
+            $ h1 | 0 text
+                in stuff
+                    | 1 ;               : value
+        """
+        tt = TakeTemplate(TMPL)
+        assert any(isinstance(node, _CustomAccessor) for node in all_nodes(tt.node))
+        assert assert_same_results(TMPL) == {'value': 'h1'}
+
+
+    def test_splice_merge_all(self):
+        TMPL = """
+            def: link info
+                | text ;                : text
+                | [href] ;              : url
+            $ a
+                save each               : links
+                    link info
+                        merge               : *
+                    | [href] ;              : url_again
+        """
+        tt = TakeTemplate(TMPL)
+        assert not any(isinstance(node, _DefSubroutine) for node in all_nodes(tt.node))
+        data = assert_same_results(TMPL)
+        assert data['links'][0] == {'text': 'first nav item',
+                                    'url': '/local/a',
+                                    'url_again': '/local/a'}
+
+
+    def test_no_splice_deep_names(self):
+        TMPL = """
+            def: simple
+                $ li
+                    | 0 text ;              : item.zero_tx
+            +                           : item
+                $ h1 | 0 text ;             : h1
+            simple
+                merge                   : *
+        """
+        tt = TakeTemplate(TMPL)
+        assert any(isinstance(node, _DefSubroutine) for node in all_nodes(tt.node))
+        # merge replaces the whole "item" namespace
+        assert assert_same_results(TMPL) == {'item': {'zero_tx': 'first nav item'}}
+
+
+    def test_no_splice_when_last_value_used(self):
+        TMPL = """
+            def: simple
+                $ li | 0 text ;         : value
+            simple
+                merge                   : *
+            save                    : ignored
+                | .value ;              : value_again
+        """
+        tt = TakeTemplate(TMPL)
+        assert any(isinstance(node, _DefSubroutine) for node in all_nodes(tt.node))
+        data = tt(html_fixture)
+        expect = TakeTemplate(TMPL, inline_subroutines=False)(html_fixture)
+        assert data.pop('ignored').html() == expect.pop('ignored').html()
+        assert data == expect
+        assert data['value_again'] == 'first nav item'
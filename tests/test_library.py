@@ -0,0 +1,169 @@
+import os
+import threading
+import pytest
+
+from take import TakeTemplate
+from take.exceptions import TakeSyntaxError
+from take.library import clear_cache
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+LIB = """
+def: nav links
+    $ nav a
+        save each                   : links
+            | [href] ;                  : url
+            | text ;                    : text
+
+accessor: first
+    | 0
+        set context
+"""
+
+
+@pytest.fixture
+def lib_dir(tmpdir):
+    clear_cache()
+    tmpdir.join('nav.take').write(LIB)
+    return tmpdir
+
+
+@pytest.mark.library
+class TestImport():
+
+    def test_import(self, lib_dir):
+        TMPL = """
+            import: nav.take
+            nav links ;         : nav
+            $ h1
+                first
+                    | text ;    : title
+        """
+        tt = TakeTemplate(TMPL, base_dir=str(lib_dir))
+        assert tt(html_fixture) == {
+            'nav': {
+                'links': [
+                    {'url': '/local/a', 'text': 'first nav item'},
+                    {'url': '/local/b', 'text': 'second nav item'}
+                ]
+            },
+            'title': 'Text in h1'
+        }
+
+
+    def test_shared_subroutines(self, lib_dir):
+        TMPL = """
+            import: nav.take
+            nav links ;         : nav
+        """
+        tmpl_path = lib_dir.join('page.take')
+        tmpl_path.write(TMPL)
+        one = TakeTemplate.from_file(str(tmpl_path))
+        two = TakeTemplate(TMPL, base_dir=str(lib_dir))
+        # the library is parsed once and its subroutine nodes are shared
+        assert one.node.nodes[0] is two.node.nodes[0]
+        assert one(html_fixture) == two(html_fixture)
+
+
+    def test_reload_changed(self, lib_dir):
+        TMPL = """
+            import: nav.take
+            nav links ;         : nav
+        """
+        first = TakeTemplate(TMPL, base_dir=str(lib_dir))
+        lib_path = lib_dir.join('nav.take')
+        lib_path.write(LIB.replace(': links', ': items'))
+        lib_path.setmtime(lib_path.mtime() + 10)
+        data = TakeTemplate(TMPL, base_dir=str(lib_dir))(html_fixture)
+        assert list(data['nav']) == ['items']
+        assert first.node.nodes[0] is not TakeTemplate(TMPL, base_dir=str(lib_dir)).node.nodes[0]
+
+
+    def test_nested_import(self, lib_dir):
+        lib_dir.join('more.take').write("""
+            import: nav.take
+            def: all nav
+                nav links ; merge   : *
+        """)
+        TMPL = """
+            import: more.take
+            all nav ;           : nav
+            $ h1
+                first
+                    | text ;    : title
+        """
+        data = TakeTemplate(TMPL, base_dir=str(lib_dir))(html_fixture)
+        assert len(data['nav']['links']) == 2
+        assert data['title'] == 'Text in h1'
+
+
+    def test_reload_changed_nested_import(self, lib_dir):
+        lib_dir.join('more.take').write("""
+            import: nav.take
+            def: all nav
+                nav links ; merge   : *
+        """)
+        tmpl_path = lib_dir.join('page.take')
+        tmpl_path.write("""
+            import: more.take
+            all nav ;           : nav
+        """)
+        assert list(TakeTemplate.from_file(str(tmpl_path))(html_fixture)['nav']) == ['links']
+        # the nested library's defs are inlined in the cached ones of the importing library
+        lib_path = lib_dir.join('nav.take')
+        lib_path.write(LIB.replace(': links', ': items'))
+        lib_path.setmtime(lib_path.mtime() + 10)
+        assert list(TakeTemplate.from_file(str(tmpl_path))(html_fixture)['nav']) == ['items']
+
+
+    def test_threads(self, lib_dir):
+        lib_dir.join('more.take').write("""
+            import: nav.take
+            def: all nav
+                nav links ; merge   : *
+        """)
+        TMPL = """
+            import: more.take
+            all nav ;           : nav
+        """
+        start = threading.Event()
+        errors = []
+        templates = []
+
+        def load():
+            start.wait()
+            try:
+                templates.append(TakeTemplate(TMPL, base_dir=str(lib_dir)))
+            except Exception as e:
+                errors.append(e)
+
+        for _ in range(5):
+            clear_cache()
+            threads = [threading.Thread(target=load) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+            start.clear()
+        assert errors == []
+        assert len(templates) == 40
+        assert all(len(tt(html_fixture)['nav']['links']) == 2 for tt in templates)
+
+
+    def test_invalid_libraries(self, lib_dir):
+        lib_dir.join('bad.take').write("""
+            $ h1 | 0 text ;     : title
+        """)
+        lib_dir.join('loop.take').write("""
+            import: loop.take
+        """)
+        with pytest.raises(TakeSyntaxError):
+            TakeTemplate('import: bad.take', base_dir=str(lib_dir))
+        with pytest.raises(TakeSyntaxError):
+            TakeTemplate('import: loop.take', base_dir=str(lib_dir))
+        with pytest.raises(TakeSyntaxError):
+            TakeTemplate('import: missing.take', base_dir=str(lib_dir))
@@ -0,0 +1,96 @@
+import os
+import sys
+import pytest
+
+from take import TakeTemplate
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+def nested_tmpl(depth):
+    lines = []
+    for i in range(depth):
+        lines.append('%s+   : n' % ('    ' * i))
+    return '\n'.join(lines) + '\n' + '    ' * depth + '$ h1 | 0 text ;  : title\n'
+
+
+@pytest.mark.nesting
+class TestNesting():
+
+    def test_deeper_than_recursion_limit(self):
+        depth = sys.getrecursionlimit() + 100
+        tt = TakeTemplate(nested_tmpl(depth))
+        assert tt.iterative
+        data = tt(html_fixture)
+        for _ in range(depth):
+            data = data['n']
+        assert data == {'title': 'Text in h1'}
+
+
+    def test_iterative_same_results(self):
+        TMPL = """
+            def: first li
+                $ li | 0 text ;         : text
+            accessor: second
+                | 1
+                    set context
+            $ nav a
+                save each               : links
+                    | [href] ;              : url
+                    +                       : info
+                        | text ;                : text
+            $ ul
+                first li ;              : first
+                $ li
+                    second
+                        | text ;            : second
+            $ h1 | 0 text
+                `(\w+) in`
+                    rx match
+                        | 1 ;               : rx
+        """
+        tt = TakeTemplate(TMPL, iterative=True)
+        assert not TakeTemplate(TMPL).iterative
+        data = tt(html_fixture)
+        assert data == TakeTemplate(TMPL)(html_fixture)
+        assert data['links'][1]['info']['text'] == 'second nav item'
+        assert data['rx'] == 'Text'
+
+
+@pytest.mark.nesting
+class TestDeepWalks():
+
+    def setup_method(self, method):
+        self.depth = sys.getrecursionlimit() + 100
+        self.src = nested_tmpl(self.depth)
+
+    def test_schema(self):
+        schema = TakeTemplate(self.src).schema()
+        for _ in range(self.depth):
+            schema = schema['n']
+        assert schema == {'title': 'scalar'}
+
+    def test_only(self):
+        tt = TakeTemplate(self.src)
+        data = tt(html_fixture, only=['n'])
+        for _ in range(self.depth):
+            data = data['n']
+        assert data == {'title': 'Text in h1'}
+
+    def test_take_lazy(self):
+        data = TakeTemplate(self.src).take_lazy(html_fixture)['n']
+        for _ in range(self.depth - 1):
+            data = data['n']
+        assert data == {'title': 'Text in h1'}
+
+    def test_records(self):
+        with pytest.raises(ValueError):
+            TakeTemplate(self.src, records=True)
+
+    def test_incremental_template(self):
+        from take.watch import IncrementalTemplate
+        it = IncrementalTemplate(self.src)
+        assert len(it.units) == 1
+        assert it.update(self.src + '$ h1 | 0 text ;  : other\n') == 1
@@ -0,0 +1,142 @@
+import os
+import sys
+import pytest
+
+from take import TakeTemplate
+from take import take_template
+from take.memo import SelectorMemo
+from take.parallel import gil_enabled, split_branches, run_branches, _runs
+from take.parser import ContextNode, QueryNode
+from take.schema import build_schema
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+# sibling namespaces whose keys are also saved by later top-level runs, which
+# have to be in the same branch, ex: "nav" and "nav.own"
+TMPL = """
+    $ h1 | 0 text ;                 : title
+    namespace: nav
+        $ nav a
+            save each               : links
+                | [href] ;              : url
+    namespace: content
+        $ section a
+            save each               : links
+                | text ;                : text
+    $ section
+        $ p | 0 text ;              : content.desc
+    $ article | 0 own_text ;        : nav.own
+    $ ul
+        save each                   : uls
+            | [title] ;                 : title
+    $ em | 0 text ;                 : em
+"""
+
+
+@pytest.fixture
+def free_threaded(monkeypatch):
+    # runs the parallel path on builds with the GIL too
+    monkeypatch.setattr(take_template, 'gil_enabled', lambda: False)
+
+
+@pytest.mark.parallel
+class TestBranches():
+
+    def test_runs(self):
+        tt = TakeTemplate(TMPL)
+        runs = _runs(tt.node.nodes)
+        assert all(isinstance(run[0], QueryNode) or not isinstance(run[-1], ContextNode)
+                   for run in runs)
+        assert [node for run in runs for node in run] == list(tt.node.nodes)
+
+
+    def test_split_branches(self):
+        tt = TakeTemplate(TMPL)
+        branches = split_branches(tt.node)
+        # the runs saving to "nav" and to "content" are grouped
+        assert [sorted(build_schema(b)) for b in branches] == [['title'], ['nav'], ['content'],
+                                                                ['uls'], ['em']]
+        assert [len(b.nodes) for b in branches] == [2, 3, 3, 2, 2]
+        rv = {}
+        for branch in branches:
+            branch.do(None, rv=rv, value=tt._make_doc((html_fixture,), {}))
+        assert rv == tt(html_fixture)
+
+
+    def test_run_branches(self):
+        tt = TakeTemplate(TMPL)
+        _doc = tt._make_doc((html_fixture,), {})
+        rv = run_branches(split_branches(tt.node), dict, _doc, lambda: None, 3)
+        assert rv == tt(html_fixture)
+
+
+    def test_overlapping_results(self):
+        # ex: keys merged from a value which aren't known until the template is run
+        first = TakeTemplate('$ h1 | 0 text ;     : title')
+        second = TakeTemplate('$ a | 0 text ;      : title')
+        _doc = first._make_doc((html_fixture,), {})
+        assert run_branches([first.node, second.node], dict, _doc, lambda: None, 2) is None
+
+
+    def test_gil_enabled(self, monkeypatch):
+        if not hasattr(sys, '_is_gil_enabled'):
+            assert gil_enabled()
+        monkeypatch.setattr(sys, '_is_gil_enabled', lambda: False, raising=False)
+        assert not gil_enabled()
+
+
+@pytest.mark.parallel
+class TestTakeParallel():
+
+    def test_serial_with_gil(self, monkeypatch):
+        monkeypatch.setattr(take_template, 'gil_enabled', lambda: True)
+        tt = TakeTemplate(TMPL)
+        assert tt(html_fixture, parallel=True) == tt(html_fixture)
+        assert not tt._branches
+
+
+    def test_parallel(self, free_threaded):
+        tt = TakeTemplate(TMPL)
+        assert tt(html_fixture, parallel=2) == tt(html_fixture)
+        assert tt(html_fixture, parallel=True, memo=True, index=True) == tt(html_fixture)
+        assert len(tt._branches[tt.node]) == 5
+        data = tt(html_fixture, parallel=True)
+        assert data['nav']['own'] == 'own text  more own text'
+        assert [link['url'] for link in data['nav']['links']] == ['/local/a', '/local/b']
+        assert sorted(data['content']) == ['desc', 'links']
+        only = tt(html_fixture, parallel=True, only=['title', 'content.desc'])
+        assert only == {'title': 'Text in h1', 'content': {'desc': 'some description'}}
+
+
+    def test_records(self, free_threaded):
+        tt = TakeTemplate(TMPL, records=True)
+        data = tt(html_fixture, parallel=True)
+        assert type(data) is tt._rv_type
+        assert data.to_dict() == TakeTemplate(TMPL)(html_fixture)
+
+
+    def test_memo_instance_serial(self, free_threaded):
+        tt = TakeTemplate(TMPL)
+        memo = SelectorMemo()
+        assert tt(html_fixture, parallel=True, memo=memo) == tt(html_fixture)
+        assert memo.misses
+        assert not tt._branches
+
+
+    def test_overlapping_serial(self, free_threaded):
+        src = """
+            def: info
+                $ a | 0 text ;      : title
+            accessor: get info
+                info
+                    set context
+            $ h1 | 0 text ;     : title
+            get info
+                merge           : *
+        """
+        tt = TakeTemplate(src)
+        assert tt(html_fixture, parallel=True) == tt(html_fixture)
+        assert tt(html_fixture, parallel=True)['title'] == 'first nav item'
@@ -0,0 +1,111 @@
+import os
+import pytest
+
+from take import TakeTemplate
+from take.directives import _ShrinkNode, _SaveEachValueNode, shrink_query
+from take.parser import ContextNode, QueryNode, text_query, make_css_query, make_attr_query
+from take.peephole import fuse_queries, shrunk_text_query
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+def all_nodes(ctx_node):
+    for node in ctx_node.nodes:
+        yield node
+        sub_ctx_node = node if isinstance(node, ContextNode) else getattr(node, 'sub_ctx_node', None)
+        if sub_ctx_node is not None:
+            for sub in all_nodes(sub_ctx_node):
+                yield sub
+
+
+def assert_same_results(tmpl, **kwargs):
+    data = TakeTemplate(tmpl)(html_fixture, **kwargs)
+    assert data == TakeTemplate(tmpl, peephole=False)(html_fixture, **kwargs)
+    return data
+
+
+@pytest.mark.peephole
+class TestPeephole():
+
+    def test_fuse_queries(self):
+        assert fuse_queries((text_query, shrink_query)) == (shrunk_text_query,)
+        css_query = make_css_query('a')
+        fused = fuse_queries((css_query, make_attr_query('href')))
+        assert len(fused) == 1
+        assert fused[0].selector == ('a', 0, 'href')
+        # the attribute accessor isn't after a CSS query
+        queries = (text_query, make_attr_query('href'))
+        assert fuse_queries(queries) == queries
+
+
+    def test_shrink(self):
+        TMPL = """
+            $ #text-with-newlines
+                | text ; shrink ;           : article
+                | own_text ; shrink ;       : article_own
+                $ em
+                    shrink ;                : em
+                | text
+                    shrink
+                        : shrunk
+                    : raw
+        """
+        tt = TakeTemplate(TMPL)
+        nodes = list(all_nodes(tt.node))
+        # only the shrink before the save of the raw value is left
+        assert sum(isinstance(node, _ShrinkNode) for node in nodes) == 1
+        assert any(isinstance(node, QueryNode) and node.queries == (shrunk_text_query,)
+                   for node in nodes)
+        data = assert_same_results(TMPL)
+        assert data['article'] == 'articles multiline text with a child em more article text'
+        assert data['article_own'] == 'articles multiline text more article text'
+        assert data['em'] == 'with a child em'
+
+
+    def test_css_attr(self):
+        TMPL = """
+            $ a | [href] ;                  : first
+            $ a | 1 [href] ;                : second
+            $ a | -1 [href] ;               : last
+            $ li | [title] ;                : none
+            $ ul
+                $ a | [href] ;              : in_ul
+            $ #second-ul li
+                save each                   : hrefs
+                    $ a | [href] ;              : href
+        """
+        data = assert_same_results(TMPL)
+        assert data['first'] == '/local/a'
+        assert data['second'] == '/local/b'
+        assert data['last'] == 'http://ext.com/b'
+        assert data['none'] is None
+        assert data['in_ul'] == '/local/a'
+        assert data['hrefs'] == [{'href': 'http://ext.com/a'}, {'href': 'http://ext.com/b'}]
+
+
+    def test_save_each_value(self):
+        TMPL = """
+            $ li
+                save each                   : items
+                    | text ; shrink
+                        : title
+                        : again
+            $ a
+                save each                   : links
+                    | [href]
+                        : url
+        """
+        tt = TakeTemplate(TMPL)
+        assert sum(isinstance(node, _SaveEachValueNode) for node in all_nodes(tt.node)) == 2
+        data = assert_same_results(TMPL)
+        assert data['items'][0] == {'title': 'first nav item', 'again': 'first nav item'}
+        assert data['links'][-1] == {'url': 'http://ext.com/b'}
+        assert assert_same_results(TMPL, memo=True) == data
+        assert TakeTemplate(TMPL, records=True)(html_fixture) == data
+        assert TakeTemplate(TMPL, iterative=True)(html_fixture) == data
+        assert tt(html_fixture, only=['items.title']) == {
+            'items': [{'title': item['title']} for item in data['items']]}
+        assert tt(html_fixture, only=['links.nothing']) == {
+            'links': [{} for _ in data['links']]}
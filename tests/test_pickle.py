@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import pickle
+import pytest
+
+from take import TakeTemplate, TemplateSet
+from take.directives import _DefSubroutine
+from take.parser import ContextNode
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+TMPL = """
+    def: link
+        | text ; shrink ;       : text
+        | [href] ;              : url
+    accessor: first a
+        $ a | 0
+            set context
+    $ h1 | 0 text ;             : title
+    $ nav a
+        save each               : links
+            link
+                merge           : *
+    $ nav a | 0
+        link
+            merge               : url
+    $ #second-ul a
+        save each               : content
+            link ;                  : link
+    $ ul
+        save each               : uls
+            first a ; | text ;      : first
+            | [title] ;             : title
+    namespace: ns
+        $ #not-all-own-text
+            | 0 own_text ;      : own
+            `(\w+) text`
+                rx match
+                    | 1 ;           : word
+        $ a | -1 [href] ;       : last.href
+"""
+
+
+def round_trip(obj):
+    return pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+def run_template(args):
+    tt, html = args
+    return tt(html)
+
+
+@pytest.mark.pickle
+class TestPickle():
+
+    @pytest.mark.parametrize('kwargs', [
+        {},
+        {'records': True},
+        {'iterative': True},
+        {'inline_subroutines': False, 'eliminate_dead_code': False, 'peephole': False},
+    ])
+    def test_round_trip(self, kwargs):
+        tt = TakeTemplate(TMPL, **kwargs)
+        data = tt(html_fixture)
+        unpickled = round_trip(tt)
+        assert unpickled(html_fixture) == data
+        assert unpickled(html_fixture, only=['ns.last']) == tt(html_fixture, only=['ns.last'])
+        assert unpickled.schema() == tt.schema()
+
+
+    def test_shared_subroutine(self):
+        tt = round_trip(TakeTemplate(TMPL, inline_subroutines=False))
+        defs = set()
+        pending = [tt.node]
+        while pending:
+            ctx_node = pending.pop()
+            for node in ctx_node.nodes:
+                if isinstance(node, _DefSubroutine):
+                    defs.add(id(node))
+                sub = node if isinstance(node, ContextNode) else getattr(node, 'sub_ctx_node', None)
+                if sub is not None:
+                    pending.append(sub)
+        # both call sites still share one subroutine
+        assert len(defs) == 1
+
+
+    def test_deep_template(self):
+        src = '$ div\n' + ''.join('    ' * i + '    namespace: n\n' for i in range(150))
+        src += '    ' * 151 + '$ h1 | 0 text ;      : title\n'
+        tt = TakeTemplate(src)
+        assert round_trip(tt)(html_fixture) == tt(html_fixture)
+
+
+    def test_not_pickling_results(self):
+        tt = TakeTemplate(TMPL)
+        size = len(pickle.dumps(tt, pickle.HIGHEST_PROTOCOL))
+        tt(html_fixture)
+        tt(html_fixture, only=['title'])
+        # the values of the last run and the pruned plans aren't pickled
+        assert len(pickle.dumps(tt, pickle.HIGHEST_PROTOCOL)) == size
+
+
+    def test_template_set(self):
+        tset = TemplateSet({'a': TMPL, 'b': '$ h1 | 0 text ;  : title'})
+        assert round_trip(tset)(html_fixture) == tset(html_fixture)
+
+
+    def test_pool(self):
+        tt = TakeTemplate(TMPL)
+        pool = multiprocessing.Pool(2)
+        try:
+            results = pool.map(run_template, [(tt, html_fixture)] * 2)
+        finally:
+            pool.terminate()
+            pool.join()
+        assert results == [tt(html_fixture)] * 2
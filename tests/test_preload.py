@@ -0,0 +1,81 @@
+import gc
+import os
+import pytest
+
+from take import TakeTemplate, preload
+from take.parser import ContextNode, QueryNode
+from take.preload import prepare_node
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+TMPL = """
+    $ h1 | 0 text ;             : title
+    $ nav a | 0 [href] ;        : url
+    $ ul
+        save each               : uls
+            $ a | -1 text ;         : last
+"""
+
+
+def _indexed_queries(ctx_node):
+    found = []
+    for node in ctx_node.nodes:
+        if isinstance(node, QueryNode):
+            found += [q for q in node.queries if hasattr(q, '_find_indexed')]
+        sub_ctx_node = node if isinstance(node, ContextNode) else getattr(node, 'sub_ctx_node', None)
+        if sub_ctx_node is not None:
+            found += _indexed_queries(sub_ctx_node)
+    return found
+
+
+@pytest.fixture
+def unfreeze():
+    yield
+    if hasattr(gc, 'unfreeze'):
+        gc.unfreeze()
+
+
+@pytest.mark.preload
+class TestPreload():
+
+    def test_prepare_node(self):
+        tt = TakeTemplate(TMPL)
+        queries = _indexed_queries(tt.node)
+        assert len(queries) == 3
+        assert not any(q._find_indexed.xpaths for q in queries)
+        prepare_node(tt.node)
+        # the XPaths for root and nested contexts
+        assert all(len(q._find_indexed.xpaths) == 2 for q in queries)
+        data = tt(html_fixture)
+        assert all(len(q._find_indexed.xpaths) == 2 for q in queries)
+        assert data == TakeTemplate(TMPL)(html_fixture)
+
+
+    def test_preload(self, tmpdir, unfreeze):
+        paths = []
+        for name in ('a', 'b'):
+            path = tmpdir.join(name + '.take')
+            path.write(TMPL)
+            paths.append(str(path))
+        templates = preload(paths)
+        assert list(templates) == paths
+        assert templates[paths[0]].iterative
+        assert templates[paths[1]](html_fixture) == TakeTemplate(TMPL)(html_fixture)
+        assert all(q._find_indexed.xpaths for q in _indexed_queries(templates[paths[0]].node))
+        if hasattr(gc, 'freeze'):
+            assert gc.get_freeze_count() > 0
+
+
+    def test_preload_no_freeze(self, tmpdir, unfreeze):
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        path = tmpdir.join('a.take')
+        path.write(TMPL)
+        templates = preload([str(path)], freeze_gc=False, records=True, iterative=False)
+        assert not templates[str(path)].iterative
+        assert templates[str(path)](html_fixture).to_dict() == TakeTemplate(TMPL)(html_fixture)
+        if hasattr(gc, 'get_freeze_count'):
+            assert gc.get_freeze_count() == 0
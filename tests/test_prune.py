@@ -0,0 +1,165 @@
+import os
+import warnings
+import pytest
+
+from take import TakeTemplate
+from take.exceptions import DeadCodeWarning
+from take.prune import request_tree
+from take.take_template import LazyResult
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+TMPL = """
+    def: link info
+        | text ;                        : text
+        | [href] ;                      : url
+
+    $ h1 | 0 text ;                     : title
+    $ h1 | 0 [id] ;                     : meta.id
+    $ #first-ul
+        | [title] ;                     : meta.title
+        $ a
+            save each                   : entries
+                | text ;                    : text
+                | [href] ;                  : url
+    +                                   : first
+        $ a | 0
+            link info
+                merge                   : url
+    $ a | -1
+        link info ;                     : last
+"""
+
+
+@pytest.mark.prune
+class TestOnly():
+
+    def test_request_tree(self):
+        assert request_tree(['a', 'b.c', 'b.d']) == {'a': None, 'b': {'c': None, 'd': None}}
+        assert request_tree(['a', 'a.b']) == {'a': None}
+        assert request_tree(['a.b', 'a']) == {'a': None}
+
+
+    def test_only_matches_full(self):
+        tt = TakeTemplate(TMPL)
+        full = tt(html_fixture)
+        assert tt(html_fixture, only=['title']) == {'title': full['title']}
+        assert tt(html_fixture, only=['meta']) == {'meta': full['meta']}
+        assert tt(html_fixture, only=['meta.id']) == {'meta': {'id': 'id-on-h1'}}
+        assert tt(html_fixture, only=['first.url', 'last']) == {
+            'first': full['first'],
+            'last': full['last']
+        }
+        assert tt(html_fixture, only=['entries.url']) == {
+            'entries': [{'url': '/local/a'}, {'url': '/local/b'}]
+        }
+        assert tt(html_fixture, only=['not_there']) == {}
+
+
+    def test_only_prunes_queries(self):
+        tt = TakeTemplate(TMPL)
+        node = tt._plan(['title'])
+        assert len(node.nodes) == 2
+        assert node is tt._plan(('title',))
+        # the sub-context of `$ #first-ul` is gone along with its query
+        node = tt._plan(['first'])
+        assert len(node.nodes) == 1
+
+
+    def test_only_with_records(self):
+        tt = TakeTemplate(TMPL, records=True)
+        data = tt(html_fixture, only=['entries.text'])
+        assert data == {'entries': [{'text': 'first nav item'},
+                                    {'text': 'second nav item'}]}
+
+
+@pytest.mark.prune
+class TestLazyResult():
+
+    def test_lazy_result(self):
+        tt = TakeTemplate(TMPL)
+        data = tt.take_lazy(html_fixture)
+        assert isinstance(data, LazyResult)
+        assert data['title'] == 'Text in h1'
+        assert data._data == {'title': 'Text in h1'}
+        assert data['meta'] == {'id': 'id-on-h1', 'title': 'nav ul title'}
+        assert data.get('not_there') == None
+        assert 'last' in data
+        assert dict(data) == tt(html_fixture)
+        assert len(data) == 5
+
+
+    def test_take_options(self):
+        tt = TakeTemplate(TMPL)
+        data = tt.take_lazy(html_fixture, only=['title', 'meta.id'], memo=True)
+        assert data['meta'] == {'id': 'id-on-h1'}
+        assert dict(data) == tt(html_fixture, only=['title', 'meta.id'])
+        for options in ({'index': True}, {'early': True}):
+            assert dict(tt.take_lazy(html_fixture, **options)) == tt(html_fixture)
+        with pytest.raises(ValueError):
+            tt.take_lazy(html_fixture, parallel=True)
+
+
+@pytest.mark.prune
+class TestDeadCodeElimination():
+
+    DEAD_TMPL = """
+        def: simple
+            $ li | 0 text ;                 : value
+            $ li | 1 text
+        $ h1 | 0 text ;                     : title
+        $ nav
+            $ ul | [id]
+            $ li
+                | text
+        simple
+        simple
+            | .value ;                      : simple_value
+        +                                   : empty
+            $ p
+    """
+
+    def test_removes_dead_queries(self):
+        with pytest.warns(DeadCodeWarning) as record:
+            tt = TakeTemplate(self.DEAD_TMPL)
+        assert 'lines: 4, 6, 7, 8, 9, 14' in str(record[0].message)
+        assert tt(html_fixture) == {
+            'title': 'Text in h1',
+            'simple_value': 'first nav item',
+            'empty': {}
+        }
+        # only `$ h1`, `+ : empty` and the second subroutine call with its sub-context
+        assert len(tt.node.nodes) == 5
+
+
+    def test_disable(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            tt = TakeTemplate(self.DEAD_TMPL, eliminate_dead_code=False)
+        assert len(tt.node.nodes) == 8
+        assert tt(html_fixture) == TakeTemplate(self.DEAD_TMPL)(html_fixture)
+
+
+    def test_keeps_used_queries(self):
+        TMPL = """
+            $ nav
+                $ a
+                    save each           : links
+                        | text ;            : text
+            accessor: li-0
+                $ li | 0
+                    set context
+            $ ul
+                li-0
+                    | text ;            : first
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            tt = TakeTemplate(TMPL)
+        assert tt(html_fixture) == {
+            'links': [{'text': 'first nav item'}, {'text': 'second nav item'}],
+            'first': 'first nav item'
+        }
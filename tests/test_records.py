@@ -0,0 +1,102 @@
+import os
+import pickle
+import pytest
+
+from take import TakeTemplate
+from take.records import Record, make_record_type
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+@pytest.mark.records
+class TestRecords():
+
+    def test_record_type(self):
+        Rec = make_record_type('Rec', ('a', 'not-an-ident'))
+        rec = Rec()
+        assert len(rec) == 0
+        assert 'a' not in rec
+        rec['not-an-ident'] = 1
+        rec['undeclared'] = 2
+        assert rec['not-an-ident'] == 1
+        assert rec.get('a') == None
+        assert rec.to_dict() == {'not-an-ident': 1, 'undeclared': 2}
+        with pytest.raises(KeyError):
+            rec['a']
+        assert not hasattr(rec, '__dict__')
+
+
+    def test_save_each_records(self):
+        TMPL = """
+            $ h1 | 0 text ;                 : title
+            $ nav a
+                save each                   : nav.items
+                    | [href] ;                  : url
+                    | text ;                    : item.text
+        """
+        expect = {
+            'title': 'Text in h1',
+            'nav': {
+                'items': [
+                    {'url': '/local/a', 'item': {'text': 'first nav item'}},
+                    {'url': '/local/b', 'item': {'text': 'second nav item'}}
+                ]
+            }
+        }
+        tt = TakeTemplate(TMPL, records=True)
+        data = tt(html_fixture)
+        assert isinstance(data, Record)
+        assert isinstance(data['nav'], Record)
+        assert isinstance(data['nav']['items'][0], Record)
+        assert isinstance(data['nav']['items'][0]['item'], Record)
+        assert data == expect
+        assert data.to_dict() == expect
+        assert type(data.to_dict()['nav']['items'][0]) is dict
+        assert data.to_dict() == TakeTemplate(TMPL)(html_fixture)
+
+
+    def test_namespace_records(self):
+        TMPL = """
+            +                       : links
+                $ a | 0 text ;          : first
+            +                       : links
+                $ a | 1 text ;          : second
+        """
+        tt = TakeTemplate(TMPL, records=True)
+        data = tt(html_fixture)
+        assert isinstance(data['links'], Record)
+        assert data['links']._fields == ('first', 'second')
+        assert data == {'links': {'first': 'first nav item',
+                                  'second': 'second nav item'}}
+
+
+    def test_def_merge_records(self):
+        TMPL = """
+            def: simple
+                $ li
+                    | 0 text ;      : zero_tx
+                    | 1 text ;      : item.one_tx
+            simple ;            : saved
+            simple ; merge      : *
+        """
+        tt = TakeTemplate(TMPL, records=True)
+        data = tt(html_fixture)
+        assert isinstance(data['saved'], Record)
+        # the keys merged from the def are declared on the top-level record
+        assert data._fields == ('saved', 'zero_tx', 'item')
+        assert data == {
+            'saved': {'zero_tx': 'first nav item',
+                      'item': {'one_tx': 'second nav item'}},
+            'zero_tx': 'first nav item',
+            'item': {'one_tx': 'second nav item'}
+        }
+
+
+    def test_pickle_records(self):
+        TMPL = """
+            $ a | 0 text ;          : first
+        """
+        data = TakeTemplate(TMPL, records=True)(html_fixture)
+        assert pickle.loads(pickle.dumps(data)) == {'first': 'first nav item'}
@@ -0,0 +1,94 @@
+import pytest
+
+from take import TakeTemplate
+from take.parser import parse
+from take.schema import SCALAR, merge_schemas, group_by_keys, keys_overlap
+
+
+@pytest.mark.schema
+class TestSchema():
+
+    def test_flat_schema(self):
+        TMPL = """
+            $ h1 | 0 text ;             : title
+            $ a | 0 [href] ;            : link.url
+        """
+        tt = TakeTemplate(TMPL)
+        assert tt.schema() == {'title': SCALAR, 'link': {'url': SCALAR}}
+
+
+    def test_save_each_and_namespace_schema(self):
+        TMPL = """
+            $ nav a
+                save each               : nav.items
+                    | [href] ;              : url
+                    | text ;                : text
+            +                           : meta
+                $ p | text ;                : desc
+            +                           : meta
+                $ h1 | text ;               : h1
+        """
+        tt = TakeTemplate(TMPL)
+        assert tt.schema() == {
+            'nav': {'items': [{'url': SCALAR, 'text': SCALAR}]},
+            'meta': {'desc': SCALAR, 'h1': SCALAR}
+        }
+
+
+    def test_rx_match_schema(self):
+        TMPL = """
+            $ h1 | 0 text
+                `in (\w+)`
+                    rx match
+                        | 1 ;                   : value
+        """
+        tt = TakeTemplate(TMPL)
+        assert tt.schema() == {'value': SCALAR}
+
+
+    def test_def_schema(self):
+        TMPL = """
+            def: link info
+                | text ;                : text
+                | [href] ;              : url
+                $ em ; +                : em
+                    | text ;                : text
+
+            $ a | 0
+                link info ;             : first
+                link info ; >>          : url
+                link info ; | .em ;     : em
+                link info
+                    merge               : *
+            $ a
+                save each               : links
+                    link info ;             : info
+        """
+        tt = TakeTemplate(TMPL)
+        info = {'text': SCALAR, 'url': SCALAR, 'em': {'text': SCALAR}}
+        assert tt.schema() == {
+            'first': info,
+            'url': SCALAR,
+            'em': {'text': SCALAR},
+            'text': SCALAR,
+            'links': [{'info': info}],
+        }
+
+
+    def test_merge_schemas(self):
+        assert merge_schemas(SCALAR, {'a': SCALAR}) == {'a': SCALAR}
+        assert merge_schemas([{'a': SCALAR}], [{'b': SCALAR}]) == [{'a': SCALAR, 'b': SCALAR}]
+        first = {'a': {'b': SCALAR}}
+        merged = merge_schemas(first, {'a': {'c': SCALAR}})
+        assert merged == {'a': {'b': SCALAR, 'c': SCALAR}}
+        assert first == {'a': {'b': SCALAR}}
+
+
+    def test_group_by_keys(self):
+        nodes = [parse(src) for src in ('$ h1 | 0 text ;   : a',
+                                        '$ p | 0 text ;    : b.c',
+                                        '$ h1 | 0 text ;   : d',
+                                        '$ p | 0 text ;    : b.e')]
+        assert group_by_keys(nodes) == [[0], [1, 3], [2]]
+        assert not keys_overlap([{'a': 1}, {'b': 2}])
+        assert keys_overlap([{'a': 1}, {'b': 2}, {'a': 3}])
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+import pytest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from take import TakeTemplate
+from take import stream
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+TMPL = """
+    $ h1 | 0 text ;             : title
+    $ nav a
+        save each               : links
+            | [href] ;              : url
+"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # set by the test, the first chunk is sent before waiting for `fed`
+    body = b''
+    fed = None
+    waited = None
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        half = len(self.body) // 2
+        for i, chunk in enumerate((self.body[:half], self.body[half:])):
+            if i and self.fed is not None:
+                # the client parses the first chunk before the rest is sent
+                self.server.fed_in_time = self.fed.wait(5)
+            for start in range(0, len(chunk), 512):
+                part = chunk[start:start + 512]
+                self.wfile.write(('%x\r\n' % len(part)).encode('ascii') + part + b'\r\n')
+                self.wfile.flush()
+                time.sleep(0.001)
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.fed_in_time = None
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    _Handler.body = b''
+    _Handler.fed = None
+
+
+def _url(httpd):
+    return 'http://127.0.0.1:%d/doc.html' % httpd.server_address[1]
+
+
+@pytest.mark.stream
+class TestTakeUrl():
+
+    def test_same_results(self, server):
+        _Handler.body = html_fixture.encode('utf-8')
+        tt = TakeTemplate(TMPL)
+        url = _url(server)
+        assert tt.take_url(url, chunk_size=256) == tt(html_fixture)
+        data = tt.take_url(url, base_url=url, only=['links'])
+        assert list(data) == ['links']
+        assert data['links'][0]['url'].startswith('http://127.0.0.1:')
+
+
+    def test_parses_while_downloading(self, server, monkeypatch):
+        fed = threading.Event()
+        _Handler.body = html_fixture.encode('utf-8')
+        _Handler.fed = fed
+        iter_response = stream.iter_response
+
+        def iter_and_signal(response, chunk_size):
+            for chunk in iter_response(response, chunk_size):
+                yield chunk
+                # the chunk was fed to the parser
+                fed.set()
+        monkeypatch.setattr(stream, 'iter_response', iter_and_signal)
+        tt = TakeTemplate(TMPL)
+        assert tt.take_url(_url(server), chunk_size=256) == tt(html_fixture)
+        assert server.fed_in_time
+
+
+    def test_empty_and_charset(self, server):
+        tt = TakeTemplate(TMPL)
+        assert tt.take_url(_url(server)) == tt('')
+        _Handler.body = u'<html><body><h1>caf\xe9</h1></body></html>'.encode('utf-8')
+        assert tt.take_url(_url(server))['title'] == u'caf\xe9'
+
+
+    def test_early_stop(self, server, monkeypatch):
+        _Handler.body = (b'<html><head><title>t</title></head><body>' +
+                         b'<p>filler</p>' * 100000 + b'</body></html>')
+        seen = []
+        iter_response = stream.iter_response
+
+        def counted(*args):
+            for chunk in iter_response(*args):
+                seen.append(len(chunk))
+                yield chunk
+        monkeypatch.setattr(stream, 'iter_response', counted)
+        tt = TakeTemplate('$ head title | 0 text ;    : title')
+        assert tt.take_url(_url(server)) == {'title': 't'}
+        # stopped reading after the first chunk
+        assert seen == [stream.FIRST_CHUNK_SIZE]
+
+
+    def test_parse_chunks(self):
+        roots = stream.parse_chunks([b'<html><bo', b'dy><p>te', b'xt</p></body></html>'])
+        assert roots[0].findtext('body/p') == 'text'
+        assert stream.parse_chunks([]) == []
@@ -0,0 +1,78 @@
+import os
+import threading
+import pytest
+
+from take import TakeTemplate
+from take.memo import SelectorMemo
+from take.take_template import parse_in_thread
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+TMPL = """
+    def: link
+        | text ; shrink ;       : text
+        | [href] ;              : url
+    $ h1 | 0 text ;             : title
+    $ nav a
+        save each               : links
+            link
+                merge           : *
+    $ ul
+        save each               : uls
+            $ a | -1 text ;         : last
+"""
+
+XML_DOC = '<root><h1>xml title</h1><nav><a href="/x">x</a></nav></root>'
+
+
+@pytest.mark.take_many
+class TestTakeMany():
+
+    def test_same_results(self):
+        tt = TakeTemplate(TMPL)
+        docs = [html_fixture, XML_DOC, html_fixture.encode('utf-8')] * 4
+        assert tt.take_many(docs, threads=3) == [tt(doc) for doc in docs]
+
+
+    def test_parse_in_thread(self):
+        # each thread parses with its own HTML parser
+        parsers = []
+
+        def parse():
+            parse_in_thread('<p>not xml')
+            from take.take_template import _thread_parsers
+            parsers.append(_thread_parsers.html)
+        threads = [threading.Thread(target=parse) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert parsers[0] is not parsers[1]
+        assert parse_in_thread(XML_DOC)[0].tag == 'root'
+
+
+    def test_kwargs(self):
+        tt = TakeTemplate(TMPL, records=True)
+        data = tt.take_many([html_fixture] * 2, threads=2, only=['title'], memo=True,
+                            base_url='http://www.example.com')
+        assert [d.to_dict() for d in data] == [{'title': 'Text in h1'}] * 2
+        data = tt.take_many([html_fixture], base_url='http://www.example.com')[0].to_dict()
+        assert data['links'][0]['url'].startswith('http://www.example.com/')
+        with pytest.raises(ValueError):
+            tt.take_many([html_fixture], memo=SelectorMemo())
+
+
+    def test_take_options(self):
+        tt = TakeTemplate(TMPL)
+        for options in ({'early': True}, {'index': True}, {'parallel': True}):
+            assert tt.take_many([html_fixture] * 2, threads=2, **options) == \
+                [tt(html_fixture)] * 2
+
+
+    def test_iterative_template(self):
+        tt = TakeTemplate(TMPL, iterative=False)
+        assert not tt.iterative
+        assert tt.take_many([html_fixture], threads=1) == [tt(html_fixture)]
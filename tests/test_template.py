@@ -4,9 +4,12 @@ import pytest
 from pyquery import PyQuery
 
 from take import TakeTemplate
-from take.parser import InvalidDirectiveError, UnexpectedTokenError, TakeSyntaxError
+from take.parser import InvalidDirectiveError, UnexpectedTokenError, TakeSyntaxError, \
+     make_css_query, make_css_index_query, make_index_query
 from take.scanner import ScanError
 
+from old_pyquery import OldPyQuery
+
 here = os.path.dirname(os.path.abspath(__file__))
 with open(here + '/doc.html') as f:
     html_fixture = f.read()
@@ -694,3 +697,51 @@ class TestRegexpQuery():
             }
         ]
         assert data['urls'] == expect
+
+
+@pytest.mark.first_match
+class TestFirstMatchQuery():
+
+    SELECTORS = ('a', 'li a', 'ul > li a', 'li + li a', 'h1 ~ section li', 'h1, li a',
+                 'section a', 'div', 'li:first a', 'article em', 'ul[id] a', 'table')
+    INDEXES = ('0', '1', '-1', '-2', '5', '-9')
+
+    def _all_matches(self, selector, index, value):
+        # the CSS query and index accessor as separate queries
+        return make_index_query(index)(make_css_query(selector)(value))
+
+
+    def test_same_as_all_matches(self):
+        doc = PyQuery(html_fixture)
+        nav = doc('nav')
+        section = PyQuery(doc('section')[0])
+        for selector in self.SELECTORS:
+            for index in self.INDEXES:
+                query = make_css_index_query(selector, index)
+                for value in (doc, nav, section, doc('li')):
+                    assert list(query(value)) == list(self._all_matches(selector, index, value))
+
+
+    def test_old_pyquery(self):
+        doc = OldPyQuery(html_fixture)
+        for value in (doc, OldPyQuery(doc[0].find('nav'))):
+            found = make_css_index_query('li a', '1')(value)
+            assert isinstance(found, OldPyQuery)
+            assert found.text() == 'second nav item'
+
+
+    def test_template(self):
+        TMPL = """
+            $ li a | 0 text ;               : first
+            $ li a | -1 text ;              : last
+            $ h1, li a | 1 text ;           : second
+            $ section
+                $ li a | -2 [href] ;            : href
+        """
+        tt = TakeTemplate(TMPL)
+        assert tt(html_fixture) == {
+            'first': 'first nav item',
+            'last': 'second content link',
+            'second': 'first nav item',
+            'href': 'http://ext.com/a',
+        }
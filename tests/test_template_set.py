@@ -0,0 +1,245 @@
+import os
+import pytest
+
+from take import TakeTemplate, TemplateSet
+from pyquery import PyQuery
+
+from take.memo import SelectorMemo, ElementIndex
+from take.parser import make_css_query, make_css_index_query, make_css_attr_query
+
+from old_pyquery import OldPyQuery
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+NAV_TMPL = """
+    $ nav a
+        save each           : links
+            | [href] ;          : url
+"""
+
+TITLE_TMPL = """
+    $ h1 | 0 text ;         : title
+    $ nav a | 0 text ;      : first_nav
+"""
+
+
+@pytest.mark.template_set
+class TestTemplateSet():
+
+    def test_template_set(self):
+        tset = TemplateSet([('nav', NAV_TMPL), ('title', TakeTemplate(TITLE_TMPL))])
+        data = tset(html_fixture)
+        assert data == {
+            'nav': TakeTemplate(NAV_TMPL)(html_fixture),
+            'title': TakeTemplate(TITLE_TMPL)(html_fixture)
+        }
+
+
+    def test_base_url(self):
+        tset = TemplateSet({'nav': NAV_TMPL}, base_url='http://www.example.com')
+        data = tset(html_fixture)
+        assert data['nav']['links'][0]['url'] == 'http://www.example.com/local/a'
+        data = tset(html_fixture, base_url='http://other.com')
+        assert data['nav']['links'][0]['url'] == 'http://other.com/local/a'
+
+
+    def test_template_base_url(self):
+        nav = TakeTemplate(NAV_TMPL, base_url='http://www.example.com')
+        tset = TemplateSet({'nav': nav, 'title': TITLE_TMPL})
+        assert tset.base_url == 'http://www.example.com'
+        assert tset(html_fixture)['nav'] == nav(html_fixture)
+        with pytest.raises(ValueError):
+            TemplateSet({'nav': nav}, base_url='http://other.com')
+        other = TakeTemplate(TITLE_TMPL, base_url='http://other.com')
+        with pytest.raises(ValueError):
+            TemplateSet({'nav': nav, 'title': other})
+
+
+    def test_only(self):
+        tset = TemplateSet({'nav': NAV_TMPL, 'title': TITLE_TMPL})
+        data = tset(html_fixture, only=['title'])
+        assert data == {'nav': {}, 'title': {'title': 'Text in h1'}}
+        assert tset(html_fixture, only=['links']) == {
+            'nav': TakeTemplate(NAV_TMPL)(html_fixture),
+            'title': {},
+        }
+
+
+    def test_early(self):
+        page = (u'<html><head><title>Doc</title></head><body>%s%s</body></html>' %
+                (html_fixture, u'<p>filler</p>' * 1000))
+        tset = TemplateSet({'h1': '$ h1 | 0 text ; : h1',
+                            'head': '$ head title | 0 text ; : title'})
+        assert tset(page, early=True) == tset(page) == {
+            'h1': {'h1': 'Text in h1'},
+            'head': {'title': 'Doc'},
+        }
+        # the region is the one of all the templates
+        assert tset._plan(None)[1] is not None
+        assert TemplateSet({'nav': NAV_TMPL, 'title': TITLE_TMPL})._plan(None)[1] is None
+
+
+    def test_events(self):
+        page = (u'<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>%s</body></html>'
+                % html_fixture)
+        tset = TemplateSet({'nav': NAV_TMPL, 'title': TITLE_TMPL})
+        expected = tset(page, events=False)
+        assert tset(page) == tset(page, events=True) == expected
+        assert expected['nav'] == TakeTemplate(NAV_TMPL)(page)
+        # only the indexed matches of the title template are needed
+        assert not tset._plan(None)[2].stops
+        assert tset._plan(['title'])[2].stops
+        assert tset(page, only=['title']) == {'nav': {}, 'title': {'title': 'Text in h1'}}
+
+
+    def test_unsupported_options(self):
+        tset = TemplateSet({'nav': NAV_TMPL})
+        with pytest.raises(TypeError) as e:
+            tset(html_fixture, parallel=True)
+        assert 'parallel' in str(e.value)
+
+
+    def test_selector_memo(self):
+        calls = []
+        query = make_css_query('a')
+        def counted(value):
+            calls.append(value)
+            return query(value)
+        counted.selector = query.selector
+        memo = SelectorMemo()
+        tt = TakeTemplate('$ nav ;  : nav')
+        nav = tt(html_fixture)['nav']
+        first = memo.query(counted, nav)
+        assert memo.query(counted, nav) is first
+        # the same elements, as an lxml element
+        assert memo.query(counted, nav[0]) is first
+        assert len(calls) == 1
+        memo.query(counted, first)
+        assert len(calls) == 2
+
+
+@pytest.mark.memo
+class TestSelectorMemo():
+
+    TMPL = """
+        def: first link
+            $ a | 0 text ;          : text
+        $ nav
+            first link ;            : nav_link
+            $ a | 1 text ;          : second
+        $ nav
+            first link ;            : again
+    """
+
+    def test_memo_stats(self):
+        tt = TakeTemplate(self.TMPL, inline_subroutines=False)
+        memo = SelectorMemo()
+        data = tt(html_fixture, memo=memo)
+        assert data == tt(html_fixture)
+        assert data == tt(html_fixture, memo=True)
+        # `$ nav`, `$ a | 0` and `$ a | 1` on the nav element are each evaluated
+        # once, the second `$ nav` and `$ a | 0` use the cached results
+        assert memo.misses == 3
+        assert memo.hits == 2
+        assert memo.stats() == {'hits': 2, 'misses': 3, 'hit_rate': 0.4, 'size': 3}
+        memo.clear()
+        assert memo.stats()['size'] == 0
+
+
+    def test_memo_none_results(self):
+        # a missing attribute is cached like any other result
+        tt = TakeTemplate("""
+            $ a | 0 [nope] ;        : one
+            $ a | 0 [nope] ;        : two
+            $ a | 0 [nope] ;        : three
+        """)
+        memo = SelectorMemo()
+        assert tt(html_fixture, memo=memo) == {'one': None, 'two': None, 'three': None}
+        assert (memo.hits, memo.misses) == (2, 1)
+
+
+    def test_template_set_memo(self):
+        memo = SelectorMemo()
+        TemplateSet({'a': TITLE_TMPL, 'b': TITLE_TMPL})(html_fixture, memo=memo)
+        assert memo.hits == memo.misses == 2
+
+
+@pytest.mark.memo
+class TestElementIndex():
+
+    SELECTORS = ('a', '#first-ul', '.missing', 'ul#second-ul', 'em', '*', 'DIV', 'li.x',
+                 'nav a', 'ul > li', '[href]', 'article#not-all-own-text')
+
+    def test_same_results(self):
+        doc = PyQuery(html_fixture.replace('<li>', '<li class="x\t y">', 1)
+                                  .replace('<nav>', '<nav><!-- comment -->'))
+        index = ElementIndex()
+        for selector in self.SELECTORS + ('.x', 'li.x.x', '.x.y'):
+            queries = [make_css_query(selector), make_css_attr_query(selector, '0', 'href')]
+            for i in ('0', '1', '-1', '-2', '-9'):
+                queries.append(make_css_index_query(selector, i))
+            for query in queries:
+                expected = query(doc)
+                for value in (doc, doc[0]):
+                    result = index.query(query, value)
+                    if isinstance(expected, PyQuery):
+                        assert list(result) == list(expected)
+                    else:
+                        assert result == expected
+        assert index.walks == 1
+        assert index.index_hits > 0
+
+
+    def test_old_pyquery(self):
+        doc = OldPyQuery(html_fixture)
+        index = ElementIndex()
+        # the first query walks the tree, with PyQuery's own queries
+        index.query(make_css_query('em'), PyQuery(doc[0]))
+        query = make_css_query('li')
+        result = index.query(query, doc)
+        assert index.index_hits == 1
+        assert isinstance(result, OldPyQuery)
+        assert list(result) == list(query(PyQuery(doc[0])))
+
+
+    def test_not_root(self):
+        doc = PyQuery(html_fixture)
+        index = ElementIndex()
+        nav = doc('nav')
+        query = make_css_query('a')
+        assert list(index.query(query, nav)) == list(query(nav))
+        assert index.query(query, nav) is index.query(query, nav)
+        assert index.walks == 0
+        assert index.hits == 2
+
+
+    def test_template(self):
+        TMPL = """
+            $ h1 | 0 text ;             : title
+            $ #first-ul a
+                save each               : nav
+                    | [href] ;              : url
+            $ ul | -1 [title] ;         : ul_title
+            $ em
+                save each               : ems
+                    | text ;                : text
+        """
+        tt = TakeTemplate(TMPL)
+        index = ElementIndex()
+        data = tt(html_fixture, memo=index)
+        assert data == tt(html_fixture)
+        assert data == tt(html_fixture, index=True)
+        # `h1` is timed walking the tree, `ul` and `em` use the index and
+        # `#first-ul a` isn't a simple selector
+        assert index.walks == 1
+        assert index.index_hits == 2
+        assert index.misses == 1
+        stats = index.stats()
+        assert stats['index_hits'] == 2
+        assert stats['paid_off'] == (stats['saved_seconds'] > 0)
+        assert TemplateSet({'t': tt})(html_fixture, index=True) == {'t': data}
+        with pytest.raises(ValueError):
+            tt(html_fixture, memo=SelectorMemo(), index=True)
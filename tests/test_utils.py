@@ -0,0 +1,43 @@
+import pytest
+
+from take.records import make_record_type
+from take.utils import get_via_name_list, save_to_name_list, make_getter, make_setter
+
+
+NAMES = [('a',), ('a', 'b'), ('a', 'b', 'c'), ('a', 'b', 'c', 'd')]
+
+
+@pytest.mark.utils
+class TestNameAccessors():
+
+    @pytest.mark.parametrize('name_parts', NAMES)
+    def test_setter_matches_save_to_name_list(self, name_parts):
+        expect = {'other': 1}
+        save_to_name_list(expect, name_parts, 'value')
+        dest = {'other': 1}
+        make_setter(name_parts)(dest, 'value')
+        assert dest == expect
+
+
+    @pytest.mark.parametrize('name_parts', NAMES + [('x',), ('a', 'x'), ('x', 'y', 'z')])
+    def test_getter_matches_get_via_name_list(self, name_parts):
+        src = {}
+        save_to_name_list(src, NAMES[-1], 'value')
+        assert make_getter(name_parts)(src) == get_via_name_list(src, name_parts)
+
+
+    def test_setter_reuses_existing(self):
+        dest = {}
+        make_setter(('a', 'b'))(dest, 1)
+        make_setter(('a', 'c'))(dest, 2)
+        make_setter(('a', 'd', 'e'))(dest, 3)
+        assert dest == {'a': {'b': 1, 'c': 2, 'd': {'e': 3}}}
+
+
+    def test_setter_makes_child_records(self):
+        Child = make_record_type('Child', ('b',))
+        Parent = make_record_type('Parent', ('a',), {'a': Child})
+        dest = Parent()
+        make_setter(('a', 'b'))(dest, 1)
+        assert isinstance(dest['a'], Child)
+        assert dest == {'a': {'b': 1}}
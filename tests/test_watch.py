@@ -0,0 +1,102 @@
+import os
+import pytest
+
+from take import TakeTemplate
+from take.take_template import make_doc
+from take.watch import split_blocks, IncrementalTemplate, Watcher
+
+here = os.path.dirname(os.path.abspath(__file__))
+with open(here + '/doc.html') as f:
+    html_fixture = f.read()
+
+
+TMPL = """
+    # nav
+    def: link
+        | text ;            : text
+    $ h1 | 0 text ;         : title
+    $ nav a
+        save each           : links
+            link
+                merge           : *
+    +                       : ns
+        $ a | 0 text ;          : first
+"""
+
+
+@pytest.mark.watch
+class TestIncrementalTemplate():
+
+    def test_split_blocks(self):
+        blocks = split_blocks(TMPL)
+        assert len(blocks) == 4
+        assert blocks[0].startswith('\n    # nav\n    def: link')
+        assert ''.join(blocks) == TMPL
+
+
+    def test_update(self):
+        it = IncrementalTemplate(TMPL)
+        assert it.parsed == 4
+        assert len(it.units) == 3
+        # the units give the same results as the whole template
+        rv = {}
+        for _, unit in it.units:
+            unit.do(None, rv=rv, value=make_doc((html_fixture,), {}))
+        assert rv == TakeTemplate(TMPL)(html_fixture)
+        keys = [key for key, _ in it.units]
+        edited = TMPL.replace(': title', ': heading')
+        assert it.update(edited) == 1
+        assert [key for key, _ in it.units][1:] == keys[1:]
+        # the blocks calling a changed def are parsed again
+        assert it.update(edited.replace('| text ;', '| [href] ;')) == 2
+
+
+    def test_units_merged_by_key(self):
+        it = IncrementalTemplate("""
+            +                   : ns
+                $ a | 0 text ;      : first
+            $ h1 | 0 text ;     : title
+            +                   : ns
+                $ a | 1 text ;      : second
+        """)
+        assert len(it.units) == 2
+
+
+@pytest.mark.watch
+class TestWatcher():
+
+    def test_check(self, tmpdir):
+        path = tmpdir.join('page.take')
+        path.write(TMPL)
+        watcher = Watcher(str(path), {'doc': html_fixture})
+        results = watcher.check()
+        assert results == {'doc': TakeTemplate(TMPL)(html_fixture)}
+        assert watcher.ran == 3
+        assert watcher.check() is None
+        edited = TMPL.replace(': first', ': first_link')
+        path.write(edited)
+        path.setmtime(path.mtime() + 10)
+        results = watcher.check()
+        assert watcher.ran == 1
+        assert results == {'doc': TakeTemplate(edited)(html_fixture)}
+
+
+    def test_overlapping_results(self, tmpdir):
+        # the keys merged from an accessor's value aren't known until the template is run
+        src = """
+            def: info
+                $ a | 0 text ;      : title
+            accessor: get info
+                info
+                    set context
+            $ h1 | 0 text ;     : title
+            get info
+                merge           : *
+        """
+        path = tmpdir.join('page.take')
+        path.write(src)
+        watcher = Watcher(str(path), {'doc': html_fixture})
+        results = watcher.check()
+        assert len(watcher.template.units) == 1
+        assert results == {'doc': TakeTemplate(src)(html_fixture)}
+        assert results['doc']['title'] == 'first nav item'